@@ -1,8 +1,7 @@
 import frappe
+from terracloud_m365_import.terracloud_m365_import.doctype.terracloud_import.terracloud_import import process_import
 
 @frappe.whitelist()
 def start_import(terracloud_import_id):
-    frappe.enqueue(
-        'terracloud_m365_import.terracloud_m365_import.doctype.terracloud_import.terracloud_import.process_import',
-        terracloud_import_id=terracloud_import_id
-    )
+    # process_import plant und startet die Hintergrund-Jobs selbst
+    process_import(terracloud_import_id)
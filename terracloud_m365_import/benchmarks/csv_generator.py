@@ -0,0 +1,65 @@
+import csv
+import random
+from datetime import date, datetime, time, timedelta
+
+# Spalten, die der Import aus dem TerraCloud-Export liest
+COLUMNS = ['CustomID', 'Bestellnummer', 'Artikelnummer', 'Menge', 'MicrosoftSubscriptionStartDate', 'Preistyp']
+
+# Präfixe der erzeugten Stammdaten, damit sie sich wieder entfernen lassen
+CUSTOMER_PREFIX = 'BENCH-K'
+ARTICLE_PREFIX = 'BENCH-A'
+ORDER_PREFIX = 'BENCH-B'
+
+def get_customer_nos(customers: int) -> list[str]:
+    '''Gibt die Kundennummern der synthetischen Kunden zurück.'''
+    return [f'{CUSTOMER_PREFIX}{index:05d}' for index in range(1, customers + 1)]
+
+def get_article_nos(articles: int) -> list[str]:
+    '''Gibt die Artikelnummern der synthetischen Artikel zurück.'''
+    return [f'{ARTICLE_PREFIX}{index:03d}' for index in range(1, articles + 1)]
+
+def generate_terracloud_csv(
+    file_path: str,
+    rows: int,
+    customers: int = 100,
+    articles: int = 20,
+    yearly_share: float = 0.2,
+    max_backdated_months: int = 6,
+    reference_date: date = None,
+    seed: int = 0
+) -> None:
+    '''
+    Erzeugt eine synthetische TerraCloud-CSV-Datei wie im echten Export:
+    latin-1 kodiert, ';' als Trennzeichen und die Spaltennamen des Exports.
+    Die Zeilen werden direkt in die Datei geschrieben, sodass auch große Dateien wenig Speicher benötigen.
+
+    Args:
+        file_path (str): Der Pfad der zu erzeugenden Datei.
+        rows (int): Die Anzahl der Bestellungen.
+        customers (int): Die Anzahl der Kunden, auf die die Bestellungen verteilt werden.
+        articles (int): Die Anzahl der verschiedenen Artikel.
+        yearly_share (float): Der Anteil jährlich abgerechneter Bestellungen (0 bis 1).
+        max_backdated_months (int): Wie viele Monate das Startdatum höchstens zurückliegt.
+        reference_date (date): Das Datum, von dem aus zurückgerechnet wird. Standard: heute.
+        seed (int): Startwert des Zufallsgenerators, damit Läufe vergleichbar sind.
+    '''
+    randomizer = random.Random(seed)
+    reference_date = reference_date or date.today()
+    customer_nos = get_customer_nos(customers)
+    article_nos = get_article_nos(articles)
+
+    with open(file_path, mode='w', encoding='latin-1', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=';')
+        writer.writerow(COLUMNS)
+
+        for index in range(1, rows + 1):
+            start_date = reference_date - timedelta(days=randomizer.randint(0, max_backdated_months * 30))
+            start_time = time(randomizer.randint(0, 23), randomizer.randint(0, 59), randomizer.randint(0, 59))
+            writer.writerow([
+                randomizer.choice(customer_nos),
+                f'{ORDER_PREFIX}{index:08d}',
+                randomizer.choice(article_nos),
+                randomizer.randint(1, 50),
+                datetime.combine(start_date, start_time).strftime('%d.%m.%Y %H:%M:%S'),
+                '5' if randomizer.random() < yearly_share else '1'
+            ])
@@ -0,0 +1,249 @@
+"""
+End-to-End-Benchmark des Terracloud-Imports.
+
+Erzeugt synthetische TerraCloud-CSV-Dateien, importiert sie auf einer lokalen Test-Site
+und misst den Durchsatz jeder Stufe der Import-Pipeline.
+
+Aufruf (nur auf Test-Sites mit 'allow_tests'):
+    bench --site test_site execute terracloud_m365_import.benchmarks.import_benchmark.run
+    bench --site test_site execute terracloud_m365_import.benchmarks.import_benchmark.run \
+        --kwargs "{'sizes': [1000, 10000], 'baseline': 'benchmark_baseline.json'}"
+"""
+
+import frappe
+import json
+import os
+import tempfile
+import time
+from terracloud_m365_import.benchmarks.csv_generator import (
+    generate_terracloud_csv, get_customer_nos, get_article_nos, CUSTOMER_PREFIX, ORDER_PREFIX
+)
+from terracloud_m365_import.data.order_importer import OrderImporter
+
+
+SIZES = (1_000, 10_000, 100_000)
+STAGES = ('parse', 'skip_existing', 'validate', 'filter_new', 'plans', 'subscriptions', 'invoices')
+
+def run(
+    sizes: list[int] = SIZES,
+    customers_per_1000_rows: int = 20,
+    yearly_share: float = 0.2,
+    max_backdated_months: int = 6,
+    output: str = None,
+    baseline: str = None,
+    tolerance: float = 0.2,
+    cleanup_after: bool = True
+) -> dict:
+    '''
+    Führt den Benchmark für alle Dateigrößen aus.
+
+    Args:
+        sizes (list[int]): Die Anzahl der CSV-Zeilen je Lauf.
+        customers_per_1000_rows (int): Anzahl der Kunden je 1000 Zeilen.
+        yearly_share (float): Anteil der jährlich abgerechneten Bestellungen.
+        max_backdated_months (int): Wie viele Monate die Startdaten höchstens zurückliegen.
+        output (str): Optional: Pfad, unter dem die Ergebnisse als JSON gespeichert werden.
+        baseline (str): Optional: JSON-Datei eines früheren Laufs, gegen die verglichen wird.
+        tolerance (float): Erlaubter Rückgang des Durchsatzes gegenüber der Baseline (0.2 = 20 %).
+        cleanup_after (bool): Ob die erzeugten Daten nach jedem Lauf gelöscht werden.
+
+    Returns:
+        dict: Die Ergebnisse je Dateigröße.
+
+    Raises:
+        AssertionError: Falls eine Stufe langsamer ist als die Baseline erlaubt.
+    '''
+    if not frappe.conf.allow_tests:
+        frappe.throw('Der Benchmark darf nur auf Test-Sites mit allow_tests ausgeführt werden.')
+
+    results = {}
+    for size in sizes:
+        customers = max(1, size * customers_per_1000_rows // 1000)
+        setup_master_data(customers)
+        results[str(size)] = run_single(size, customers, yearly_share, max_backdated_months)
+        if cleanup_after:
+            cleanup()
+
+    print_report(results)
+
+    if output:
+        with open(output, mode='w') as file:
+            json.dump(results, file, indent=1)
+
+    if baseline:
+        with open(baseline) as file:
+            compare_with_baseline(results, json.load(file), tolerance)
+
+    return results
+
+def run_single(rows: int, customers: int, yearly_share: float, max_backdated_months: int) -> dict:
+    '''
+    Erzeugt eine CSV-Datei, importiert sie und gibt die Messwerte zurück.
+
+    Args:
+        rows (int): Die Anzahl der Zeilen.
+        customers (int): Die Anzahl der Kunden.
+        yearly_share (float): Anteil der jährlich abgerechneten Bestellungen.
+        max_backdated_months (int): Wie viele Monate die Startdaten höchstens zurückliegen.
+
+    Returns:
+        dict: Gesamtlaufzeit und Messwerte je Stufe.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, f'terracloud_benchmark_{rows}.csv')
+        generate_terracloud_csv(file_path, rows, customers=customers, yearly_share=yearly_share,
+                                max_backdated_months=max_backdated_months, seed=rows)
+        with open(file_path, mode='rb') as file:
+            file_doc = frappe.get_doc({
+                'doctype': 'File',
+                'file_name': os.path.basename(file_path),
+                'is_private': 1,
+                'content': file.read()
+            }).insert(ignore_permissions=True)
+
+    terracloud_import = frappe.get_doc({'doctype': 'Terracloud Import', 'csv_file': file_doc.file_url}).insert()
+    frappe.db.commit()
+
+    settings = frappe.get_single('Terracloud Import Settings')
+    importer = OrderImporter(terracloud_import, settings)
+
+    start = time.perf_counter()
+    importer.start_import()
+    total_time = time.perf_counter() - start
+
+    return {
+        'rows': rows,
+        'customers': customers,
+        'total_time': round(total_time, 3),
+        'throughput': round(rows / total_time, 1) if total_time else 0.0,
+        'stages': importer.metrics.as_dict()
+    }
+
+def setup_master_data(customers: int, articles: int = 20) -> None:
+    '''
+    Legt die synthetischen Kunden, Artikel und Preise an, sofern sie noch nicht existieren.
+
+    Args:
+        customers (int): Die Anzahl der Kunden.
+        articles (int): Die Anzahl der Artikel.
+    '''
+    price_list = frappe.db.get_single_value('Terracloud Import Settings', 'price_list')
+    customer_group = frappe.db.get_value('Customer Group', {'is_group': 0})
+    territory = frappe.db.get_value('Territory', {'is_group': 0})
+    item_group = frappe.db.get_value('Item Group', {'is_group': 0})
+
+    for customer_no in get_customer_nos(customers):
+        if not frappe.db.exists('Customer', customer_no):
+            frappe.get_doc({
+                'doctype': 'Customer',
+                'name': customer_no,
+                'customer_name': f'Benchmark {customer_no}',
+                'customer_group': customer_group,
+                'territory': territory
+            }).insert(set_name=customer_no)
+
+    for index, article_no in enumerate(get_article_nos(articles), start=1):
+        if not frappe.db.exists('Item', article_no):
+            frappe.get_doc({
+                'doctype': 'Item',
+                'item_code': article_no,
+                'item_name': f'Benchmark {article_no}',
+                'item_group': item_group,
+                'stock_uom': 'Nos',
+                'is_stock_item': 0
+            }).insert()
+        if not frappe.db.exists('Item Price', {'item_code': article_no, 'price_list': price_list}):
+            frappe.get_doc({
+                'doctype': 'Item Price',
+                'item_code': article_no,
+                'price_list': price_list,
+                'price_list_rate': index * 1.5,
+                'valid_from': '2000-01-01',
+                'valid_upto': '2099-12-31'
+            }).insert()
+
+    frappe.db.commit()
+
+def cleanup() -> None:
+    '''
+    Löscht alle Rechnungen, vorgemerkten Rechnungen, Subscriptions, Subscription Plans, Importe
+    und CSV-Dateien, die der Benchmark erzeugt hat.
+    Kunden, Artikel und Preise bleiben für weitere Läufe erhalten.
+    '''
+    customer_filter = f'{CUSTOMER_PREFIX}%'
+    for parent, children in (
+        ('Sales Invoice', ('Sales Invoice Item', 'Sales Taxes and Charges')),
+        ('Subscription', ('Subscription Plan Detail',)),
+    ):
+        party_field = 'customer' if parent == 'Sales Invoice' else 'party'
+        for child in children:
+            frappe.db.sql(f'''
+                delete child from `tab{child}` child
+                join `tab{parent}` parent on parent.name = child.parent
+                where child.parenttype = %s and parent.{party_field} like %s
+            ''', (parent, customer_filter))
+        frappe.db.delete(parent, {party_field: ('like', customer_filter)})
+
+    frappe.db.delete('Subscription Plan', {'seller_orderno': ('like', f'{ORDER_PREFIX}%')})
+
+    imports = frappe.get_all('Terracloud Import', filters={'csv_file': ('like', '%terracloud_benchmark_%')}, pluck='name')
+
+    # Vorgemerkte Rechnungen der Benchmark-Importe bzw. -Kunden
+    intent_filters = {'customer': ('like', customer_filter)}
+    if imports:
+        intent_filters['terracloud_import'] = ('in', imports)
+    intents = frappe.get_all('Terracloud Invoice Intent', or_filters=intent_filters, pluck='name')
+    if intents:
+        frappe.db.delete('Terracloud Invoice Intent Item', {'parenttype': 'Terracloud Invoice Intent', 'parent': ('in', intents)})
+        frappe.db.delete('Terracloud Invoice Intent', {'name': ('in', intents)})
+
+    if imports:
+        frappe.db.delete('Terracloud Import Log', {'terracloud_import': ('in', imports)})
+        frappe.db.delete('Terracloud Import Row', {'terracloud_import': ('in', imports)})
+        for child in ('Terracloud Import Shard', 'Terracloud Import Metric', 'Terracloud Import File'):
+            frappe.db.delete(child, {'parenttype': 'Terracloud Import', 'parent': ('in', imports)})
+        frappe.db.delete('Terracloud Import', {'name': ('in', imports)})
+
+    # Über delete_doc, damit auch die Datei auf der Festplatte entfernt wird
+    for file_name in frappe.get_all('File', filters={'file_name': ('like', 'terracloud_benchmark_%')}, pluck='name'):
+        frappe.delete_doc('File', file_name, ignore_permissions=True, force=True)
+
+    frappe.db.commit()
+
+def print_report(results: dict) -> None:
+    '''
+    Gibt den Durchsatz (Zeilen pro Sekunde) je Stufe und Dateigröße als Tabelle aus.
+
+    Args:
+        results (dict): Die Ergebnisse aus run().
+    '''
+    header = f"{'Zeilen':>8} {'Gesamt [s]':>11}" + ''.join(f' {stage:>14}' for stage in STAGES)
+    print(header)
+    print('-' * len(header))
+    for size, result in results.items():
+        line = f"{size:>8} {result['total_time']:>11.2f}"
+        for stage in STAGES:
+            line += f" {result['stages'].get(stage, {}).get('throughput', 0.0):>14.1f}"
+        print(line)
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> None:
+    '''
+    Vergleicht den Durchsatz je Stufe mit einem früheren Lauf.
+
+    Args:
+        results (dict): Die aktuellen Ergebnisse.
+        baseline (dict): Die Ergebnisse des Vergleichslaufs.
+        tolerance (float): Erlaubter Rückgang des Durchsatzes (0.2 = 20 %).
+
+    Raises:
+        AssertionError: Falls eine Stufe den erlaubten Rückgang überschreitet.
+    '''
+    regressions = []
+    for size, result in results.items():
+        for stage, metrics in result['stages'].items():
+            expected = baseline.get(size, {}).get('stages', {}).get(stage, {}).get('throughput')
+            if expected and metrics['throughput'] < expected * (1 - tolerance):
+                regressions.append(f'{size} Zeilen, {stage}: {metrics["throughput"]} statt {expected} Zeilen/s')
+
+    if regressions:
+        raise AssertionError('Durchsatz gesunken:\n' + '\n'.join(regressions))
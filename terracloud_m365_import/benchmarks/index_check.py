@@ -0,0 +1,214 @@
+"""
+Prüft per EXPLAIN, dass die Abfragen des Terracloud-Imports einen Index verwenden.
+
+Die Abfragen werden wie im Importer erzeugt (frappe.get_all bzw. dieselben SQL-Texte) und mit
+Beispielwerten ausgewertet. Eine Abfrage gilt nur als indiziert, wenn MariaDB für jede geprüfte
+Tabelle tatsächlich einen Index wählt (Spalte 'key'). Damit der Optimizer bei fast leeren Tabellen
+nicht ohnehin einen Full Table Scan wählt, werden vorher Testzeilen eingefügt (siehe seed_tables)
+und am Ende zurückgerollt.
+
+Aufruf (nur MariaDB):
+    bench --site test_site execute terracloud_m365_import.benchmarks.index_check.run
+"""
+
+import frappe
+from terracloud_m365_import.data.import_row_staging import ImportRowStaging
+from terracloud_m365_import.data.item_cache import ItemCache
+
+
+# Anzahl der Testzeilen je Tabelle
+SEED_ROWS = 1000
+
+def get_seed_value(i: int) -> str:
+    '''Gibt den Namen bzw. Filterwert der i-ten Testzeile zurück.'''
+    return f'TC-INDEX-CHECK-{i}'
+
+# Beispielwerte für die Filter; sie treffen Testzeilen, da MariaDB Abfragen ohne Treffer
+# über einen eindeutigen Schlüssel sonst ganz aus EXPLAIN entfernt
+SAMPLE = [get_seed_value(0), get_seed_value(1)]
+
+# Spalten der i-ten Testzeile je DocType (ohne Name)
+SEED_COLUMNS = {
+    'Customer': lambda i: {'customer_name': get_seed_value(i)},
+    'Item': lambda i: {'item_code': get_seed_value(i), 'item_name': get_seed_value(i)},
+    'Subscription': lambda i: {'party_type': 'Customer', 'party': get_seed_value(i), 'terracloud_billing_interval': 'Month'},
+    'Subscription Plan': lambda i: {'seller_orderno': get_seed_value(i)},
+    'Subscription Plan Detail': lambda i: {'parent': get_seed_value(i), 'parenttype': 'Subscription',
+                                           'parentfield': 'plans', 'plan': get_seed_value(i)},
+    # Zehn Preise je Preisliste
+    'Item Price': lambda i: {'price_list': get_seed_value(i // 10), 'item_code': get_seed_value(i), 'price_list_rate': 1},
+    'Terracloud Import': lambda i: {'file_hash': get_seed_value(i), 'import_status': 'Abgeschlossen'},
+    'Terracloud Import Shard': lambda i: {'parent': get_seed_value(i), 'parenttype': 'Terracloud Import',
+                                          'parentfield': 'shards', 'shard_index': 0},
+    # Hundert Zeilen je Import
+    'Terracloud Import Row': lambda i: {'terracloud_import': get_seed_value(i // 100), 'row_no': i, 'shard_key': i,
+                                        'state': 'Ausstehend', 'order_no': get_seed_value(i)}
+}
+
+def seed_tables() -> None:
+    '''
+    Fügt SEED_ROWS Testzeilen je DocType aus SEED_COLUMNS ein. Es wird nicht committet.
+    ANALYZE TABLE wird nicht verwendet, da es implizit committet; die Schätzungen des
+    Optimizers berücksichtigen die eingefügten Zeilen auch so.
+    '''
+    now = frappe.utils.now()
+    for doctype, get_columns in SEED_COLUMNS.items():
+        rows = [get_columns(i) for i in range(SEED_ROWS)]
+        frappe.db.bulk_insert(doctype, ['name', 'creation', 'modified', *rows[0]], [
+            (get_seed_value(i), now, now, *row.values())
+            for i, row in enumerate(rows)
+        ])
+
+def get_lookups() -> list[tuple[str, list[str], str, dict | None]]:
+    '''
+    Erzeugt die Abfragen, die der Import im laufenden Betrieb ausführt.
+
+    Returns:
+        list[tuple[str, list[str], str, dict | None]]: Bezeichnung, zu prüfende Tabellen
+            (wie in der Ausgabe von EXPLAIN), SQL und Parameter je Abfrage.
+    '''
+    return [
+        # ValidationContext.prefetch
+        ('Vorhandene Kunden', ['tabCustomer'], frappe.get_all(
+            'Customer',
+            filters={'name': ('in', SAMPLE)},
+            pluck='name',
+            run=0
+        ), None),
+        ('Vorhandene Artikel', ['tabItem'], frappe.get_all(
+            'Item',
+            filters={'name': ('in', SAMPLE)},
+            pluck='name',
+            run=0
+        ), None),
+        # OrderFactory.get_existing_fingerprints und get_unattached_plans
+        ('Subscription Plans je Bestellnummer', ['tabSubscription Plan'], frappe.get_all(
+            'Subscription Plan',
+            filters={'seller_orderno': ('in', SAMPLE)},
+            fields=['name', 'seller_orderno', 'terracloud_fingerprint'],
+            run=0
+        ), None),
+        ('Zugeordnete Subscription Plans', ['tabSubscription Plan Detail'], frappe.get_all(
+            'Subscription Plan Detail',
+            filters={'parenttype': 'Subscription', 'plan': ('in', SAMPLE)},
+            pluck='plan',
+            run=0
+        ), None),
+        # SubscriptionFactory.prefetch_monthly_subscriptions
+        ('Monatliche Subscriptions je Kunde', ['tabSubscription'], frappe.get_all(
+            'Subscription',
+            filters={'party_type': 'Customer', 'party': ('in', SAMPLE), 'terracloud_billing_interval': 'Month'},
+            fields=['name', 'party'],
+            run=0
+        ), None),
+        # get_party_names (validate der Subscription)
+        ('Namen der Kunden', ['tabCustomer'], frappe.get_all(
+            'Customer',
+            filters={'name': ('in', SAMPLE)},
+            fields=['name', 'customer_name'],
+            run=0
+        ), None),
+        # PriceIndex
+        ('Preise einer Preisliste', ['tabItem Price'], frappe.get_all(
+            'Item Price',
+            filters={'price_list': SAMPLE[0]},
+            fields=['item_code', 'customer', 'valid_from', 'valid_upto', 'price_list_rate'],
+            order_by='modified desc',
+            run=0
+        ), None),
+        # ItemCache.prefetch
+        ('Stammdaten der Artikel', ['tabItem'], frappe.get_all(
+            'Item',
+            filters={'name': ('in', SAMPLE)},
+            fields=ItemCache.FIELDS,
+            run=0
+        ), None),
+        # OrderImporter._is_known_file
+        ('Bereits importierte Datei', ['tabTerracloud Import'], frappe.get_all(
+            'Terracloud Import',
+            filters={'name': ('!=', SAMPLE[0]), 'file_hash': SAMPLE[0], 'import_status': 'Abgeschlossen'},
+            fields=['name'],
+            limit=1,
+            run=0
+        ), None),
+        # ImportCheckpoint
+        ('Fortschritt eines Teils', ['tabTerracloud Import Shard'], frappe.get_all(
+            'Terracloud Import Shard',
+            filters={'parenttype': 'Terracloud Import', 'parent': SAMPLE[0], 'shard_index': 0},
+            fields=['checkpoint_row', 'checkpoint_customers'],
+            limit=1,
+            run=0
+        ), None),
+        ('Offene Zeilen eines Imports', ['tabTerracloud Import Row'], ImportRowStaging.ORDERS_QUERY, {
+            'terracloud_import': SAMPLE[0],
+            'last_row': 0,
+            'shard_count': 1,
+            'shard_index': 0,
+            'states': ImportRowStaging.OPEN_STATES,
+            'page_size': 500
+        }),
+        # Die Tabellen der Abfrage heißen in EXPLAIN wie ihre Aliase
+        ('Status der Zeilen eines Blocks', ['r', 'p', 'd'], ImportRowStaging.STATES_UPDATE, {
+            'processed': (0,),
+            'terracloud_import': SAMPLE[0],
+            'start_row': 0,
+            'end_row': 500,
+            'shard_count': 1,
+            'shard_index': 0,
+            'states': ImportRowStaging.OPEN_STATES
+        })
+    ]
+
+def run() -> dict:
+    '''
+    Fügt die Testzeilen ein, führt EXPLAIN für alle Abfragen aus und gibt das Ergebnis als Tabelle aus.
+    Die Testzeilen werden danach zurückgerollt.
+
+    Returns:
+        dict: Verwendeter Zugriff je Abfrage und Tabelle.
+
+    Raises:
+        AssertionError: Falls eine Abfrage eine Tabelle ohne Index liest.
+    '''
+    if frappe.db.db_type != 'mariadb':
+        frappe.throw('Die Prüfung der Indizes ist nur mit MariaDB möglich.')
+
+    results = {}
+    missing = []
+    try:
+        seed_tables()
+        for label, tables, query, values in get_lookups():
+            results[label] = {}
+            for row in frappe.db.sql(f'EXPLAIN {query}', values, as_dict=True):
+                if row.table not in tables:
+                    continue
+
+                results[label][row.table] = {'type': row.type, 'key': row.key, 'possible_keys': row.possible_keys}
+                if not row.key:
+                    missing.append(f'{label}: {row.table} ({row.type}, mögliche Indizes: {row.possible_keys or "-"})')
+
+            # Fehlt eine Tabelle in EXPLAIN, wurde sie nicht geprüft
+            missing += [f'{label}: {table} (nicht in EXPLAIN)' for table in tables if table not in results[label]]
+    finally:
+        frappe.db.rollback()
+
+    print_report(results)
+
+    if missing:
+        raise AssertionError('Abfragen ohne Index:\n' + '\n'.join(missing))
+
+    return results
+
+def print_report(results: dict) -> None:
+    '''
+    Gibt den Zugriff je Abfrage und Tabelle als Tabelle aus.
+
+    Args:
+        results (dict): Die Ergebnisse aus run().
+    '''
+    header = f"{'Abfrage':<42} {'Tabelle':<28} {'Zugriff':<8} Index"
+    print(header)
+    print('-' * len(header))
+    for label, tables in results.items():
+        for table, access in tables.items():
+            print(f"{label:<42} {table:<28} {access['type'] or '':<8} {access['key'] or '-'}")
@@ -0,0 +1,178 @@
+import calendar
+from dataclasses import dataclass
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from frappe.utils import getdate
+from typing import Callable
+from .order import Order, PriceType
+
+@dataclass
+class BillingPeriod:
+    """Ein Abrechnungszeitraum einer Bestellung mit dem Preis pro Stück."""
+    order: Order
+    from_date: date
+    to_date: date
+    unit_price: float | None
+
+class BillingEngine:
+    '''
+    Berechnet die verpassten Abrechnungszeiträume und (anteiligen) Preise von Bestellungen.
+
+    Alle Zeiträume der übergebenen Bestellungen werden in einem Durchlauf berechnet, bevor
+    Rechnungen erstellt werden. Tage pro Monat und Jahr stammen aus vorberechneten Tabellen,
+    volle Preise werden je Artikel, Kunde und Bewertungsdatum nur einmal ermittelt.
+    Die Rechenschritte und die Rundung entsprechen exakt der bisherigen Einzelberechnung.
+    '''
+    # Tage pro Monat bzw. Jahr, werden bei Bedarf jahrweise ergänzt
+    _days_in_month: dict[tuple[int, int], int] = {}
+    _days_in_year: dict[int, int] = {}
+
+    def __init__(self, get_full_price: Callable[[Order, date], float | None]):
+        '''
+        Initialisiert die Berechnung.
+
+        Args:
+            get_full_price (Callable[[Order, date], float | None]): Ermittelt den vollen Preis
+                einer Bestellung zum Bewertungsdatum.
+        '''
+        self._get_full_price = get_full_price
+        self._full_prices: dict[tuple[str, str, date], float | None] = {}
+
+    def get_missed_periods(self, orders: list[Order]) -> list[tuple[Order, list[BillingPeriod]]]:
+        '''
+        Berechnet für alle Bestellungen die Zeiträume zwischen Bestelldatum und Abo-Startdatum
+        samt Preis pro Stück. Wie bisher bleibt der Preis eines Zeitraums ohne Preis in der Preisliste leer (None).
+
+        Args:
+            orders (list[Order]): Die Bestellungen mit zugeordneter Subscription.
+
+        Returns:
+            list[tuple[Order, list[BillingPeriod]]]: Die Zeiträume je Bestellung, in der Reihenfolge der Bestellungen.
+
+        Raises:
+            ValueError: Falls einer Bestellung keine Subscription zugeordnet ist.
+        '''
+        periods = [(order, BillingEngine._get_periods(order)) for order in orders]
+
+        # Kalendertabellen für alle betroffenen Jahre in einem Schritt aufbauen
+        BillingEngine._prepare_calendar({period.from_date.year for _, order_periods in periods for period in order_periods})
+
+        for _, order_periods in periods:
+            for period in order_periods:
+                period.unit_price = self.get_unit_price(period.order, period.from_date, period.to_date)
+
+        return periods
+
+    def get_unit_price(self, order: Order, from_date: date, to_date: date) -> float | None:
+        '''
+        Berechnet den Preis für eine Bestellung (pro Stück) im gegebenen Zeitraum.
+
+        Args:
+            order (Order): Die Bestellung.
+            from_date (date): Das Startdatum des Abrechnungszeitraums.
+            to_date (date): Das Enddatum des Abrechnungszeitraums.
+
+        Returns:
+            float: Der Preis für die Bestellung im gegebenen Zeitraum. None, falls kein Preis gefunden wurde.
+        '''
+        # Feststellen, ob ein ganzer Preis oder anteiliger berechnet werden muss
+        if order.price_type == PriceType.MONTHLY and to_date == from_date + relativedelta(months=1, days=-1):
+            return self._get_cached_full_price(order, from_date)
+        elif order.price_type == PriceType.YEARLY and to_date == from_date + relativedelta(years=1, days=-1):
+            return self._get_cached_full_price(order, from_date)
+
+        return self._get_partial_price(order, from_date, to_date)
+
+    def _get_partial_price(self, order: Order, from_date: date, to_date: date) -> float | None:
+        '''
+        Berechnet den anteiligen Preis pro Stück anhand der Tage im Abrechnungszeitraum.
+
+        Args:
+            order (Order): Die Bestellung.
+            from_date (date): Das Startdatum des Abrechnungszeitraums.
+            to_date (date): Das Enddatum des Abrechnungszeitraums.
+
+        Returns:
+            float: Der anteilige Preis, auf 2 Nachkommastellen gerundet. None, falls kein Preis gefunden wurde.
+        '''
+        # Zuerst den vollen Preis über die Preisliste holen
+        full_price = self._get_cached_full_price(order, from_date)
+        if not full_price:
+            return None
+
+        billing_days = (to_date - from_date).days + 1 # Einschließlich beider Tage
+
+        # Anzahl der Tage im Monat oder Jahr aus den Kalendertabellen
+        year = from_date.year
+        BillingEngine._prepare_calendar({year})
+        if order.price_type == PriceType.MONTHLY:
+            all_days = BillingEngine._days_in_month[(year, from_date.month)]
+        elif order.price_type == PriceType.YEARLY:
+            all_days = BillingEngine._days_in_year[year]
+
+        # Preis pro Tag berechnen (Reihenfolge der Operationen wie bisher, damit die Rundung identisch bleibt)
+        daily_price = full_price / all_days
+        billing_price = daily_price * billing_days
+
+        return round(billing_price, 2)
+
+    def _get_cached_full_price(self, order: Order, valuation_date: date) -> float | None:
+        '''Ermittelt den vollen Preis je Artikel, Kunde und Bewertungsdatum nur einmal.'''
+        key = (order.article_no, order.customer_no, valuation_date)
+        if key not in self._full_prices:
+            self._full_prices[key] = self._get_full_price(order, valuation_date)
+        return self._full_prices[key]
+
+    @staticmethod
+    def _get_periods(order: Order) -> list[BillingPeriod]:
+        '''
+        Bestimmt die Abrechnungszeiträume einer Bestellung vom Bestelldatum bis zum Abo-Startdatum.
+        Der erste Zeitraum beginnt am Bestelldatum, der letzte endet am Tag vor dem Abo-Startdatum.
+
+        Args:
+            order (Order): Die Bestellung.
+
+        Returns:
+            list[BillingPeriod]: Die Zeiträume (noch ohne Preis).
+
+        Raises:
+            ValueError: Falls die Bestellung oder Subscription nicht gefunden wurde
+        '''
+        if not order or not order.subscription:
+            raise ValueError('Can\'t create missing invoices. Order or Subscription not found')
+
+        if order.price_type == PriceType.MONTHLY:
+            interval = relativedelta(months=1)
+        elif order.price_type == PriceType.YEARLY:
+            interval = relativedelta(years=1)
+        else:
+            return []
+
+        # Die Rechnungserzeugung soll bis zum Abo-Startdatum erfolgen
+        end_date = getdate(order.subscription.current_invoice_start)
+
+        periods = []
+        current_start = order.start_date
+        while current_start < end_date:
+            # End-Datum beschneiden falls es das Abo-Startdatum überschreitet.
+            # Es soll nur der Leistungs-Zeitraum betrachtet werden: 1 Tag abziehen
+            current_end = min(current_start + interval, end_date) - relativedelta(days=1)
+            periods.append(BillingPeriod(order, current_start, current_end, None))
+
+            # Nächsten Rechnungsstart bestimmen
+            current_start = current_end + relativedelta(days=1)
+
+        return periods
+
+    @staticmethod
+    def _prepare_calendar(years: set[int]) -> None:
+        '''
+        Ergänzt die Kalendertabellen um die angegebenen Jahre.
+
+        Args:
+            years (set[int]): Die Jahre.
+        '''
+        for year in years - BillingEngine._days_in_year.keys():
+            for month in range(1, 13):
+                BillingEngine._days_in_month[(year, month)] = calendar.monthrange(year, month)[1]
+            BillingEngine._days_in_year[year] = 366 if calendar.isleap(year) else 365
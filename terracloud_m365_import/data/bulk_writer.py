@@ -0,0 +1,273 @@
+import frappe
+from frappe.model.base_document import get_controller
+from frappe.model.document import Document
+from .import_preview import ImportPreview
+
+class BulkWriter:
+    '''
+    Gemeinsame Schreibschicht der Factories.
+
+    Dokumente von DocTypes ohne relevante Hooks (siehe BULK_DOCTYPES und supports_bulk_insert) werden
+    im Speicher gesammelt, mit flush() blockweise validiert, benannt und per Bulk-Insert geschrieben.
+    Schlägt der Bulk-Insert fehl, wird jedes Dokument in einem eigenen Savepoint einzeln geschrieben,
+    sodass ein fehlerhaftes Dokument nicht die übrigen des Blocks verwirft.
+    Alle anderen Dokumente werden sofort über das ORM gespeichert, damit ihre Hooks
+    (z.B. update_party_name für Subscriptions) ausgeführt werden.
+
+    Im Probelauf (mit ImportPreview) wird nichts geschrieben; die Dokumente werden nur im Bericht erfasst.
+    '''
+    # DocTypes, deren Controller nur validieren und die daher per Bulk-Insert geschrieben werden dürfen
+    BULK_DOCTYPES = {'Subscription Plan', 'Terracloud Invoice Intent'}
+
+    # Ereignisse nach dem Schreiben, die beim Bulk-Insert nicht ausgeführt werden
+    SKIPPED_EVENTS = ('after_insert', 'on_update', 'on_change')
+
+    # Dokumente, über die Ereignisse eines DocTypes ohne Code konfiguriert werden: (DocType, Feld mit dem DocType).
+    # Die allgemeinen Hooks von Frappe ('*', z.B. für Workflows und Zuweisungsregeln) greifen nur mit diesen.
+    EVENT_CONFIGURATIONS = [
+        ('Server Script', 'reference_doctype'),
+        ('Webhook', 'webhook_doctype'),
+        ('Notification', 'document_type'),
+        ('Workflow', 'document_type'),
+        ('Assignment Rule', 'document_type'),
+        ('Energy Point Rule', 'reference_doctype'),
+        ('Milestone Tracker', 'document_type')
+    ]
+
+    def __init__(self, preview: ImportPreview = None):
+        '''
+        Initialisiert die Schreibschicht.
+
+        Args:
+            preview (ImportPreview): Optional: Probelauf, in dem die Dokumente nur erfasst werden.
+        '''
+        self.preview = preview
+        self._pending: list[Document] = []
+        self._bulk_doctypes: dict[str, bool] = {}
+
+    @property
+    def dry_run(self) -> bool:
+        '''True, wenn keine Dokumente geschrieben werden (Probelauf).'''
+        return self.preview is not None
+
+    def insert(self, doc: Document) -> Document:
+        '''
+        Speichert ein neues Dokument.
+        Dokumente aus BULK_DOCTYPES ohne Hooks werden nur vorgemerkt und erst mit flush() geschrieben.
+
+        Args:
+            doc (Document): Das neue Dokument.
+
+        Returns:
+            Document: Das Dokument.
+        '''
+        if self.dry_run:
+            self.preview.add(doc, 'insert')
+        elif self.supports_bulk_insert(doc.doctype):
+            self._pending.append(doc)
+        else:
+            doc.insert()
+        return doc
+
+    def save(self, doc: Document) -> Document:
+        '''
+        Speichert ein bestehendes Dokument über das ORM.
+
+        Args:
+            doc (Document): Das Dokument.
+
+        Returns:
+            Document: Das Dokument.
+        '''
+        if self.dry_run:
+            self.preview.add(doc, 'save')
+        else:
+            doc.save()
+        return doc
+
+    def discard(self) -> None:
+        '''
+        Verwirft alle vorgemerkten Dokumente, z.B. nachdem ihr Savepoint zurückgerollt wurde.
+        '''
+        self._pending = []
+
+    def supports_bulk_insert(self, doctype: str) -> bool:
+        '''
+        Prüft, ob Dokumente eines DocTypes per Bulk-Insert geschrieben werden dürfen:
+        Der DocType steht in BULK_DOCTYPES und für SKIPPED_EVENTS gibt es weder Methoden im Controller
+        noch doc_events installierter Apps noch konfigurierte Server Scripts, Webhooks o.ä.
+        (siehe EVENT_CONFIGURATIONS). Das Ergebnis gilt für die Lebensdauer der Schreibschicht.
+
+        Args:
+            doctype (str): Der DocType.
+
+        Returns:
+            bool: True, wenn der Bulk-Insert dasselbe Ergebnis wie Document.insert() liefert.
+        '''
+        if doctype not in self._bulk_doctypes:
+            self._bulk_doctypes[doctype] = doctype in BulkWriter.BULK_DOCTYPES and not BulkWriter._has_hooks(doctype)
+        return self._bulk_doctypes[doctype]
+
+    @staticmethod
+    def _has_hooks(doctype: str) -> bool:
+        '''
+        Prüft, ob beim Schreiben eines Dokuments des DocTypes Code für SKIPPED_EVENTS ausgeführt würde.
+
+        Args:
+            doctype (str): Der DocType.
+
+        Returns:
+            bool: True, wenn mindestens ein Hook existiert.
+        '''
+        controller = get_controller(doctype)
+        if any(getattr(controller, event, None) is not getattr(Document, event, None) for event in BulkWriter.SKIPPED_EVENTS):
+            return True
+
+        for app in frappe.get_installed_apps():
+            doc_events = frappe.get_hooks('doc_events', {}, app_name=app)
+            # Die allgemeinen Hooks von Frappe werden über EVENT_CONFIGURATIONS geprüft
+            keys = (doctype,) if app == 'frappe' else (doctype, '*')
+            if any(doc_events.get(key, {}).get(event) for key in keys for event in BulkWriter.SKIPPED_EVENTS):
+                return True
+
+        return any(
+            frappe.db.table_exists(config_doctype) and frappe.db.exists(config_doctype, {field: doctype})
+            for config_doctype, field in BulkWriter.EVENT_CONFIGURATIONS
+        )
+
+    def flush(self) -> list[tuple[Document, Exception]]:
+        '''
+        Validiert und benennt alle vorgemerkten Dokumente und schreibt die gültigen
+        mit einem Bulk-Insert pro DocType bzw. Kindtabelle.
+
+        Returns:
+            list[tuple[Document, Exception]]: Die Dokumente, die nicht geschrieben werden konnten, mit dem Fehler.
+        '''
+        pending, self._pending = self._pending, []
+
+        docs_by_doctype: dict[str, list[Document]] = {}
+        for doc in pending:
+            docs_by_doctype.setdefault(doc.doctype, []).append(doc)
+
+        failed = []
+        for doctype, docs in docs_by_doctype.items():
+            prepared = []
+            for doc in docs:
+                try:
+                    BulkWriter._prepare(doc)
+                except Exception as e:
+                    failed.append((doc, e))
+                    continue
+                prepared.append(doc)
+
+            prepared, duplicates = BulkWriter._reject_duplicates(doctype, prepared)
+            failed.extend(duplicates)
+            failed.extend(BulkWriter._insert_prepared(prepared))
+
+        return failed
+
+    @staticmethod
+    def _insert_prepared(docs: list[Document]) -> list[tuple[Document, Exception]]:
+        '''
+        Schreibt vorbereitete Dokumente per Bulk-Insert. Schlägt er fehl, wird jedes Dokument
+        in einem eigenen Savepoint einzeln geschrieben.
+
+        Args:
+            docs (list[Document]): Die vorbereiteten Dokumente.
+
+        Returns:
+            list[tuple[Document, Exception]]: Die Dokumente, die nicht geschrieben werden konnten, mit dem Fehler.
+        '''
+        if not docs:
+            return []
+
+        frappe.db.savepoint('terracloud_bulk_insert')
+        try:
+            BulkWriter._bulk_insert(docs)
+        except Exception:
+            frappe.db.rollback(save_point='terracloud_bulk_insert')
+        else:
+            frappe.db.release_savepoint('terracloud_bulk_insert')
+            return []
+
+        failed = []
+        for doc in docs:
+            frappe.db.savepoint('terracloud_bulk_insert_doc')
+            try:
+                BulkWriter._bulk_insert([doc])
+            except Exception as e:
+                frappe.db.rollback(save_point='terracloud_bulk_insert_doc')
+                failed.append((doc, e))
+            else:
+                frappe.db.release_savepoint('terracloud_bulk_insert_doc')
+        return failed
+
+    @staticmethod
+    def _prepare(doc: Document) -> None:
+        '''
+        Führt die Schritte von Document.insert() bis vor das Schreiben in die Datenbank aus:
+        Standardwerte, Benennung, Link-Prüfung (inkl. fetch_from), validate/before_save und Feldprüfungen.
+
+        Args:
+            doc (Document): Das neue Dokument.
+        '''
+        doc.flags.in_insert = True
+        doc.set('__islocal', True)
+        doc.check_permission('create')
+        doc._set_defaults()
+        doc.set_user_and_timestamp()
+        doc.set_docstatus()
+        doc.run_method('before_insert')
+        doc.set_new_name()
+        doc.set_parent_in_children()
+        doc._validate_links()
+        doc.run_before_save_methods()
+        doc._validate()
+        doc.flags.in_insert = False
+
+    @staticmethod
+    def _reject_duplicates(doctype: str, docs: list[Document]) -> tuple[list[Document], list[tuple[Document, Exception]]]:
+        '''
+        Sortiert Dokumente aus, deren Name bereits vergeben ist (in der Datenbank oder im selben Block).
+
+        Args:
+            doctype (str): Der DocType.
+            docs (list[Document]): Die vorbereiteten Dokumente.
+
+        Returns:
+            tuple: Die eindeutigen Dokumente und die Duplikate mit Fehler.
+        '''
+        if not docs:
+            return [], []
+
+        taken = {name.casefold() for name in frappe.get_all(doctype, filters={'name': ('in', [doc.name for doc in docs])}, pluck='name')}
+        unique, duplicates = [], []
+        for doc in docs:
+            key = doc.name.casefold()
+            if key in taken:
+                duplicates.append((doc, frappe.DuplicateEntryError(f'{doctype} {doc.name} already exists')))
+                continue
+            taken.add(key)
+            unique.append(doc)
+        return unique, duplicates
+
+    @staticmethod
+    def _bulk_insert(docs: list[Document]) -> None:
+        '''
+        Schreibt Dokumente desselben DocTypes samt Kindtabellen per Bulk-Insert.
+
+        Args:
+            docs (list[Document]): Die vorbereiteten Dokumente.
+        '''
+        rows_by_doctype: dict[str, list[dict]] = {}
+        for doc in docs:
+            rows_by_doctype.setdefault(doc.doctype, []).append(doc.get_valid_dict(convert_dates_to_str=True))
+            for child in doc.get_all_children():
+                rows_by_doctype.setdefault(child.doctype, []).append(child.get_valid_dict(convert_dates_to_str=True))
+
+        for doctype, rows in rows_by_doctype.items():
+            fields = list(rows[0].keys())
+            frappe.db.bulk_insert(doctype, fields, [tuple(row.get(field) for field in fields) for row in rows])
+
+        for doc in docs:
+            doc.set('__islocal', False)
@@ -0,0 +1,91 @@
+from .order import Order, PriceType
+from typing import Callable
+
+# Optionale Abhängigkeit: ohne pyarrow wird zeilenweise umgewandelt (siehe OrderFactory.convert_rows)
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+class ColumnarConverter:
+    '''
+    Wandelt einen Block von CSV-Zeilen spaltenweise mit pyarrow in Bestellobjekte um.
+
+    Datum, Menge und Preistyp werden für den ganzen Block auf einmal umgewandelt, statt
+    datetime.strptime, float und PriceType für jede Zeile einzeln aufzurufen.
+    Spaltenweise umgewandelt werden nur Werte, deren Format eindeutig ist (siehe DATE_PATTERN
+    und QUANTITY_PATTERN). Alle übrigen Zeilen werden wie bisher einzeln umgewandelt
+    (siehe OrderFactory.order_from_row), sodass fehlerhafte Werte dieselbe Fehlermeldung erhalten.
+    '''
+    DATE_FORMAT = '%d.%m.%Y %H:%M:%S'
+    DATE_PATTERN = r'^\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}:\d{2}$'
+    QUANTITY_PATTERN = r'^-?\d{1,15}(\.\d{1,15})?$'
+
+    COLUMNS = ['CustomID', 'Bestellnummer', 'Artikelnummer', 'Menge', 'MicrosoftSubscriptionStartDate', 'Preistyp']
+
+    @staticmethod
+    def is_available() -> bool:
+        '''Prüft, ob pyarrow installiert ist.'''
+        return pa is not None
+
+    @staticmethod
+    def convert(rows: list[dict], row_nos: list[int], fallback: Callable[[dict, int], Order]) -> list[Order | Exception]:
+        '''
+        Wandelt einen Block von CSV-Zeilen in Bestellobjekte um.
+
+        Args:
+            rows (list[dict]): Die Zeilen der CSV-Datei.
+            row_nos (list[int]): Die Nummern der Zeilen.
+            fallback (Callable[[dict, int], Order]): Die zeilenweise Umwandlung für Werte,
+                die nicht spaltenweise umgewandelt werden können.
+
+        Returns:
+            list[Order | Exception]: Je Zeile die Bestellung oder der Fehler der Umwandlung.
+        '''
+        # Fehlende Spalten (z.B. verkürzte Zeilen) nur zeilenweise behandeln
+        complete = [all(row.get(column) is not None for column in ColumnarConverter.COLUMNS) for row in rows]
+
+        null = pa.scalar(None, type=pa.string())
+
+        def column(name: str) -> 'pa.Array':
+            return pa.array([row.get(name) if ok else None for row, ok in zip(rows, complete)], type=pa.string())
+
+        dates = column('MicrosoftSubscriptionStartDate')
+        dates = pc.if_else(pc.match_substring_regex(dates, ColumnarConverter.DATE_PATTERN), dates, null)
+        timestamps = pc.strptime(dates, format=ColumnarConverter.DATE_FORMAT, unit='s', error_is_null=True)
+
+        # pyarrow rechnet ungültige Tage weiter (31.02. -> 02.03.), strptime lehnt sie ab
+        valid = pc.equal(pc.strftime(timestamps, format=ColumnarConverter.DATE_FORMAT), dates)
+        start_dates = pc.cast(pc.if_else(valid, timestamps, pa.scalar(None, type=timestamps.type)), pa.date32(), safe=False).to_pylist()
+
+        quantities = column('Menge')
+        quantities = pc.cast(
+            pc.if_else(pc.match_substring_regex(quantities, ColumnarConverter.QUANTITY_PATTERN), quantities, null),
+            pa.float64()
+        ).to_pylist()
+
+        price_type_values = {price_type.value: price_type for price_type in PriceType}
+        price_types = column('Preistyp')
+        price_types = pc.if_else(pc.is_in(price_types, value_set=pa.array(list(price_type_values))), price_types, null).to_pylist()
+
+        results = []
+        for row, row_no, ok, quantity, start_date, price_type in zip(rows, row_nos, complete, quantities, start_dates, price_types):
+            if ok and quantity is not None and start_date is not None and price_type is not None:
+                results.append(Order(
+                    customer_no=row['CustomID'],
+                    order_no=row['Bestellnummer'],
+                    article_no=row['Artikelnummer'],
+                    quantity=quantity,
+                    start_date=start_date,
+                    price_type=price_type_values[price_type],
+                    row_no=row_no
+                ))
+                continue
+
+            try:
+                results.append(fallback(row, row_no))
+            except Exception as e:
+                results.append(e)
+        return results
@@ -0,0 +1,91 @@
+import frappe
+import hashlib
+
+class CustomerLocks:
+    '''
+    Sperrt Kunden gegen die gleichzeitige Bearbeitung durch andere Importe.
+
+    Verwendet die benannten Sperren von MariaDB (GET_LOCK). Sie blockieren keine Tabellen oder Zeilen
+    und gelten nur unter Importen, die dieselbe Sperre anfordern. Die Sperren eines Blocks werden
+    gesammelt in sortierter Reihenfolge angefordert, während der Import keine anderen Sperren hält;
+    so können sich zwei Importe nicht gegenseitig blockieren. Freigegeben wird eine Sperre erst,
+    nachdem die Daten des Kunden committet wurden (siehe release_completed).
+    '''
+    # Maximale Wartezeit auf einen Kunden, den ein anderer Import bearbeitet (Sekunden)
+    TIMEOUT = 600
+
+    def __init__(self, enabled: bool = True):
+        '''
+        Initialisiert die Sperren.
+
+        Args:
+            enabled (bool): Ob gesperrt wird. Ohne MariaDB oder im Probelauf wird nicht gesperrt.
+        '''
+        self.enabled = enabled and frappe.db.db_type == 'mariadb'
+        self._held: dict[str, str] = {}
+        self._completed: set[str] = set()
+
+    @property
+    def held(self) -> bool:
+        '''Gibt zurück, ob aktuell Sperren gehalten werden.'''
+        return bool(self._held)
+
+    def acquire(self, customer_nos: list[str]) -> None:
+        '''
+        Sperrt die Kunden eines Blocks. Wartet höchstens TIMEOUT Sekunden pro Kunde.
+
+        Args:
+            customer_nos (list[str]): Die Kundennummern.
+
+        Raises:
+            frappe.QueryTimeoutError: Falls ein Kunde nicht rechtzeitig freigegeben wurde.
+        '''
+        if not self.enabled:
+            return
+
+        for key in sorted({customer_no.casefold() for customer_no in customer_nos} - self._held.keys()):
+            lock_name = CustomerLocks._get_lock_name(key)
+            if not frappe.db.sql('SELECT GET_LOCK(%s, %s)', (lock_name, CustomerLocks.TIMEOUT))[0][0]:
+                raise frappe.QueryTimeoutError(f'Kunde {key} wird seit {CustomerLocks.TIMEOUT} Sekunden von einem anderen Import bearbeitet')
+            self._held[key] = lock_name
+
+    def complete(self, customer_no: str) -> None:
+        '''
+        Markiert einen Kunden als abgeschlossen; die Sperre wird nach dem nächsten Commit freigegeben.
+
+        Args:
+            customer_no (str): Die Kundennummer.
+        '''
+        if self.enabled:
+            self._completed.add(customer_no.casefold())
+
+    def release_completed(self) -> None:
+        '''
+        Gibt die Sperren der abgeschlossenen Kunden frei. Muss nach dem Commit aufgerufen werden.
+        '''
+        for key in self._completed & self._held.keys():
+            frappe.db.sql('SELECT RELEASE_LOCK(%s)', (self._held.pop(key),))
+        self._completed = set()
+
+    def release_all(self) -> None:
+        '''
+        Gibt alle Sperren frei, z.B. nachdem die Transaktion zurückgerollt wurde.
+        '''
+        for lock_name in self._held.values():
+            frappe.db.sql('SELECT RELEASE_LOCK(%s)', (lock_name,))
+        self._held = {}
+        self._completed = set()
+
+    @staticmethod
+    def _get_lock_name(key: str) -> str:
+        '''
+        Bildet den Namen der Sperre eines Kunden. Sperren gelten serverweit, daher
+        enthält der Name die Datenbank der Seite. MariaDB erlaubt höchstens 64 Zeichen.
+
+        Args:
+            key (str): Die Kundennummer (in Kleinschreibung, siehe str.casefold).
+
+        Returns:
+            str: Der Name der Sperre.
+        '''
+        return 'terracloud:' + hashlib.sha1(f'{frappe.conf.db_name}:{key}'.encode()).hexdigest()
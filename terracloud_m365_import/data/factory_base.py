@@ -1,8 +1,12 @@
 from abc import ABC
 from frappe.model.document import Document
 from terracloud_m365_import.logger import Logger
+from .bulk_writer import BulkWriter
+from .import_metrics import ImportMetrics
 
 class FactoryBase(ABC):
-    def __init__(self, settings: Document, logger: Logger):
+    def __init__(self, settings: Document, logger: Logger, writer: BulkWriter = None, metrics: ImportMetrics = None):
         self.settings = settings
-        self.logger = logger
\ No newline at end of file
+        self.logger = logger
+        self.writer = writer or BulkWriter()
+        self.metrics = metrics or ImportMetrics()
\ No newline at end of file
@@ -0,0 +1,76 @@
+import frappe
+import json
+
+class ImportCheckpoint:
+    '''
+    Fortschritt eines Import-Teils (Shard), damit ein abgebrochener Import fortgesetzt werden kann.
+
+    Gespeichert werden die Zeile der CSV-Datei, an der der aktuelle Block beginnt,
+    und die Kunden, die innerhalb dieses Blocks bereits abgeschlossen wurden.
+    Der Checkpoint wird unmittelbar vor jedem Commit geschrieben (siehe TransactionManager)
+    und beschreibt damit immer genau den committeten Stand.
+    '''
+    def __init__(self, terracloud_import: str, shard_index: int = 0, load: bool = True):
+        '''
+        Lädt den gespeicherten Checkpoint eines Teils.
+
+        Args:
+            terracloud_import (str): Der Name des Terracloud Imports.
+            shard_index (int): Der Teil des Imports.
+            load (bool): Ob der gespeicherte Fortschritt geladen wird. Ohne beginnt der Import von vorn,
+                z.B. im Probelauf, der den Checkpoint auch nie speichert.
+        '''
+        self.filters = {
+            'parenttype': 'Terracloud Import',
+            'parent': terracloud_import,
+            'shard_index': shard_index
+        }
+        self.row_offset = 0
+        self.completed_customers: set[str] = set()
+
+        checkpoint = frappe.db.get_value('Terracloud Import Shard', self.filters,
+                                         ['checkpoint_row', 'checkpoint_customers'], as_dict=True) if load else None
+        if checkpoint:
+            self.row_offset = checkpoint.checkpoint_row or 0
+            self.completed_customers = set(json.loads(checkpoint.checkpoint_customers or '[]'))
+
+        # Ohne gespeicherten Fortschritt beginnt der Import von vorn
+        self.resumed = bool(self.row_offset or self.completed_customers)
+        self._saved = (self.row_offset, set(self.completed_customers))
+
+    def is_completed(self, customer_no: str) -> bool:
+        '''Prüft, ob ein Kunde im aktuellen Block bereits abgeschlossen wurde.'''
+        return (customer_no or '').casefold() in self.completed_customers
+
+    def complete_customer(self, customer_no: str) -> None:
+        '''Markiert einen Kunden im aktuellen Block als abgeschlossen.'''
+        self.completed_customers.add((customer_no or '').casefold())
+
+    def complete_chunk(self, row_offset: int) -> None:
+        '''
+        Markiert den aktuellen Block als abgeschlossen.
+
+        Args:
+            row_offset (int): Die Zeile der CSV-Datei, an der der nächste Block beginnt.
+        '''
+        self.row_offset = row_offset
+        self.completed_customers = set()
+
+    def save(self) -> None:
+        '''
+        Schreibt den Checkpoint in die Zeile des Teils (ohne zu committen).
+        '''
+        frappe.db.set_value('Terracloud Import Shard', self.filters, {
+            'checkpoint_row': self.row_offset,
+            'checkpoint_customers': json.dumps(sorted(self.completed_customers))
+        }, update_modified=False)
+        self._saved = (self.row_offset, set(self.completed_customers))
+
+    def rollback(self) -> None:
+        '''
+        Setzt den Checkpoint auf den zuletzt gespeicherten Stand zurück,
+        z.B. nachdem die Transaktion zurückgerollt wurde.
+        '''
+        row_offset, completed_customers = self._saved
+        self.row_offset = row_offset
+        self.completed_customers = set(completed_customers)
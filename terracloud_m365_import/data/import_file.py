@@ -0,0 +1,76 @@
+import frappe
+import io
+import os
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from frappe.model.document import Document
+from typing import IO, Iterator
+
+@dataclass
+class ImportFile:
+    """Eine CSV-Datei eines Imports, auch als Eintrag eines Zip-Archivs."""
+    # Anzeigename, z.B. für das Log ('export.zip/reseller_a.csv' bei Archiven)
+    name: str
+
+    # Pfad der Datei bzw. des Archivs
+    path: str
+
+    # Name des Eintrags im Zip-Archiv
+    member: str = None
+
+    @property
+    def size(self) -> int:
+        """Gibt die (entpackte) Größe der CSV-Datei in Bytes zurück."""
+        if self.member is None:
+            return os.path.getsize(self.path)
+        with zipfile.ZipFile(self.path) as archive:
+            return archive.getinfo(self.member).file_size
+
+    @contextmanager
+    def open_binary(self) -> Iterator[IO[bytes]]:
+        """Öffnet die CSV-Datei zum Lesen der Bytes, ohne ein Archiv zu entpacken."""
+        if self.member is None:
+            with open(self.path, mode='rb') as file:
+                yield file
+        else:
+            with zipfile.ZipFile(self.path) as archive, archive.open(self.member) as file:
+                yield file
+
+    @contextmanager
+    def open(self) -> Iterator[IO[str]]:
+        """Öffnet die CSV-Datei als Text (TerraCloud exportiert in Latin-1)."""
+        with self.open_binary() as file:
+            yield io.TextIOWrapper(file, encoding='latin-1')
+
+    @staticmethod
+    def get_import_files(terracloud_import: Document) -> list['ImportFile']:
+        """
+        Ermittelt die CSV-Dateien eines Imports: die CSV-Datei und die weiteren Dateien in der
+        Reihenfolge der Tabelle. Zip-Archive werden durch die enthaltenen CSV-Dateien ersetzt
+        (alphabetisch sortiert).
+
+        Args:
+            terracloud_import (Document): Der TerraCloud-Import.
+
+        Returns:
+            list[ImportFile]: Die CSV-Dateien in der Reihenfolge, in der sie importiert werden.
+        """
+        file_urls = [terracloud_import.csv_file] if terracloud_import.csv_file else []
+        file_urls += [row.file for row in terracloud_import.get('files') or [] if row.file]
+
+        files = []
+        for file_url in file_urls:
+            file_doc = frappe.get_doc('File', {'file_url': file_url})
+            path = file_doc.get_full_path()
+            if not path.lower().endswith('.zip'):
+                files.append(ImportFile(file_doc.file_name, path))
+                continue
+
+            with zipfile.ZipFile(path) as archive:
+                members = sorted(
+                    info.filename for info in archive.infolist()
+                    if not info.is_dir() and info.filename.lower().endswith('.csv') and not info.filename.startswith('__MACOSX/')
+                )
+            files += [ImportFile(f'{file_doc.file_name}/{member}', path, member) for member in members]
+        return files
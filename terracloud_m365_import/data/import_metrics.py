@@ -0,0 +1,184 @@
+import frappe
+import resource
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+@dataclass
+class StageMetrics:
+    """Messwerte einer Stufe der Import-Pipeline."""
+    name: str
+    wall_time: float = 0.0
+    queries: int = 0
+    rows_in: int = 0
+    rows_out: int = 0
+    peak_memory: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Verarbeitete Zeilen pro Sekunde."""
+        return self.rows_in / self.wall_time if self.wall_time else 0.0
+
+class ImportMetrics:
+    '''
+    Misst Laufzeit und Zeilenanzahl je Stufe der Import-Pipeline
+    (parse, skip_existing, validate, filter_new, plans, subscriptions, invoices).
+
+    Eine Stufe kann mehrfach betreten werden (z.B. einmal pro Block); die Werte werden aufsummiert.
+
+    Die Messung ist so günstig, dass sie im Produktivbetrieb aktiv bleiben kann:
+    SQL-Abfragen werden über einen Zähler um frappe.db.sql erfasst (siehe track_queries),
+    der Speicher über den maximalen RSS-Wert des Prozesses (getrusage, ohne tracemalloc).
+    '''
+    def __init__(self):
+        self.stages: dict[str, StageMetrics] = {}
+        self.queries = 0
+
+    @contextmanager
+    def track_queries(self):
+        '''
+        Zählt alle SQL-Abfragen über frappe.db.sql, solange der Block läuft.
+        '''
+        db = frappe.db
+        sql = db.sql
+
+        def counting_sql(*args, **kwargs):
+            self.queries += 1
+            return sql(*args, **kwargs)
+
+        db.sql = counting_sql
+        try:
+            yield
+        finally:
+            # Die Instanz-Überschreibung entfernen, damit wieder die Methode der Klasse greift
+            del db.sql
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = 0):
+        '''
+        Misst einen Abschnitt einer Stufe.
+
+        Args:
+            name (str): Der Name der Stufe.
+            rows_in (int): Die Anzahl der Zeilen, die in den Abschnitt eingehen.
+
+        Yields:
+            StageMetrics: Die Messwerte der Stufe, z.B. um rows_out zu erhöhen.
+        '''
+        metrics = self._get_stage(name)
+        metrics.rows_in += rows_in
+        queries = self.queries
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics.wall_time += time.perf_counter() - start
+            metrics.queries += self.queries - queries
+            metrics.peak_memory = max(metrics.peak_memory, ImportMetrics.get_peak_memory())
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterator:
+        '''
+        Misst die Zeit, die ein (lazy) Datenstrom zum Liefern seiner Elemente benötigt.
+        Die gelieferten Elemente zählen als rows_out der Stufe.
+
+        Args:
+            name (str): Der Name der Stufe.
+            iterable (Iterable): Der Datenstrom.
+
+        Yields:
+            Die Elemente des Datenstroms.
+        '''
+        metrics = self._get_stage(name)
+        iterator = iter(iterable)
+        try:
+            while True:
+                queries = self.queries
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    metrics.wall_time += time.perf_counter() - start
+                    metrics.queries += self.queries - queries
+                metrics.rows_out += 1
+                yield item
+        finally:
+            metrics.peak_memory = max(metrics.peak_memory, ImportMetrics.get_peak_memory())
+
+    def count(self, name: str, iterable: Iterable) -> Iterator:
+        '''
+        Zählt die Elemente eines Datenstroms als rows_in der Stufe, ohne Zeit zu messen.
+
+        Args:
+            name (str): Der Name der Stufe.
+            iterable (Iterable): Der Datenstrom.
+
+        Yields:
+            Die Elemente des Datenstroms.
+        '''
+        metrics = self._get_stage(name)
+        for item in iterable:
+            metrics.rows_in += 1
+            yield item
+
+    def as_dict(self) -> dict[str, dict]:
+        '''
+        Gibt die Messwerte aller Stufen zurück.
+
+        Returns:
+            dict[str, dict]: Messwerte je Stufe.
+        '''
+        return {
+            name: {
+                'wall_time': round(metrics.wall_time, 4),
+                'queries': metrics.queries,
+                'rows_in': metrics.rows_in,
+                'rows_out': metrics.rows_out,
+                'peak_memory': round(metrics.peak_memory, 1),
+                'throughput': round(metrics.throughput, 1)
+            }
+            for name, metrics in self.stages.items()
+        }
+
+    def save(self, terracloud_import: str, shard_index: int = 0) -> None:
+        '''
+        Speichert die Messwerte als Zeilen der Tabelle 'metrics' am Terracloud Import.
+        Frühere Messwerte desselben Teils (Shard) werden ersetzt.
+        Es wird nur die Kindtabelle geschrieben, nicht der ganze Import.
+
+        Args:
+            terracloud_import (str): Der Name des Terracloud Imports.
+            shard_index (int): Der Teil des Imports.
+        '''
+        frappe.db.delete('Terracloud Import Metric', {
+            'parenttype': 'Terracloud Import',
+            'parent': terracloud_import,
+            'shard_index': shard_index
+        })
+        for index, metrics in enumerate(self.stages.values(), start=1):
+            frappe.get_doc({
+                'doctype': 'Terracloud Import Metric',
+                'parenttype': 'Terracloud Import',
+                'parentfield': 'metrics',
+                'parent': terracloud_import,
+                'idx': shard_index * len(self.stages) + index,
+                'shard_index': shard_index,
+                'stage': metrics.name,
+                'wall_time': metrics.wall_time,
+                'queries': metrics.queries,
+                'rows_in': metrics.rows_in,
+                'rows_out': metrics.rows_out,
+                'peak_memory': metrics.peak_memory
+            }).db_insert()
+
+    @staticmethod
+    def get_peak_memory() -> float:
+        '''Gibt den bisher maximalen Speicherverbrauch (RSS) des Prozesses in MB zurück.'''
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _get_stage(self, name: str) -> StageMetrics:
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
@@ -0,0 +1,70 @@
+from frappe.model.document import Document
+
+class ImportPreview:
+    '''
+    Sammelt die Ergebnisse eines Probelaufs (Dry-Run) des Imports.
+
+    Statt die vorgemerkten Dokumente im Speicher zu halten, werden nur Anzahlen und Summen
+    pro Kunde fortgeschrieben. Der Speicherbedarf hängt daher nur von der Anzahl der Kunden ab.
+    '''
+    def __init__(self):
+        self._customers: dict[str, dict] = {}
+        self.log: list[dict] = []
+
+    def add(self, doc: Document, action: str) -> None:
+        '''
+        Erfasst ein Dokument, das beim echten Import geschrieben würde.
+
+        Args:
+            doc (Document): Das Dokument.
+            action (str): 'insert' für neue, 'save' für geänderte Dokumente.
+        '''
+        if doc.doctype == 'Subscription Plan':
+            self._get_customer(doc.customer)['plans'] += 1
+        elif doc.doctype == 'Subscription':
+            key = 'new_subscriptions' if action == 'insert' else 'updated_subscriptions'
+            self._get_customer(doc.party)[key] += 1
+        elif doc.doctype in ('Sales Invoice', 'Terracloud Invoice Intent'):
+            customer = self._get_customer(doc.customer)
+            customer['invoices'] += 1
+            customer['invoice_total'] += sum((item.qty or 0) * (item.rate or 0) for item in doc.get('items'))
+
+    def add_log_entry(self, timestamp: str, status: str, entry: str, error_reason: str, source_file: str = None) -> None:
+        '''
+        Erfasst einen Log-Eintrag, der beim echten Import geschrieben würde.
+        '''
+        self.log.append({'timestamp': timestamp, 'status': status, 'entry': entry, 'error_reason': error_reason,
+                         'source_file': source_file})
+
+    def as_dict(self) -> dict:
+        '''
+        Gibt den Bericht des Probelaufs zurück.
+
+        Returns:
+            dict: Zahlen pro Kunde ('customers'), Gesamtsummen ('totals') und die Log-Einträge ('log').
+        '''
+        customers = []
+        totals = ImportPreview._empty_counts()
+        for customer_no in sorted(self._customers):
+            counts = self._customers[customer_no]
+            for key in totals:
+                totals[key] += counts[key]
+            customers.append({'customer': customer_no, **counts, 'invoice_total': round(counts['invoice_total'], 2)})
+        totals['invoice_total'] = round(totals['invoice_total'], 2)
+
+        return {'customers': customers, 'totals': totals, 'log': self.log}
+
+    def _get_customer(self, customer_no: str) -> dict:
+        if customer_no not in self._customers:
+            self._customers[customer_no] = ImportPreview._empty_counts()
+        return self._customers[customer_no]
+
+    @staticmethod
+    def _empty_counts() -> dict:
+        return {
+            'plans': 0,
+            'new_subscriptions': 0,
+            'updated_subscriptions': 0,
+            'invoices': 0,
+            'invoice_total': 0.0
+        }
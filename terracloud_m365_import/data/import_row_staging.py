@@ -0,0 +1,227 @@
+import frappe
+import hashlib
+import zlib
+from contextlib import contextmanager
+from typing import Iterator
+from .order import Order, PriceType
+from .order_factory import OrderFactory
+from .import_file import ImportFile
+from terracloud_m365_import.logger import Logger, Status
+
+class ImportRowStaging:
+    '''
+    Hält die Zeilen der CSV-Dateien eines Imports im DocType 'Terracloud Import Row'.
+
+    Die Dateien werden pro Import nur einmal gelesen (siehe stage). Jede Zeile wird mit typisierten
+    Spalten, ihrer Datei, einer über alle Dateien fortlaufenden Zeilennummer und einem Status
+    gespeichert; nicht umwandelbare Zeilen als 'Ungültig'.
+    Die Teile (Shards) eines Imports lesen nur ihre eigenen Kunden über den Shard-Schlüssel
+    (siehe OrderImporter.get_shard).
+
+    Nach jedem Block wird der Status der Zeilen gesammelt per SQL gesetzt und mit dem Subscription Plan
+    und der Subscription verknüpft (siehe update_states). Erneute Läufe lesen nur Zeilen, die noch
+    ausstehen oder fehlerhaft waren.
+    '''
+    FIELDS = ['name', 'creation', 'modified', 'owner', 'modified_by', 'docstatus',
+              'terracloud_import', 'row_no', 'source_file', 'shard_key', 'state', 'customer_no', 'order_no',
+              'article_no', 'quantity', 'start_date', 'price_type', 'error']
+
+    # Anzahl der Zeilen pro Bulk-Insert
+    INSERT_SIZE = 1000
+
+    # Maximale Wartezeit, während ein anderer Teil die Datei einliest (Sekunden)
+    LOCK_TIMEOUT = 3600
+
+    # Zeilen, die (erneut) verarbeitet werden
+    OPEN_STATES = ('Ausstehend', 'Fehlerhaft')
+
+    # Eine Seite offener Zeilen eines Teils (siehe iter_orders)
+    ORDERS_QUERY = '''
+        SELECT row_no, source_file, customer_no, order_no, article_no, quantity, start_date, price_type
+        FROM `tabTerracloud Import Row`
+        WHERE terracloud_import = %(terracloud_import)s
+            AND row_no > %(last_row)s
+            AND MOD(shard_key, %(shard_count)s) = %(shard_index)s
+            AND state IN %(states)s
+        ORDER BY row_no
+        LIMIT %(page_size)s
+    '''
+
+    # Status und Verknüpfungen der offenen Zeilen eines Blocks (siehe update_states)
+    STATES_UPDATE = '''
+        UPDATE `tabTerracloud Import Row` r
+        LEFT JOIN `tabSubscription Plan` p ON p.seller_orderno = r.order_no
+        LEFT JOIN `tabSubscription Plan Detail` d ON d.plan = p.name AND d.parenttype = 'Subscription'
+        SET r.subscription_plan = p.name,
+            r.subscription = d.parent,
+            r.state = CASE
+                WHEN r.row_no IN %(processed)s THEN 'Verarbeitet'
+                WHEN d.parent IS NULL THEN 'Fehlerhaft'
+                ELSE 'Übersprungen'
+            END
+        WHERE r.terracloud_import = %(terracloud_import)s
+            AND r.row_no > %(start_row)s
+            AND r.row_no <= %(end_row)s
+            AND MOD(r.shard_key, %(shard_count)s) = %(shard_index)s
+            AND r.state IN %(states)s
+    '''
+
+    def __init__(self, terracloud_import: str, logger: Logger, shard_index: int = 0, shard_count: int = 1):
+        '''
+        Initialisiert das Staging eines Imports.
+
+        Args:
+            terracloud_import (str): Der Name des Terracloud Imports.
+            logger (Logger): Der Logger des Imports.
+            shard_index (int): Der Teil des Imports, dessen Zeilen gelesen werden.
+            shard_count (int): Die Anzahl der Teile.
+        '''
+        self.terracloud_import = terracloud_import
+        self.logger = logger
+        self.shard_index = shard_index
+        self.shard_count = max(shard_count or 1, 1)
+
+    @contextmanager
+    def lock(self):
+        '''
+        Verhindert, dass mehrere Teile eines Imports die Datei gleichzeitig einlesen.
+        Verwendet eine benannte Sperre von MariaDB; andere Datenbanken werden nicht gesperrt.
+
+        Raises:
+            frappe.QueryTimeoutError: Falls die Sperre nicht rechtzeitig frei wird.
+        '''
+        if frappe.db.db_type != 'mariadb':
+            yield
+            return
+
+        lock_name = 'terracloud:' + hashlib.sha1(f'{frappe.conf.db_name}:{self.terracloud_import}'.encode()).hexdigest()
+        if not frappe.db.sql('SELECT GET_LOCK(%s, %s)', (lock_name, ImportRowStaging.LOCK_TIMEOUT))[0][0]:
+            raise frappe.QueryTimeoutError(f'Die Datei des Imports {self.terracloud_import} wird seit {ImportRowStaging.LOCK_TIMEOUT} Sekunden eingelesen')
+        try:
+            yield
+        finally:
+            frappe.db.sql('SELECT RELEASE_LOCK(%s)', (lock_name,))
+
+    def is_staged(self) -> bool:
+        '''Prüft, ob die Zeilen des Imports bereits gespeichert wurden.'''
+        return bool(frappe.db.exists('Terracloud Import Row', {'terracloud_import': self.terracloud_import}))
+
+    def stage(self, files: list[ImportFile]) -> int:
+        '''
+        Liest die CSV-Dateien nacheinander ein und speichert alle Zeilen (aller Teile) per Bulk-Insert.
+        Zeilen, die nicht umgewandelt werden können, werden geloggt und als 'Ungültig' gespeichert.
+        Es wird nicht committet.
+
+        Args:
+            files (list[ImportFile]): Die CSV-Dateien des Imports.
+
+        Returns:
+            int: Die Anzahl der gespeicherten Zeilen.
+        '''
+        now = frappe.utils.now()
+        user = frappe.session.user
+
+        row_count = 0
+        for import_file in files:
+            self.logger.source_file = import_file.name
+            rows = enumerate(OrderFactory._parse_csv(import_file), start=row_count + 1)
+            for block in OrderFactory.chunked(rows, ImportRowStaging.INSERT_SIZE):
+                row_nos, block_rows = zip(*block)
+                values = []
+                for row_no, row, result in zip(row_nos, block_rows, OrderFactory.convert_rows(list(block_rows), list(row_nos))):
+                    if isinstance(result, Exception):
+                        self.logger.log_status(Status.ERROR, row.get('Bestellnummer'), str(result))
+                        typed = ('Ungültig', row.get('CustomID'), row.get('Bestellnummer'), row.get('Artikelnummer'),
+                                 None, None, None, str(result))
+                    else:
+                        typed = ('Ausstehend', result.customer_no, result.order_no, result.article_no,
+                                 result.quantity, result.start_date, result.price_type.value, None)
+
+                    values.append((frappe.generate_hash(length=10), now, now, user, user, 0, self.terracloud_import,
+                                   row_no, import_file.name, ImportRowStaging.get_shard_key(row.get('CustomID')), *typed))
+
+                frappe.db.bulk_insert('Terracloud Import Row', ImportRowStaging.FIELDS, values)
+                row_count += len(values)
+
+        self.logger.source_file = None
+        return row_count
+
+    def iter_orders(self, start_row: int = 0, page_size: int = OrderFactory.CHUNK_SIZE) -> Iterator[Order]:
+        '''
+        Liest die offenen Zeilen des Teils nach der Zeilennummer sortiert als Bestellungen.
+        Es wird seitenweise über die Zeilennummer gelesen, sodass immer nur eine Seite im Speicher ist.
+
+        Args:
+            start_row (int): Nur Zeilen nach dieser Zeilennummer lesen (siehe ImportCheckpoint).
+            page_size (int): Die Anzahl der Zeilen pro Abfrage.
+
+        Yields:
+            Order: Die (noch nicht validierte) Bestellung mit Zeilennummer.
+        '''
+        last_row = start_row
+        while True:
+            rows = frappe.db.sql(ImportRowStaging.ORDERS_QUERY, {
+                'terracloud_import': self.terracloud_import,
+                'last_row': last_row,
+                'shard_count': self.shard_count,
+                'shard_index': self.shard_index,
+                'states': ImportRowStaging.OPEN_STATES,
+                'page_size': page_size
+            }, as_dict=True)
+
+            for row in rows:
+                yield Order(
+                    customer_no=row.customer_no,
+                    order_no=row.order_no,
+                    article_no=row.article_no,
+                    quantity=row.quantity,
+                    start_date=row.start_date,
+                    price_type=PriceType(row.price_type),
+                    row_no=row.row_no,
+                    source_file=row.source_file
+                )
+
+            if len(rows) < page_size:
+                return
+            last_row = rows[-1].row_no
+
+    def update_states(self, start_row: int, end_row: int, orders: list[Order]) -> None:
+        '''
+        Setzt den Status der offenen Zeilen eines Blocks mit einer Abfrage und verknüpft sie
+        mit Subscription Plan und Subscription (Abgleich über die Bestellnummer).
+
+        - Verarbeitet: Die Bestellung hat in diesem Lauf eine Subscription erhalten.
+        - Übersprungen: Der Plan existierte bereits und ist einer Subscription zugeordnet.
+        - Fehlerhaft: Alle übrigen Zeilen (der Grund steht im Log des Imports).
+
+        Args:
+            start_row (int): Die letzte Zeile vor dem Block.
+            end_row (int): Die letzte Zeile des Blocks.
+            orders (list[Order]): Die Bestellungen des Blocks.
+        '''
+        # Platzhalter, da eine leere IN-Liste ungültig ist
+        processed = tuple(order.row_no for order in orders if order.subscription) or (0,)
+
+        frappe.db.sql(ImportRowStaging.STATES_UPDATE, {
+            'processed': processed,
+            'terracloud_import': self.terracloud_import,
+            'start_row': start_row,
+            'end_row': end_row,
+            'shard_count': self.shard_count,
+            'shard_index': self.shard_index,
+            'states': ImportRowStaging.OPEN_STATES
+        })
+
+    @staticmethod
+    def get_shard_key(customer_no: str) -> int:
+        '''
+        Berechnet den Shard-Schlüssel eines Kunden. Der Teil ergibt sich daraus modulo der Anzahl
+        der Teile, wie bei OrderImporter.get_shard.
+
+        Args:
+            customer_no (str): Die Kundennummer.
+
+        Returns:
+            int: Der Shard-Schlüssel.
+        '''
+        return zlib.crc32((customer_no or '').casefold().encode())
@@ -0,0 +1,207 @@
+import csv
+import frappe
+import io
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from frappe.model.document import Document
+from .order import PriceType
+from .import_file import ImportFile
+from .subscription_factory import SubscriptionFactory
+
+@dataclass
+class ImportEstimate:
+    """Geschätzter Aufwand eines Imports."""
+    rows: int
+    periods: int
+    seconds: float
+
+@dataclass
+class ImportPlan:
+    """Aufteilung eines Imports auf Hintergrund-Jobs."""
+    shard_count: int
+    timeout: int
+    queue: str
+
+class ImportScheduler:
+    '''
+    Plant die Hintergrund-Jobs eines Imports anhand des geschätzten Aufwands.
+
+    Der Aufwand wird aus einer Stichprobe am Anfang jeder CSV-Datei hochgerechnet: Anzahl der Zeilen
+    und Anzahl der nachzuberechnenden Abrechnungszeiträume. Die Laufzeit pro Zeile und pro Zeitraum
+    stammt aus den Messwerten der letzten abgeschlossenen Importe (siehe ImportMetrics).
+
+    Die Kunden werden auf so viele Teile verteilt, dass jeder Job etwa 'target_job_duration' Sekunden
+    läuft (höchstens 'import_shards' Teile, siehe Terracloud Import Settings). Timeout und Queue
+    richten sich nach der geschätzten Laufzeit eines Teils.
+    '''
+    # Bytes am Anfang der Datei, aus denen hochgerechnet wird
+    SAMPLE_SIZE = 1024 * 1024
+
+    # Erfahrungswerte, solange keine Messwerte früherer Importe vorliegen
+    SECONDS_PER_ROW = 0.05
+    SECONDS_PER_PERIOD = 0.02
+
+    # Anzahl der abgeschlossenen Importe, deren Messwerte berücksichtigt werden
+    CALIBRATION_IMPORTS = 5
+
+    # Spielraum für ungleich verteilte Teile und langsame Server
+    TIMEOUT_FACTOR = 3
+    MIN_TIMEOUT = 300
+
+    # Queues nach maximaler Laufzeit; längere Jobs laufen in 'long'
+    QUEUES = [(300, 'short'), (1500, 'default')]
+
+    # Höchstzahl der Teile, solange 'import_shards' nicht gesetzt ist (übliche Anzahl an Workern)
+    DEFAULT_MAX_SHARDS = 4
+
+    def __init__(self, settings: Document):
+        '''
+        Initialisiert die Planung.
+
+        Args:
+            settings (Document): Die globalen Einstellungen für den Import.
+        '''
+        self.settings = settings
+
+    def estimate(self, files: list[ImportFile]) -> ImportEstimate:
+        '''
+        Schätzt den Aufwand eines Imports, ohne die Dateien vollständig zu lesen.
+
+        Args:
+            files (list[ImportFile]): Die CSV-Dateien des Imports.
+
+        Returns:
+            ImportEstimate: Der geschätzte Aufwand.
+        '''
+        estimated_rows = 0
+        estimated_periods = 0
+        for import_file in files:
+            rows, periods = ImportScheduler._estimate_file(import_file)
+            estimated_rows += rows
+            estimated_periods += periods
+
+        seconds_per_row, seconds_per_period = self._get_rates()
+        return ImportEstimate(
+            rows=estimated_rows,
+            periods=estimated_periods,
+            seconds=estimated_rows * seconds_per_row + estimated_periods * seconds_per_period
+        )
+
+    def plan(self, estimate: ImportEstimate, shard_count: int = None) -> ImportPlan:
+        '''
+        Verteilt den geschätzten Aufwand auf Hintergrund-Jobs.
+
+        Args:
+            estimate (ImportEstimate): Der geschätzte Aufwand.
+            shard_count (int): Optional: Feste Anzahl an Teilen (z.B. beim Fortsetzen eines Imports).
+
+        Returns:
+            ImportPlan: Anzahl der Teile, Timeout und Queue der Jobs.
+        '''
+        if not shard_count:
+            max_shards = self.settings.import_shards or ImportScheduler.DEFAULT_MAX_SHARDS
+            target_duration = max(self.settings.target_job_duration or 900, 1)
+            shard_count = min(max(math.ceil(estimate.seconds / target_duration), 1), max_shards)
+
+        timeout = max(math.ceil(estimate.seconds / shard_count * ImportScheduler.TIMEOUT_FACTOR), ImportScheduler.MIN_TIMEOUT)
+        queue = next((queue for max_timeout, queue in ImportScheduler.QUEUES if timeout <= max_timeout), 'long')
+        return ImportPlan(shard_count, timeout, queue)
+
+    @staticmethod
+    def _estimate_file(import_file: ImportFile) -> tuple[int, int]:
+        '''
+        Rechnet Zeilen und Abrechnungszeiträume einer CSV-Datei aus einer Stichprobe hoch.
+
+        Args:
+            import_file (ImportFile): Die CSV-Datei.
+
+        Returns:
+            tuple[int, int]: Geschätzte Anzahl der Zeilen und der Abrechnungszeiträume.
+        '''
+        file_size = import_file.size
+        with import_file.open_binary() as file:
+            sample = file.read(ImportScheduler.SAMPLE_SIZE)
+
+        # Nur vollständige Zeilen auswerten
+        if len(sample) < file_size:
+            sample = sample[:sample.rfind(b'\n') + 1]
+
+        rows = list(csv.DictReader(io.StringIO(sample.decode('latin-1')), delimiter=';'))
+        periods = sum(ImportScheduler._count_periods(row) for row in rows)
+
+        # Auf die ganze Datei hochrechnen
+        factor = file_size / len(sample) if sample else 0
+        return round(len(rows) * factor), round(periods * factor)
+
+    def _get_rates(self) -> tuple[float, float]:
+        '''
+        Ermittelt die Laufzeit pro Zeile und pro Abrechnungszeitraum aus den Messwerten
+        der letzten abgeschlossenen Importe.
+
+        Returns:
+            tuple[float, float]: Sekunden pro Zeile und Sekunden pro Abrechnungszeitraum.
+        '''
+        imports = frappe.get_all(
+            'Terracloud Import',
+            filters={'import_status': 'Abgeschlossen'},
+            order_by='modified desc',
+            limit=ImportScheduler.CALIBRATION_IMPORTS,
+            pluck='name'
+        )
+        if not imports:
+            return ImportScheduler.SECONDS_PER_ROW, ImportScheduler.SECONDS_PER_PERIOD
+
+        stages = {
+            stage.stage: stage
+            for stage in frappe.get_all(
+                'Terracloud Import Metric',
+                filters={'parenttype': 'Terracloud Import', 'parent': ('in', imports)},
+                fields=['stage', 'sum(wall_time) as wall_time', 'sum(rows_in) as rows_in', 'sum(rows_out) as rows_out'],
+                group_by='stage'
+            )
+        }
+
+        seconds_per_row = ImportScheduler.SECONDS_PER_ROW
+        parse = stages.get('parse')
+        if parse and parse.rows_in:
+            wall_time = sum(stage.wall_time or 0 for name, stage in stages.items() if name != 'invoices')
+            seconds_per_row = wall_time / parse.rows_in
+
+        seconds_per_period = ImportScheduler.SECONDS_PER_PERIOD
+        invoices = stages.get('invoices')
+        if invoices and invoices.rows_out:
+            seconds_per_period = (invoices.wall_time or 0) / invoices.rows_out
+
+        return seconds_per_row, seconds_per_period
+
+    @staticmethod
+    def _count_periods(row: dict) -> int:
+        '''
+        Schätzt die Anzahl der nachzuberechnenden Abrechnungszeiträume einer CSV-Zeile
+        (vom Bestelldatum bis zum Start der Subscription, siehe BillingEngine).
+
+        Args:
+            row (dict): Die CSV-Zeile.
+
+        Returns:
+            int: Die Anzahl der Zeiträume; 0 für ungültige Zeilen.
+        '''
+        try:
+            start_date = datetime.strptime(row['MicrosoftSubscriptionStartDate'], '%d.%m.%Y %H:%M:%S').date()
+            price_type = PriceType(row['Preistyp'])
+        except Exception:
+            return 0
+
+        if price_type == PriceType.MONTHLY:
+            end_date = SubscriptionFactory.get_next_month_first_day()
+        else:
+            end_date = SubscriptionFactory.get_next_year_day()
+        if start_date >= end_date:
+            return 0
+
+        delta = relativedelta(end_date, start_date)
+        if price_type == PriceType.MONTHLY:
+            return delta.years * 12 + delta.months + (1 if delta.days else 0)
+        return delta.years + (1 if delta.months or delta.days else 0)
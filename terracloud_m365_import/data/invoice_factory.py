@@ -2,58 +2,125 @@ from .factory_base import FactoryBase
 import frappe
 from frappe.model.document import Document
 from .order import Order, PriceType
+from .price_index import PriceIndex
+from .item_cache import ItemCache
+from .bulk_writer import BulkWriter
+from .import_metrics import ImportMetrics
+from .billing_engine import BillingEngine, BillingPeriod
+from terracloud_m365_import.logger import Logger, Status
 from datetime import datetime, date, timedelta
-from dateutil.relativedelta import relativedelta
-import calendar
 
 class InvoiceFactory(FactoryBase):
     '''
     Stellt Methoden zur Generierung von Rechnungen zur Verfügung.
+
+    Mit 'stage_invoices' (siehe Terracloud Import Settings) werden statt Sales Invoices nur
+    Vormerkungen ('Terracloud Invoice Intent') mit denselben Feldern und Positionen geschrieben.
+    Die Rechnungen erstellt später der InvoiceMaterializer.
     '''
+    def __init__(self, settings: Document, logger: Logger, writer: BulkWriter = None, metrics: ImportMetrics = None):
+        super().__init__(settings, logger, writer, metrics)
+        self._price_index: PriceIndex = None
+        self.item_cache = ItemCache()
+        self.billing_engine = BillingEngine(self._get_full_unit_price)
 
-    def create_invoice(self, order: Order, from_date: date, to_date: date) -> Document:
+    def create_invoice(self, order: Order, from_date: date, to_date: date, unit_price: float | None) -> Document:
         '''
-        Erstellt eine Rechnung für eine Bestellung und berechnet dabei den fälligen Betrag.
+        Erstellt eine Rechnung für eine Bestellung mit dem vorab berechneten Betrag.
 
         Args:
             order (Order): Die Bestellung.
             from_date (date): Das Startdatum des Abrechnungszeitraums.
             to_date (date): Das Enddatum des Abrechnungszeitraums.
+            unit_price (float | None): Der Preis pro Stück (siehe BillingEngine.get_missed_periods).
         '''
-        if order.subscription_plan.seller_orderno == 'B2024072100055':
-            dummy = 123
+        # Rechnung erstellen
+        invoice = self._new_invoice(order, from_date, to_date)
+
+        # Rechnungspositionen hinzufügen
+        self._append_item(invoice, order, from_date, to_date, unit_price)
 
-        if order.customer_no == '10005':
-            dummy = 123
+        # Rechnung speichern
+        self.writer.insert(invoice)
+        return invoice
+
+    def create_consolidated_invoice(self, periods: list[BillingPeriod]) -> Document:
+        '''
+        Erstellt eine gemeinsame Rechnung für mehrere Abrechnungszeiträume derselben Subscription,
+        mit einer Rechnungsposition pro Bestellung und Zeitraum.
+        Der Rechnungszeitraum umfasst alle enthaltenen Zeiträume; der Zeitraum jeder Position
+        steht in ihrer Beschreibung.
 
+        Args:
+            periods (list[BillingPeriod]): Die Zeiträume samt Preis pro Stück (siehe BillingEngine).
+        '''
         # Rechnung erstellen
-        invoice = frappe.new_doc('Sales Invoice')
+        invoice = self._new_invoice(
+            periods[0].order,
+            min(period.from_date for period in periods),
+            max(period.to_date for period in periods)
+        )
+
+        # Rechnungspositionen hinzufügen
+        for period in periods:
+            self._append_item(invoice, period.order, period.from_date, period.to_date, period.unit_price)
+
+        # Rechnung speichern
+        self.writer.insert(invoice)
+        return invoice
+
+    def _new_invoice(self, order: Order, from_date: date, to_date: date) -> Document:
+        '''
+        Erstellt eine neue Rechnung (ohne Positionen) für die Subscription einer Bestellung.
+        Mit 'stage_invoices' wird stattdessen eine Vormerkung erstellt; das Fälligkeitsdatum
+        wird dann erst beim Erstellen der Rechnung gesetzt.
+
+        Args:
+            order (Order): Die Bestellung.
+            from_date (date): Das Startdatum des Abrechnungszeitraums.
+            to_date (date): Das Enddatum des Abrechnungszeitraums.
+
+        Returns:
+            Document: Die noch nicht gespeicherte Rechnung bzw. Vormerkung.
+        '''
+        if self.settings.stage_invoices:
+            invoice = frappe.new_doc('Terracloud Invoice Intent')
+            invoice.terracloud_import = self.logger.terracloud_import.name
+        else:
+            invoice = frappe.new_doc('Sales Invoice')
+            invoice.due_date = datetime.now().date()
+
         invoice.title = order.subscription.invoice_title
         invoice.customer = order.customer_no
-        invoice.due_date = datetime.now().date()
         invoice.taxes_and_charges = order.subscription.sales_tax_template
         invoice.subscription = order.subscription.name
         invoice.from_date = from_date
         invoice.to_date = to_date
+        return invoice
+
+    def _append_item(self, invoice: Document, order: Order, from_date: date, to_date: date, unit_price: float | None) -> None:
+        '''
+        Fügt einer Rechnung die Position einer Bestellung für einen Abrechnungszeitraum hinzu.
 
+        Args:
+            invoice (Document): Die Rechnung.
+            order (Order): Die Bestellung.
+            from_date (date): Das Startdatum des Abrechnungszeitraums.
+            to_date (date): Das Enddatum des Abrechnungszeitraums.
+            unit_price (float | None): Der Preis pro Stück.
+        '''
         # Artikel laden
-        item = frappe.get_doc('Item', order.article_no)
+        item = self.item_cache.get(order.article_no)
 
-        # Rechnungspositionen hinzufügen
         invoice.append('items', {
             'item_code': item.name,
             'item_name': item.item_name,
             'description': self._update_item_description(item.description, from_date, to_date),
             'qty': order.quantity,
             'uom': item.stock_uom,
-            'rate': self.get_unit_price(order, from_date, to_date)
+            'rate': unit_price
         })
 
-        # Rechnung speichern
-        invoice.insert()
-        frappe.db.commit()
-        return invoice
-
     def get_unit_price(self, order: Order, from_date: date, to_date: date) -> float | None:
         '''
         Berechnet den Preis für eine Bestellung (pro Stück) im gegebenen Zeitraum.
@@ -66,56 +133,8 @@ class InvoiceFactory(FactoryBase):
         Returns:
             float: Der Preis für die Bestellung im gegebenen Zeitraum. None, falls kein Preis gefunden wurde.
         '''
-        # Feststellen, ob ein ganzer Preis oder anteiliger berechnet werden muss
-        if order.price_type == PriceType.MONTHLY and to_date == from_date + relativedelta(months=1, days=-1):
-            bill_full_price = True
-        elif order.price_type == PriceType.YEARLY and to_date == from_date + relativedelta(years=1, days=-1):
-            bill_full_price = True
-        else:
-            bill_full_price = False
-
-        # Preis pro Stück berechnen
-        unit_price = self._get_full_unit_price(order, from_date) if bill_full_price \
-            else self._get_partial_unit_price(order, from_date, to_date)
-
-        return unit_price
-
-    def _get_partial_unit_price(self, order: Order, from_date: date, to_date: date) -> float | None:
-        '''
-        Berechnet den Preis für eine Bestellung im gegebenen Zeitraum.
-        Der Preis bezieht sich auf ein einzelnes Stück des Artikels.
+        return self.billing_engine.get_unit_price(order, from_date, to_date)
 
-        Args:
-            order (Order): Die Bestellung.
-            from_date (date): Das Startdatum des Abrechnungszeitraums.
-            to_date (date): Das Enddatum des Abrechnungszeitraums.
-
-        Returns:
-            float: Der anteilige Preis für die Bestellung im gegebenen Zeitraum.
-        '''
-        # Zuerst den vollen Preis über die Preisliste holen
-        full_price = self._get_full_unit_price(order, from_date)
-        if not full_price:
-            return None
-
-        delta = to_date - from_date
-        billing_days = delta.days + 1 # Einschließlich beider Tage
-
-        year = from_date.year
-
-        # Anzahl der Tage im Monat oder Jahr berechnen
-        if order.price_type == PriceType.MONTHLY:
-            month = from_date.month
-            all_days = calendar.monthrange(year, month)[1]
-        elif order.price_type == PriceType.YEARLY:
-            all_days = 366 if calendar.isleap(year) else 365
-
-        # Preis pro Tag berechnen
-        daily_price = full_price / all_days
-        billing_price = daily_price * billing_days
-        
-        return round(billing_price, 2)
-    
     def _get_full_unit_price(self, order: Order, valuation_date: date) -> float | None:
         '''
         Berechnet den vollen Preis für einen Artikel anhand des Bewertungsdatums.
@@ -130,37 +149,20 @@ class InvoiceFactory(FactoryBase):
         Returns:
             float: Der volle Preis des Artikels. None, falls kein Preis gefunden wurde.
         '''
-        price_list = self.settings.price_list
-
-        # Kundenspezifischen Preis suchen
-        filters = {
-            'item_code': order.article_no,
-            'customer': order.customer_no,
-            'price_list': price_list,
-            'valid_from': ('<=', valuation_date),
-            'valid_upto': ('>=', valuation_date)
-        }
-        price = frappe.get_value('Item Price', filters, 'price_list_rate')
-        if price:
-            return price
-        
-        # Kein Kundenpreis gefunden -> Allgemeinen Preis suchen
-        filters.pop('customer')
-        price = frappe.get_value('Item Price', filters, 'price_list_rate')
-        if price:
-            return price
-        
-        # Nicht in Gültigkeitszeitraum -> Start-Datum entfernen
-        filters.pop('valid_from')
-        price = frappe.get_value('Item Price', filters, 'price_list_rate')
-        if price:
-            return price
-        
-        # Nicht in Gültigkeitszeitraum -> End-Datum entfernen
-        filters.pop('valid_upto')
-        price = frappe.get_value('Item Price', filters, 'price_list_rate')
-        if price:
-            return price
+        return self.price_index.get_price(order.article_no, order.customer_no, valuation_date)
+
+    @property
+    def price_index(self) -> PriceIndex:
+        '''
+        Gibt den Preisindex der konfigurierten Preisliste zurück.
+        Der Index wird beim ersten Zugriff einmalig geladen.
+
+        Returns:
+            PriceIndex: Der Preisindex.
+        '''
+        if self._price_index is None:
+            self._price_index = PriceIndex(self.settings.price_list)
+        return self._price_index
     
     def _update_item_description(self, description: str, from_date: date, to_date: date) -> str:
         '''
@@ -177,3 +179,10 @@ class InvoiceFactory(FactoryBase):
         description = '' if not description else description # Default-Wert
         description = f"<p><strong><u>Zeitraum:</u></strong><u> {from_date.strftime('%d.%m.%Y')} - {to_date.strftime('%d.%m.%Y')}</u></p>{description}"
         return description
+
+    def flush(self) -> None:
+        '''
+        Schreibt die gesammelten Vormerkungen (siehe 'stage_invoices') und loggt die fehlgeschlagenen.
+        '''
+        for doc, error in self.writer.flush():
+            self.logger.log_status(Status.ERROR, f"{doc.customer} {doc.from_date} - {doc.to_date}", str(error))
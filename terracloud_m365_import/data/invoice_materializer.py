@@ -0,0 +1,129 @@
+import frappe
+import time
+from datetime import datetime
+from frappe.model.document import Document
+from frappe.utils import get_time, now_datetime
+
+class InvoiceMaterializer:
+    '''
+    Erstellt aus den vorgemerkten Rechnungen (DocType 'Terracloud Invoice Intent') echte Sales Invoices.
+
+    Läuft minütlich über den Scheduler (siehe materialize_invoices). Die Rate wird über die Anzahl
+    pro Lauf begrenzt: höchstens 'invoice_rate_limit' Rechnungen, in Blöcken von 'invoice_batch_size'
+    Rechnungen mit einem Commit pro Block, damit Sperren auf Rechnungs- und Buchungstabellen nur kurz
+    gehalten werden. Ist 'stage_invoices' deaktiviert oder nichts vorgemerkt, endet der Lauf sofort.
+    Sind 'off_peak_start' und 'off_peak_end' gesetzt, wird nur in diesem Zeitfenster gearbeitet.
+    '''
+    # Maximale Laufzeit eines Laufs (Sekunden), damit sich die minütlichen Läufe nicht überschneiden
+    MAX_RUNTIME = 50
+
+    def __init__(self, settings: Document):
+        '''
+        Initialisiert die Erstellung.
+
+        Args:
+            settings (Document): Die globalen Einstellungen für den Import.
+        '''
+        self.settings = settings
+
+    def run(self) -> int:
+        '''
+        Erstellt die nächsten vorgemerkten Rechnungen.
+
+        Returns:
+            int: Die Anzahl der verarbeiteten Vormerkungen.
+        '''
+        if not self.settings.stage_invoices or not self.is_off_peak(now_datetime()):
+            return 0
+
+        batch_size = max(self.settings.invoice_batch_size or 20, 1)
+        rate_limit = self.settings.invoice_rate_limit or 0
+
+        processed = 0
+        start = time.monotonic()
+        while not rate_limit or processed < rate_limit:
+            intents = frappe.get_all(
+                'Terracloud Invoice Intent',
+                filters={'status': 'Ausstehend'},
+                order_by='creation asc',
+                limit=min(batch_size, rate_limit - processed) if rate_limit else batch_size,
+                pluck='name'
+            )
+            if not intents:
+                break
+
+            for intent in intents:
+                self._materialize(intent)
+            frappe.db.commit()
+            processed += len(intents)
+
+            if time.monotonic() - start > InvoiceMaterializer.MAX_RUNTIME:
+                break
+
+        return processed
+
+    def is_off_peak(self, now: datetime) -> bool:
+        '''
+        Prüft, ob der Zeitpunkt im konfigurierten Zeitfenster liegt.
+        Ohne Zeitfenster ist jeder Zeitpunkt erlaubt. Fenster über Mitternacht (z.B. 22:00 - 06:00) sind möglich.
+
+        Args:
+            now (datetime): Der Zeitpunkt.
+
+        Returns:
+            bool: True, wenn Rechnungen erstellt werden dürfen.
+        '''
+        if not self.settings.off_peak_start or not self.settings.off_peak_end:
+            return True
+
+        start = get_time(self.settings.off_peak_start)
+        end = get_time(self.settings.off_peak_end)
+        current = now.time()
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+
+    def _materialize(self, intent_name: str) -> None:
+        '''
+        Erstellt die Sales Invoice einer Vormerkung in einem eigenen Savepoint.
+        Fehler werden an der Vormerkung gespeichert, die übrigen Vormerkungen werden weiter verarbeitet.
+
+        Args:
+            intent_name (str): Der Name der Vormerkung.
+        '''
+        intent = frappe.get_doc('Terracloud Invoice Intent', intent_name)
+
+        frappe.db.savepoint('terracloud_invoice_intent')
+        try:
+            invoice = frappe.new_doc('Sales Invoice')
+            invoice.title = intent.title
+            invoice.customer = intent.customer
+            invoice.due_date = datetime.now().date()
+            invoice.taxes_and_charges = intent.taxes_and_charges
+            invoice.subscription = intent.subscription
+            invoice.from_date = intent.from_date
+            invoice.to_date = intent.to_date
+            for item in intent.items:
+                invoice.append('items', {
+                    'item_code': item.item_code,
+                    'item_name': item.item_name,
+                    'description': item.description,
+                    'qty': item.qty,
+                    'uom': item.uom,
+                    'rate': item.rate
+                })
+            invoice.insert()
+        except Exception as e:
+            frappe.db.rollback(save_point='terracloud_invoice_intent')
+            frappe.db.set_value(intent.doctype, intent.name, {'status': 'Fehlgeschlagen', 'error': str(e)})
+            return
+
+        frappe.db.release_savepoint('terracloud_invoice_intent')
+        frappe.db.set_value(intent.doctype, intent.name, {'status': 'Erstellt', 'sales_invoice': invoice.name, 'error': None})
+
+def materialize_invoices() -> None:
+    '''
+    Scheduler-Einstiegspunkt: Erstellt die nächsten vorgemerkten Rechnungen (siehe InvoiceMaterializer).
+    '''
+    settings = frappe.get_single('Terracloud Import Settings')
+    InvoiceMaterializer(settings).run()
@@ -0,0 +1,61 @@
+import frappe
+from typing import Iterable
+
+class ItemCache:
+    '''
+    Hält die für Rechnungspositionen benötigten Artikelstammdaten eines Imports im Speicher.
+
+    Statt für jede Rechnung das komplette Artikel-Dokument zu laden, werden nur die benötigten
+    Felder aller Artikel eines Blocks mit einer Abfrage geladen und danach wiederverwendet.
+    '''
+    FIELDS = ['name', 'item_name', 'description', 'stock_uom']
+
+    def __init__(self):
+        self._items: dict[str, frappe._dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, article_nos: Iterable[str]) -> None:
+        '''
+        Lädt alle noch nicht bekannten Artikel mit einer Abfrage.
+
+        Args:
+            article_nos (Iterable[str]): Die Artikelnummern.
+        '''
+        missing = list({article_no for article_no in article_nos if article_no and ItemCache._key(article_no) not in self._items})
+        if not missing:
+            return
+
+        for item in frappe.get_all('Item', filters={'name': ('in', missing)}, fields=ItemCache.FIELDS):
+            self._items[ItemCache._key(item.name)] = item
+
+    def get(self, article_no: str) -> frappe._dict:
+        '''
+        Gibt die Stammdaten eines Artikels zurück.
+        Nicht vorab geladene Artikel werden einzeln nachgeladen.
+
+        Args:
+            article_no (str): Die Artikelnummer.
+
+        Returns:
+            frappe._dict: Die Felder name, item_name, description und stock_uom.
+
+        Raises:
+            frappe.DoesNotExistError: Falls der Artikel nicht existiert.
+        '''
+        key = ItemCache._key(article_no)
+        if key in self._items:
+            self.hits += 1
+            return self._items[key]
+
+        self.misses += 1
+        item = frappe.db.get_value('Item', article_no, ItemCache.FIELDS, as_dict=True)
+        if not item:
+            raise frappe.DoesNotExistError(f'Item {article_no} not found')
+        self._items[key] = item
+        return item
+
+    @staticmethod
+    def _key(article_no: str) -> str:
+        '''Schlüssel für Vergleiche ohne Beachtung der Groß-/Kleinschreibung (wie in der Datenbank).'''
+        return article_no.casefold()
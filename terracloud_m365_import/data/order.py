@@ -1,8 +1,13 @@
 import frappe
+import hashlib
 from enum import Enum
 from dataclasses import dataclass
 from datetime import date
 from frappe.model.document import Document
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .validation_context import ValidationContext
 
 class PriceType(Enum):
     """Die Preistypen, die in TerraCloud vorkommen."""
@@ -18,14 +23,24 @@ class Order:
     quantity: float
     start_date: date
     price_type: PriceType
+
+    # Zeile der CSV-Datei (siehe ImportRowStaging)
+    row_no: int = None
+
+    # Datei, aus der die Bestellung stammt (siehe ImportFile)
+    source_file: str = None
     
     _subscription_plan: str = None
     _subscription: str = None
 
-    def validate(self) -> bool:
+    def validate(self, context: 'ValidationContext' = None) -> bool:
         """
         Validiert die Bestelldaten.
 
+        Args:
+            context (ValidationContext): Vorab geladene Stammdaten des Imports.
+                Ohne Kontext wird für jede Prüfung die Datenbank abgefragt.
+
         Returns:
             bool: True, wenn die Bestelldaten gültig erscheinen.
 
@@ -37,7 +52,7 @@ class Order:
         # Kundennummer: Darf nicht leer sein und muss in der Datenbank existieren
         if not self.customer_no:
             errors.append('Kundennummer fehlt')
-        elif not frappe.db.exists('Customer', self.customer_no):
+        elif not (context.customer_exists(self.customer_no) if context else frappe.db.exists('Customer', self.customer_no)):
             errors.append(f'Kunde {self.customer_no} nicht gefunden')
 
         # Bestellnummer: Darf nicht leer sein, da sie als ID im Subscription Plan verwendet wird
@@ -47,7 +62,7 @@ class Order:
         # Artikelnummer: Darf nicht leer sein und muss in der Datenbank existieren
         if not self.article_no:
             errors.append('Artikelnummer fehlt')
-        elif not frappe.db.exists('Item', self.article_no):
+        elif not (context.item_exists(self.article_no) if context else frappe.db.exists('Item', self.article_no)):
             errors.append(f'Artikel {self.article_no} nicht gefunden')
 
         # Menge: Muss größer als 0 sein
@@ -85,6 +100,24 @@ class Order:
         """
         self._subscription = subscription
 
+    @property
+    def fingerprint(self) -> str:
+        """
+        Gibt eine Prüfsumme über die importrelevanten CSV-Felder zurück
+        (Menge, Artikel, Preistyp, Startdatum).
+        Stimmt sie mit der des bestehenden Subscription Plans überein, hat sich die Bestellung nicht geändert.
+
+        Returns:
+            str: Die Prüfsumme (SHA-1, hexadezimal).
+        """
+        values = [
+            str(self.quantity),
+            self.article_no or '',
+            self.price_type.value if self.price_type else '',
+            self.start_date.isoformat() if self.start_date else ''
+        ]
+        return hashlib.sha1('|'.join(values).encode()).hexdigest()
+
     @property
     def subscription_plan(self) -> Document:
         """
@@ -2,45 +2,294 @@ from .factory_base import FactoryBase
 import frappe
 from frappe.model.document import Document
 from .order import Order, PriceType
+from .validation_context import ValidationContext
+from .bulk_writer import BulkWriter
+from .import_metrics import ImportMetrics
+from .import_checkpoint import ImportCheckpoint
+from .columnar_converter import ColumnarConverter
+from .import_file import ImportFile
 from datetime import datetime
+from itertools import groupby, islice
+from operator import attrgetter, itemgetter
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
 import csv
 from terracloud_m365_import.logger import Logger, Status
 
+if TYPE_CHECKING:
+    from .import_row_staging import ImportRowStaging
+
 class OrderFactory(FactoryBase):
     """Stellt Methoden zur Generierung von Terracloud Bestellobjekten zur Verfügung."""
 
+    # Anzahl der Bestellungen, die gemeinsam durch die Import-Pipeline laufen
+    CHUNK_SIZE = 500
+
+    # Maximale Anzahl an Werten in einer IN-Liste
+    IN_LIST_SIZE = 500
+
+    def __init__(self, settings: Document, logger: Logger, writer: BulkWriter = None, metrics: ImportMetrics = None):
+        super().__init__(settings, logger, writer, metrics)
+        self.validation_context = ValidationContext()
+        self._seen_order_nos: set[str] = set()
+
+        # Letzte Zeile des zuletzt gelieferten Blocks (siehe ImportCheckpoint)
+        self.chunk_end_row = 0
+
+        # Bestehende Pläne ohne Subscription übernehmen statt sie zu überspringen (siehe filter_new_orders)
+        self.adopt_unattached_plans = False
+
     def create_from_terracloud_csv(self, csv_file_path: str) -> list[Order]:
         """Erstellt Bestellobjekte aus einer CSV-Datei von TerraCloud."""
-        orders = []
+        return [order for chunk in self.iter_from_terracloud_csv(csv_file_path) for order in chunk]
+
+    def iter_from_terracloud_csv(self, csv_file_path: str | list[ImportFile], chunk_size: int = CHUNK_SIZE,
+                                 customer_filter: Callable[[str], bool] = None,
+                                 checkpoint: ImportCheckpoint = None) -> Iterator[list[Order]]:
+        """
+        Liest eine oder mehrere CSV-Dateien von TerraCloud zeilenweise ein und liefert die gültigen
+        Bestellungen in Blöcken fester Größe. Es wird immer nur ein Block im Speicher gehalten,
+        unabhängig von der Größe der Dateien. Mehrere Dateien werden nacheinander gelesen und
+        fortlaufend nummeriert (wie in ImportRowStaging).
+
+        Wird ein Import fortgesetzt, beginnt das Lesen an der Zeile des Checkpoints. Im ersten Block
+        werden die bereits abgeschlossenen Kunden übersprungen und die Pläne der übrigen Kunden,
+        die vor dem Abbruch schon committet wurden, übernommen (siehe filter_new_orders).
+
+        Args:
+            csv_file_path (str | list[ImportFile]): Der Pfad zur CSV-Datei oder die Dateien eines Imports.
+                Bestellungen und Log-Einträge werden dem Namen ihrer ImportFile zugeordnet.
+            chunk_size (int): Die maximale Anzahl an Bestellungen pro Block.
+            customer_filter (Callable[[str], bool]): Optional: Nur Zeilen übernehmen, deren Kundennummer
+                den Filter erfüllt. Andere Zeilen werden weder umgewandelt noch geloggt.
+            checkpoint (ImportCheckpoint): Optional: Der Fortschritt eines abgebrochenen Imports.
+
+        Yields:
+            list[Order]: Die validierten Bestellungen eines Blocks.
+        """
+        files = csv_file_path if isinstance(csv_file_path, list) else [ImportFile(None, csv_file_path)]
+        rows = ((import_file.name, row) for import_file in files for row in OrderFactory._parse_csv(import_file))
+
+        # Bereits verarbeitete Zeilen überspringen, ohne sie umzuwandeln
+        resumed = bool(checkpoint and checkpoint.resumed)
+        self.chunk_end_row = checkpoint.row_offset if resumed else 0
+        rows = (
+            (row_no, source_file, row)
+            for row_no, (source_file, row) in enumerate(islice(rows, self.chunk_end_row, None), start=self.chunk_end_row + 1)
+        )
+        if customer_filter:
+            rows = ((row_no, source_file, row) for row_no, source_file, row in rows if customer_filter(row.get('CustomID')))
 
-        # CSV-Datei einlesen
-        data = OrderFactory._parse_csv(csv_file_path)
+        orders = self.metrics.iterate('parse', self._iter_orders(self.metrics.count('parse', rows), chunk_size))
+        yield from self._iter_chunks(orders, chunk_size, checkpoint if resumed else None)
+
+    def iter_from_staging(self, staging: 'ImportRowStaging', chunk_size: int = CHUNK_SIZE,
+                          checkpoint: ImportCheckpoint = None) -> Iterator[list[Order]]:
+        """
+        Liefert die gültigen Bestellungen aus den gestagten Zeilen eines Imports (siehe ImportRowStaging)
+        in Blöcken fester Größe, wie iter_from_terracloud_csv, ohne die Datei erneut zu lesen.
+
+        Args:
+            staging (ImportRowStaging): Die gestagten Zeilen des Imports bzw. Teils.
+            chunk_size (int): Die maximale Anzahl an Bestellungen pro Block.
+            checkpoint (ImportCheckpoint): Optional: Der Fortschritt eines abgebrochenen Imports.
+
+        Yields:
+            list[Order]: Die validierten Bestellungen eines Blocks.
+        """
+        resumed = bool(checkpoint and checkpoint.resumed)
+        self.chunk_end_row = checkpoint.row_offset if resumed else 0
+
+        orders = self.metrics.iterate('parse', self.metrics.count('parse', staging.iter_orders(self.chunk_end_row, chunk_size)))
+        yield from self._iter_chunks(orders, chunk_size, checkpoint if resumed else None)
+
+    def _iter_chunks(self, orders: Iterable[Order], chunk_size: int, checkpoint: ImportCheckpoint = None) -> Iterator[list[Order]]:
+        """
+        Teilt die Bestellungen in Blöcke und filtert und validiert jeden Block.
+        Ein Block enthält nur Bestellungen einer Datei, damit das Log sie der Datei zuordnet.
+
+        Die letzte Zeile eines Blocks steht beim Liefern in chunk_end_row. Sie wird dem Block selbst
+        entnommen, da groupby beim Dateiwechsel bereits die erste Bestellung der nächsten Datei gelesen hat.
+        Blöcke ohne gültige Bestellungen werden als leere Liste geliefert.
+
+        Args:
+            orders (Iterable[Order]): Die (noch nicht validierten) Bestellungen.
+            chunk_size (int): Die maximale Anzahl an Bestellungen pro Block.
+            checkpoint (ImportCheckpoint): Optional: Der Checkpoint, falls der Import fortgesetzt wird.
+
+        Yields:
+            list[Order]: Die validierten Bestellungen eines Blocks (ggf. leer).
+        """
+        resumed = checkpoint is not None
+        for chunk in OrderFactory.chunked(orders, chunk_size, key=attrgetter('source_file')):
+            self.logger.source_file = chunk[0].source_file
+            self.chunk_end_row = chunk[-1].row_no
+            self.adopt_unattached_plans = resumed
+            if resumed:
+                chunk = [order for order in chunk if not checkpoint.is_completed(order.customer_no)]
+                resumed = False
 
-        # Bestellungen erstellen
-        for row in data:
+            # Bestehende Bestellungen überspringen, bevor weitere Abfragen anfallen
+            with self.metrics.stage('skip_existing', len(chunk)) as stage:
+                chunk = self._skip_existing_orders(chunk)
+                stage.rows_out += len(chunk)
+
+            with self.metrics.stage('validate', len(chunk)) as stage:
+                valid_orders = self._validate_orders(chunk)
+                stage.rows_out += len(valid_orders)
+
+            # Auch leere Blöcke liefern, damit Status und Checkpoint ihrer Zeilen fortgeschrieben werden
+            yield valid_orders
+
+    def _iter_orders(self, rows: Iterable[tuple[int, str, dict]], block_size: int = CHUNK_SIZE) -> Iterator[Order]:
+        """
+        Wandelt CSV-Zeilen blockweise in Bestellobjekte um (siehe convert_rows).
+        Zeilen, die nicht umgewandelt werden können, werden geloggt und übersprungen.
+        Ein Block enthält nur Zeilen einer Datei.
+
+        Args:
+            rows (Iterable[tuple[int, str, dict]]): Die Zeilen der CSV-Dateien mit Nummer und Dateiname.
+            block_size (int): Die Anzahl der Zeilen, die gemeinsam umgewandelt werden.
+
+        Yields:
+            Order: Die (noch nicht validierte) Bestellung.
+        """
+        for block in OrderFactory.chunked(rows, block_size, key=itemgetter(1)):
+            row_nos, source_files, block_rows = zip(*block)
+            self.logger.source_file = source_files[0]
+            for row, result in zip(block_rows, OrderFactory.convert_rows(list(block_rows), list(row_nos))):
+                if isinstance(result, Exception):
+                    self.logger.log_status(Status.ERROR, row.get('Bestellnummer'), str(result))
+                else:
+                    result.source_file = source_files[0]
+                    yield result
+
+    @staticmethod
+    def convert_rows(rows: list[dict], row_nos: list[int]) -> list[Order | Exception]:
+        """
+        Wandelt einen Block von CSV-Zeilen in Bestellobjekte um.
+        Ist pyarrow installiert, werden Datum, Menge und Preistyp spaltenweise umgewandelt
+        (siehe ColumnarConverter), sonst jede Zeile einzeln (siehe order_from_row).
+        Die Fehlermeldungen ungültiger Zeilen sind in beiden Fällen dieselben.
+
+        Args:
+            rows (list[dict]): Die Zeilen der CSV-Datei.
+            row_nos (list[int]): Die Nummern der Zeilen.
+
+        Returns:
+            list[Order | Exception]: Je Zeile die Bestellung oder der Fehler der Umwandlung.
+        """
+        if ColumnarConverter.is_available():
+            return ColumnarConverter.convert(rows, row_nos, OrderFactory.order_from_row)
+
+        results = []
+        for row, row_no in zip(rows, row_nos):
             try:
-                order = Order(
-                    customer_no=row['CustomID'],
-                    order_no=row['Bestellnummer'],
-                    article_no=row['Artikelnummer'],
-                    quantity=float(row['Menge']),
-                    start_date=datetime.strptime(row['MicrosoftSubscriptionStartDate'], '%d.%m.%Y %H:%M:%S').date(),
-                    price_type=PriceType(row['Preistyp'])
-                )
-            
-                # Bestellung validieren
-                order.validate()
+                results.append(OrderFactory.order_from_row(row, row_no))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @staticmethod
+    def order_from_row(row: dict, row_no: int = None) -> Order:
+        """
+        Wandelt eine CSV-Zeile in ein Bestellobjekt um.
+
+        Args:
+            row (dict): Die Zeile der CSV-Datei.
+            row_no (int): Optional: Die Nummer der Zeile.
+
+        Returns:
+            Order: Die (noch nicht validierte) Bestellung.
+
+        Raises:
+            Exception: Falls ein Wert nicht umgewandelt werden kann.
+        """
+        return Order(
+            customer_no=row['CustomID'],
+            order_no=row['Bestellnummer'],
+            article_no=row['Artikelnummer'],
+            quantity=float(row['Menge']),
+            start_date=datetime.strptime(row['MicrosoftSubscriptionStartDate'], '%d.%m.%Y %H:%M:%S').date(),
+            price_type=PriceType(row['Preistyp']),
+            row_no=row_no
+        )
 
+    def _skip_existing_orders(self, orders: list[Order]) -> list[Order]:
+        """
+        Sortiert Bestellungen aus, deren Subscription Plan bereits mit Fingerprint existiert, bevor sie
+        validiert werden. Dafür wird pro Block nur eine Abfrage benötigt.
+        Geänderte Bestellungen werden gesondert geloggt (siehe _log_existing_order).
+
+        Args:
+            orders (list[Order]): Die Bestellungen.
+
+        Returns:
+            list[Order]: Die neuen Bestellungen und die bestehenden ohne Fingerprint.
+        """
+        # Nach einer Wiederaufnahme entscheidet filter_new_orders, welche bestehenden Pläne übernommen werden
+        if self.adopt_unattached_plans:
+            return orders
+
+        fingerprints = self.get_existing_fingerprints([order.order_no for order in orders if order.order_no])
+
+        remaining_orders = []
+        for order in orders:
+            key = (order.order_no or '').casefold()
+            fingerprint = fingerprints.get(key)
+            if fingerprint and key not in self._seen_order_nos:
+                self._seen_order_nos.add(key)
+                self._log_existing_order(order, fingerprint)
+                continue
+            remaining_orders.append(order)
+        return remaining_orders
+
+    def _log_existing_order(self, order: Order, fingerprint: str | None) -> None:
+        """
+        Loggt eine Bestellung, deren Subscription Plan bereits existiert.
+        Weicht der Fingerprint des Plans ab, wurde die Bestellung in TerraCloud geändert (Menge, Artikel,
+        Preistyp oder Startdatum). Die Änderung wird nicht übernommen, sondern mit Status 'Geändert' gemeldet.
+
+        Args:
+            order (Order): Die Bestellung.
+            fingerprint (str | None): Der Fingerprint des bestehenden Plans.
+        """
+        if fingerprint and fingerprint != order.fingerprint:
+            self.logger.log_status(Status.CHANGED, order.order_no, 'Bestellung geändert, die Änderung wird nicht übernommen')
+        else:
+            self.logger.log_status(Status.NEUTRAL, order.order_no, 'Bestellung existiert bereits')
+
+    def _validate_orders(self, orders: list[Order]) -> list[Order]:
+        """
+        Validiert einen Block von Bestellungen.
+        Ungültige Bestellungen werden geloggt und verworfen.
+
+        Args:
+            orders (list[Order]): Die Bestellungen.
+
+        Returns:
+            list[Order]: Die gültigen Bestellungen.
+        """
+        # Kunden und Artikel des Blocks gesammelt auflösen
+        self.validation_context.prefetch(orders)
+
+        valid_orders = []
+        for order in orders:
+            try:
+                order.validate(self.validation_context)
             except Exception as e:
                 self.logger.log_status(Status.ERROR, order.order_no, str(e))
                 continue
-            
-            orders.append(order)
-        
-        return orders
+            valid_orders.append(order)
+        return valid_orders
 
     def filter_new_orders(self, orders: list[Order], log_existing: bool = False) -> list[Order]:
         """Filtert Bestellungen, die noch nicht in der Datenbank existieren.
+        Bestellnummern, die mehrfach in der CSV-Datei vorkommen, werden nur beim ersten Auftreten übernommen.
+
+        Ist adopt_unattached_plans gesetzt, werden bestehende, unveränderte Pläne, die noch keiner
+        Subscription zugeordnet sind, der Bestellung zugeordnet und die Bestellung weiterverarbeitet.
+        Das betrifft Pläne, die vor dem Abbruch eines Imports committet wurden, deren Kunde aber
+        nicht mehr abgeschlossen werden konnte.
         
         Args:
             orders (list[Order]): Die Liste der Bestellungen.
@@ -49,14 +298,85 @@ class OrderFactory(FactoryBase):
         Returns:
             list[Order]: Die Liste der neuen Bestellungen.
         """
+        fingerprints = self.get_existing_fingerprints([order.order_no for order in orders])
+        unattached_plans = self.get_unattached_plans(
+            [order.order_no for order in orders if order.order_no.casefold() in fingerprints]
+        ) if self.adopt_unattached_plans else {}
+
         new_orders = []
         for order in orders:
-            if not frappe.db.exists('Subscription Plan', {'seller_orderno': order.order_no}):
+            key = order.order_no.casefold()
+            if key in self._seen_order_nos:
+                self.logger.log_status(Status.ERROR, order.order_no, 'Bestellnummer mehrfach in CSV-Datei vorhanden')
+                continue
+            self._seen_order_nos.add(key)
+
+            plan = unattached_plans.get(key)
+            if key not in fingerprints:
+                new_orders.append(order)
+            elif plan and plan.terracloud_fingerprint == order.fingerprint:
+                order.map_subscription_plan(plan)
                 new_orders.append(order)
             elif log_existing:
-                self.logger.log_status(Status.NEUTRAL, order.order_no, 'Bestellung existiert bereits')
+                self._log_existing_order(order, fingerprints[key])
         return new_orders
 
+    def get_existing_fingerprints(self, order_nos: list[str]) -> dict[str, str | None]:
+        """
+        Ermittelt die Fingerprints der bestehenden Subscription Plans zu den Bestellnummern.
+        Die Abfrage erfolgt in Blöcken von IN_LIST_SIZE Bestellnummern.
+
+        Args:
+            order_nos (list[str]): Die Bestellnummern.
+
+        Returns:
+            dict[str, str | None]: Fingerprint je vorhandener Bestellnummer (in Kleinschreibung, siehe str.casefold).
+                Pläne aus früheren Versionen haben keinen Fingerprint (None).
+        """
+        fingerprints = {}
+        for chunk in OrderFactory.chunked(set(order_nos), OrderFactory.IN_LIST_SIZE):
+            for plan in frappe.get_all(
+                'Subscription Plan',
+                filters={'seller_orderno': ('in', chunk)},
+                fields=['seller_orderno', 'terracloud_fingerprint']
+            ):
+                fingerprints[plan.seller_orderno.casefold()] = plan.terracloud_fingerprint
+        return fingerprints
+
+    def get_unattached_plans(self, order_nos: list[str]) -> dict[str, dict]:
+        """
+        Ermittelt die bestehenden Subscription Plans zu den Bestellnummern, die noch keiner Subscription zugeordnet sind.
+
+        Args:
+            order_nos (list[str]): Die Bestellnummern.
+
+        Returns:
+            dict[str, dict]: Plan (name, seller_orderno, terracloud_fingerprint) je Bestellnummer
+                (in Kleinschreibung, siehe str.casefold).
+        """
+        plans = {}
+        for chunk in OrderFactory.chunked(set(order_nos), OrderFactory.IN_LIST_SIZE):
+            for plan in frappe.get_all(
+                'Subscription Plan',
+                filters={'seller_orderno': ('in', chunk)},
+                fields=['name', 'seller_orderno', 'terracloud_fingerprint']
+            ):
+                plans[plan.name] = plan
+
+        attached_plans = set()
+        for chunk in OrderFactory.chunked(list(plans), OrderFactory.IN_LIST_SIZE):
+            attached_plans.update(frappe.get_all(
+                'Subscription Plan Detail',
+                filters={'parenttype': 'Subscription', 'plan': ('in', chunk)},
+                pluck='plan'
+            ))
+
+        return {
+            plan.seller_orderno.casefold(): plan
+            for name, plan in plans.items()
+            if name not in attached_plans
+        }
+
     def group_orders_by_customer(self, orders: list[Order]) -> dict:
         """Gruppiert Bestellungen nach der Kundennummer."""
         grouped_orders = {}
@@ -75,10 +395,31 @@ class OrderFactory(FactoryBase):
         return [order for order in orders if order.price_type == PriceType.MONTHLY]
 
     @staticmethod
-    def _parse_csv(file_path: str):
-        data = []
-        with open(file_path, mode='r', encoding='latin-1') as csvfile:
+    def chunked(items: Iterable, chunk_size: int, key: Callable = None) -> Iterator[list]:
+        """
+        Teilt einen (beliebig langen) Datenstrom in Listen fester Größe auf.
+
+        Args:
+            items (Iterable): Der Datenstrom.
+            chunk_size (int): Die maximale Größe eines Blocks.
+            key (Callable): Optional: Ein neuer Block beginnt auch, sobald sich der Schlüssel ändert.
+
+        Yields:
+            list: Der nächste Block.
+        """
+        if key is not None:
+            for _, group in groupby(items, key):
+                yield from OrderFactory.chunked(group, chunk_size)
+            return
+
+        iterator = iter(items)
+        while chunk := list(islice(iterator, chunk_size)):
+            yield chunk
+
+    @staticmethod
+    def _parse_csv(file_path: str | ImportFile) -> Iterator[dict]:
+        """Liest eine CSV-Datei von TerraCloud zeilenweise ein (auch aus einem Zip-Archiv, siehe ImportFile)."""
+        import_file = file_path if isinstance(file_path, ImportFile) else ImportFile(file_path, file_path)
+        with import_file.open() as csvfile:
             reader = csv.DictReader(csvfile, delimiter=';')
-            for row in reader:
-                data.append(row)
-        return data
\ No newline at end of file
+            yield from reader
\ No newline at end of file
@@ -5,8 +5,20 @@ from terracloud_m365_import.data.order_factory import OrderFactory
 from terracloud_m365_import.data.subscription_plan_factory import SubscriptionPlanFactory
 from terracloud_m365_import.data.subscription_factory import SubscriptionFactory
 from terracloud_m365_import.data.invoice_factory import InvoiceFactory
-from terracloud_m365_import.logger import Logger
+from terracloud_m365_import.data.billing_engine import BillingPeriod
+from terracloud_m365_import.data.transaction_manager import TransactionManager
+from terracloud_m365_import.data.bulk_writer import BulkWriter
+from terracloud_m365_import.data.import_preview import ImportPreview
+from terracloud_m365_import.data.import_metrics import ImportMetrics
+from terracloud_m365_import.data.import_checkpoint import ImportCheckpoint
+from terracloud_m365_import.data.customer_locks import CustomerLocks
+from terracloud_m365_import.data.import_row_staging import ImportRowStaging
+from terracloud_m365_import.data.import_file import ImportFile
+from terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription import get_party_names
+from terracloud_m365_import.logger import Logger, Status
 from datetime import date, timedelta
+import hashlib
+import zlib
 from dateutil.relativedelta import relativedelta
 
 class OrderImporter:
@@ -14,7 +26,11 @@ class OrderImporter:
     Hauptklasse für den Import von TerraCloud-Bestellungen.
 
     Verarbeitet einen angestoßenen TerraCloud-Import (über den DocType 'Terracloud Import').
-    Liest die hochgeladene .csv-Datei aus und erstellt entsprechende Subscriptions.
+    Liest die hochgeladenen .csv-Dateien aus und erstellt entsprechende Subscriptions.
+
+    Ein Import kann mehrere Dateien bzw. Zip-Archive enthalten (siehe ImportFile), z.B. einen Export
+    je Reseller-Konto. Sie werden nacheinander in einem Durchlauf verarbeitet; Caches und gepufferte
+    Schreibzugriffe gelten für alle Dateien. Log-Einträge werden der jeweiligen Datei zugeordnet.
 
     Es werden die Subscription Plans erstellt, die die Bestellungen repräsentieren.
     Das Mapping erfolgt anhand der TerraCloud-Bestellnummer.
@@ -25,52 +41,332 @@ class OrderImporter:
 
     Monatliche Abrechnungen werden pro Kunde zusammengefasst.
     Jährliche Abrechnungen werden pro Bestellung erstellt.
+    Verpasste Rechnungen werden pro Bestellung und Zeitraum erstellt, oder mit 'consolidate_invoices'
+    als eine Rechnung pro Subscription und Monat (siehe _create_consolidated_invoices).
+    Mit 'stage_invoices' werden die Rechnungen nur vorgemerkt und später gedrosselt erstellt
+    (siehe InvoiceMaterializer).
+
+    Committet wird jeweils nach 'commit_batch_size' verarbeiteten Kunden (siehe Terracloud Import Settings).
+    Jeder Arbeitsschritt läuft in einem eigenen Savepoint, sodass eine fehlerhafte Bestellung
+    nur ihre eigenen Änderungen zurückrollt.
+
+    Unveränderte Dateien und bereits importierte Bestellungen werden übersprungen. Wurde eine Bestellung
+    in TerraCloud geändert (siehe Order.fingerprint), wird sie mit Status 'Geändert' geloggt.
+
+    Im Probelauf (dry_run) werden nur lesende Abfragen ausgeführt; statt Dokumente zu schreiben,
+    wird ein Bericht mit Anzahlen und Beträgen pro Kunde erstellt.
+
+    Für jede Stufe der Pipeline werden Laufzeit, SQL-Abfragen, Zeilen und maximaler Speicher
+    gemessen und am Terracloud Import gespeichert (siehe ImportMetrics).
+
+    Nach jedem Commit ist der Fortschritt als Checkpoint gespeichert (siehe ImportCheckpoint).
+    Ein abgebrochener Import setzt beim nächsten Start nach dem zuletzt abgeschlossenen Kunden fort.
+
+    Die Kunden eines Blocks werden für die Dauer ihrer Verarbeitung gesperrt (siehe CustomerLocks),
+    damit gleichzeitige Importe verschiedener Dateien nicht dieselben Subscriptions bearbeiten.
+
+    Die Zeilen der CSV-Dateien werden pro Import einmal in 'Terracloud Import Row' gespeichert
+    (siehe ImportRowStaging) und von dort blockweise gelesen. Jede Zeile erhält nach ihrem Block
+    einen Status und die Verknüpfung zu Subscription Plan und Subscription; erneute Läufe verarbeiten
+    nur ausstehende und fehlerhafte Zeilen. Der Probelauf liest direkt aus den Dateien.
+
+    Ein Import kann auf mehrere parallele Jobs verteilt werden. Jeder Job verarbeitet dann nur
+    die Kunden seines Teils (siehe get_shard).
     '''
-    def __init__(self, terracloud_import: Document, settings: Document):
+    def __init__(self, terracloud_import: Document, settings: Document, shard_index: int = 0, shard_count: int = 1,
+                 dry_run: bool = False):
         '''
         Initialisiert den Importer.
 
         Args:
             terracloud_import (Document): Der TerraCloud-Import, der verarbeitet werden soll.
             settings (Document): Die globalen Einstellungen für den Import.
+            shard_index (int): Der Teil des Imports, der verarbeitet werden soll (siehe get_shard).
+            shard_count (int): Die Anzahl der Teile, auf die die Kunden des Imports verteilt werden.
+            dry_run (bool): Probelauf: Es wird nichts geschrieben, start_import() gibt stattdessen einen Bericht zurück.
         '''
         self.terracloud_import = terracloud_import
         self.settings = settings
-        self.logger = Logger(terracloud_import)
-        self.order_factory = OrderFactory(settings, self.logger)
-        self.subscription_plan_factory = SubscriptionPlanFactory(settings, self.logger)
-        self.subscription_factory = SubscriptionFactory(settings, self.logger)
-        self.invoice_factory = InvoiceFactory(settings, self.logger)
+        self.shard_index = shard_index
+        self.shard_count = max(shard_count or 1, 1)
+        self.preview = ImportPreview() if dry_run else None
+        self.logger = Logger(terracloud_import, self.preview)
+        self.writer = BulkWriter(self.preview)
+        self.metrics = ImportMetrics()
+        self.order_factory = OrderFactory(settings, self.logger, self.writer, self.metrics)
+        self.subscription_plan_factory = SubscriptionPlanFactory(settings, self.logger, self.writer, self.metrics)
+        self.subscription_factory = SubscriptionFactory(settings, self.logger, self.writer, self.metrics)
+        self.invoice_factory = InvoiceFactory(settings, self.logger, self.writer, self.metrics)
+        # Der Probelauf zeigt immer die ganze Datei, auch wenn ein echter Lauf abgebrochen wurde
+        self.checkpoint = ImportCheckpoint(terracloud_import.name, shard_index, load=not dry_run)
+        self.locks = CustomerLocks(enabled=not dry_run)
+        self.staging = None if dry_run else ImportRowStaging(terracloud_import.name, self.logger, shard_index, self.shard_count)
+        self.transactions = TransactionManager(self.logger, settings.commit_batch_size, dry_run,
+                                               self.checkpoint.save, self.locks.release_completed)
 
-    def start_import(self) -> None:
+    def start_import(self) -> dict | None:
         '''
         Startet den Import.
+        Die Bestellungen werden blockweise aus der CSV-Datei gelesen und verarbeitet,
+        damit der Speicherbedarf auch bei großen Dateien konstant bleibt.
+
+        Schlägt der Import fehl, werden die nicht gespeicherten Änderungen verworfen,
+        die Protokolleinträge aber trotzdem geschrieben.
+
+        Returns:
+            dict | None: Im Probelauf der Bericht (siehe ImportPreview.as_dict), sonst None.
+        '''
+        with self.metrics.track_queries():
+            try:
+                # Unveränderte Dateien nicht erneut verarbeiten
+                files = ImportFile.get_import_files(self.terracloud_import)
+                if not self._is_known_file(files):
+                    self._import_files(files)
+
+            except Exception as e:
+                frappe.db.rollback()
+                self.checkpoint.rollback()
+                self.locks.release_all()
+                self.logger.log_status(Status.ERROR, self.terracloud_import.name, f'Import abgebrochen: {e}')
+                self._save_metrics()
+                self.transactions.commit()
+                raise
+
+            self._save_metrics()
+            self.transactions.commit()
+
+        return self.preview.as_dict() if self.preview else None
+
+    def _import_files(self, files: list[ImportFile]) -> None:
+        '''
+        Liest die Bestellungen blockweise aus den CSV-Dateien und verarbeitet sie.
+
+        Args:
+            files (list[ImportFile]): Die CSV-Dateien des Imports.
         '''
-        # Bestellungen aus CSV auslesen
-        file_url = self.terracloud_import.csv_file
-        file_doc = frappe.get_doc('File', {'file_url': file_url})
-        file_path = file_doc.get_full_path()
-        orders = self.order_factory.create_from_terracloud_csv(file_path)
+        if self.checkpoint.resumed:
+            self.logger.log_status(Status.NEUTRAL, self.terracloud_import.name, f'Import fortgesetzt ab Zeile {self.checkpoint.row_offset + 1}')
+
+        if self.staging:
+            self._stage_files(files)
+            chunks = self.order_factory.iter_from_staging(self.staging, checkpoint=self.checkpoint)
+        else:
+            customer_filter = self._is_own_customer if self.shard_count > 1 else None
+            chunks = self.order_factory.iter_from_terracloud_csv(files, customer_filter=customer_filter, checkpoint=self.checkpoint)
+
+        for orders in chunks:
+            self._process_orders(orders)
+            if self.staging:
+                self.staging.update_states(self.checkpoint.row_offset, self.order_factory.chunk_end_row, orders)
+            self.checkpoint.complete_chunk(self.order_factory.chunk_end_row)
+
+        # Statistik des Artikel-Caches protokollieren (gilt für alle Dateien)
+        self.logger.source_file = None
+        item_cache = self.invoice_factory.item_cache
+        self.logger.log_status(Status.NEUTRAL, 'Artikel-Cache', f'{item_cache.hits} Treffer, {item_cache.misses} Fehlzugriffe')
+
+    def _stage_files(self, files: list[ImportFile]) -> None:
+        '''
+        Speichert die Zeilen der CSV-Dateien, falls das noch kein Teil des Imports getan hat.
+        Die übrigen Teile warten, bis die Zeilen committet sind.
+
+        Args:
+            files (list[ImportFile]): Die CSV-Dateien des Imports.
+        '''
+        with self.staging.lock():
+            if self.staging.is_staged():
+                return
+
+            with self.metrics.stage('staging') as stage:
+                stage.rows_out += self.staging.stage(files)
+            self.transactions.commit()
+
+    def _save_metrics(self) -> None:
+        '''
+        Speichert die Messwerte der Pipeline-Stufen am Terracloud Import (nicht im Probelauf).
+        '''
+        if not self.writer.dry_run:
+            self.metrics.save(self.terracloud_import.name, self.shard_index)
+
+    @staticmethod
+    def get_shard(customer_no: str, shard_count: int) -> int:
+        '''
+        Ordnet eine Kundennummer stabil einem Teil des Imports zu.
+        Alle Bestellungen eines Kunden landen so immer im selben Teil.
+
+        Args:
+            customer_no (str): Die Kundennummer.
+            shard_count (int): Die Anzahl der Teile.
+
+        Returns:
+            int: Der Index des Teils.
+        '''
+        return zlib.crc32((customer_no or '').casefold().encode()) % shard_count
+
+    def _is_own_customer(self, customer_no: str) -> bool:
+        '''Prüft, ob ein Kunde von diesem Teil des Imports verarbeitet wird.'''
+        return OrderImporter.get_shard(customer_no, self.shard_count) == self.shard_index
+
+    def _is_known_file(self, files: list[ImportFile]) -> bool:
+        '''
+        Berechnet die Prüfsumme der CSV-Dateien, speichert sie am Import und prüft,
+        ob dieselben Dateien bereits vollständig importiert wurden.
+
+        Args:
+            files (list[ImportFile]): Die CSV-Dateien des Imports.
+
+        Returns:
+            bool: True, wenn die Dateien bereits erfolgreich importiert wurden.
+        '''
+        file_hash = OrderImporter.get_file_hash(files)
+        if not self.writer.dry_run:
+            frappe.db.set_value('Terracloud Import', self.terracloud_import.name, 'file_hash', file_hash, update_modified=False)
+
+        previous_import = frappe.db.get_value('Terracloud Import', {
+            'name': ('!=', self.terracloud_import.name),
+            'file_hash': file_hash,
+            'import_status': 'Abgeschlossen'
+        })
+        if previous_import:
+            self.logger.log_status(Status.NEUTRAL, self.terracloud_import.name, f'Datei unverändert, bereits importiert mit {previous_import}')
+        return bool(previous_import)
+
+    @staticmethod
+    def get_file_hash(files: list[ImportFile]) -> str:
+        '''
+        Berechnet die SHA-256-Prüfsumme über den Inhalt der Dateien (in ihrer Reihenfolge),
+        ohne sie vollständig in den Speicher zu laden. Für eine einzelne Datei entspricht sie
+        der Prüfsumme der Datei.
+
+        Args:
+            files (list[ImportFile]): Die Dateien.
+
+        Returns:
+            str: Die Prüfsumme (hexadezimal).
+        '''
+        file_hash = hashlib.sha256()
+        for import_file in files:
+            with import_file.open_binary() as file:
+                while block := file.read(1024 * 1024):
+                    file_hash.update(block)
+        return file_hash.hexdigest()
+
+    def _process_orders(self, orders: list[Order]) -> None:
+        '''
+        Verarbeitet einen Block von validierten Bestellungen.
+
+        Args:
+            orders (list[Order]): Die Bestellungen des Blocks.
+        '''
+        if not orders:
+            return
 
         # FILTER: Alle Bestellungen: Überprüfen, ob bereits Subscription Plan existiert (Abgleich über Bestellnummer) -> Log ("bereits existent")
-        orders = self.order_factory.filter_new_orders(orders, log_existing=True)
+        with self.metrics.stage('filter_new', len(orders)) as stage:
+            orders = self.order_factory.filter_new_orders(orders, log_existing=True)
+            stage.rows_out += len(orders)
 
         # Subscription Plans erstellen
-        subscription_plan_factory = SubscriptionPlanFactory(self.settings, self.logger)
-        orders = subscription_plan_factory.create_from_orders(orders)
+        with self.metrics.stage('plans', len(orders)) as stage:
+            orders = self._create_subscription_plans(orders)
+            stage.rows_out += len(orders)
+
+        # Artikelstammdaten für die Rechnungen des Blocks laden
+        self.invoice_factory.item_cache.prefetch(order.article_no for order in orders)
 
         # Nach Kundennummer zusammenfassen
         grouped_orders = self.order_factory.group_orders_by_customer(orders)
 
+        # Kunden des Blocks sperren, bevor ihre Subscriptions gesucht werden
+        self.locks.acquire(list(grouped_orders))
+
+        # Bestehende monatliche Subscriptions aller Kunden des Blocks gesammelt suchen
+        self.subscription_factory.prefetch_monthly_subscriptions(
+            [order.customer_no for order in self.order_factory.get_monthly_orders(orders)]
+        )
+
+        # Kundennamen des Blocks gesammelt laden, damit update_party_name beim Speichern den Cache trifft
+        if not self.writer.dry_run:
+            get_party_names('Customer', list(grouped_orders))
+
         # Bestellungen pro Kunde verarbeiten
         for customer_no, orders in grouped_orders.items():
+            self._process_customer(customer_no, orders)
+            self.checkpoint.complete_customer(customer_no)
+            self.locks.complete(customer_no)
+            self.transactions.complete_unit()
+
+        # Alle Sperren des Blocks freigeben, bevor die des nächsten Blocks angefordert werden
+        if self.locks.held:
+            self.transactions.commit()
+
+    def _create_subscription_plans(self, orders: list[Order]) -> list[Order]:
+        '''
+        Erstellt die Subscription Plans der Bestellungen gesammelt in einem Savepoint.
+        Ungültige Pläne werden bereits von der Factory aussortiert und geloggt.
+        Schlägt der Block trotzdem fehl, wird jede Bestellung in einem eigenen Savepoint wiederholt,
+        damit eine fehlerhafte Bestellung nur ihren eigenen Plan verliert.
+
+        Args:
+            orders (list[Order]): Die Bestellungen.
+
+        Returns:
+            list[Order]: Die Bestellungen, deren Subscription Plan erstellt wurde.
+        '''
+        with self.transactions.savepoint('Subscription Plans', log_errors=False) as savepoint:
+            mapped_orders = self.subscription_plan_factory.create_from_orders(orders)
+        if savepoint.ok:
+            return mapped_orders
+
+        # Noch nicht geschriebene Pläne des fehlgeschlagenen Versuchs verwerfen
+        self.writer.discard()
+
+        mapped_orders = []
+        for order in orders:
+            with self.transactions.savepoint(order.order_no) as savepoint:
+                mapped = self.subscription_plan_factory.create_from_orders([order])
+            if savepoint.ok:
+                mapped_orders += mapped
+            else:
+                self.writer.discard()
+        return mapped_orders
+
+    def _process_customer(self, customer_no: str, orders: list[Order]) -> None:
+        '''
+        Verarbeitet die Bestellungen eines Kunden: Subscriptions und verpasste Rechnungen.
+
+        Args:
+            customer_no (str): Die Kundennummer.
+            orders (list[Order]): Die Bestellungen des Kunden mit gemappten Subscription-Plänen.
+        '''
+        with self.metrics.stage('subscriptions', len(orders)) as stage:
             self._process_yearly_orders(customer_no, self.order_factory.get_yearly_orders(orders))
-            self._process_monthly_orders(customer_no, self.order_factory.get_monthly_orders(orders))
 
-            # Verpasste Rechnungen erstellen
-            for order in orders:
-                self._create_missed_invoices(order)
+            monthly_orders = self.order_factory.get_monthly_orders(orders)
+            with self.transactions.savepoint(customer_no) as savepoint:
+                self._process_monthly_orders(customer_no, monthly_orders)
+            if not savepoint.ok:
+                for order in monthly_orders:
+                    order.map_subscription(None)
+                self.subscription_factory.forget_monthly_subscription(customer_no)
+
+            # Bestellungen ohne Subscription wurden bereits als fehlerhaft geloggt
+            orders = [order for order in orders if order.subscription]
+            stage.rows_out += len(orders)
+
+        with self.metrics.stage('invoices', len(orders)) as stage:
+            # Verpasste Rechnungen erstellen; Zeiträume und Preise werden im Savepoint der Bestellung berechnet
+            if self.settings.consolidate_invoices:
+                stage.rows_out += self._create_consolidated_invoices(customer_no, self._get_missed_periods(orders))
+            else:
+                for order in orders:
+                    with self.transactions.savepoint(order.order_no) as savepoint:
+                        created_invoices = self._create_missed_invoices(order)
+                    if savepoint.ok:
+                        stage.rows_out += created_invoices
 
+            # Vorgemerkte Rechnungen des Kunden gesammelt schreiben (siehe 'stage_invoices')
+            self.invoice_factory.flush()
 
     def _process_yearly_orders(self, customer_no: str, orders: list[dict]) -> None:
         '''
@@ -83,7 +379,10 @@ class OrderImporter:
         '''
         # Keine Überprüfung auf existierende Subscriptions, da jede Bestellung eine eigene Subscription erhält
         for order in orders:
-            self.subscription_factory.create_subscription(customer_no, PriceType.YEARLY, [order])
+            with self.transactions.savepoint(order.order_no) as savepoint:
+                self.subscription_factory.create_subscription(customer_no, PriceType.YEARLY, [order])
+            if not savepoint.ok:
+                order.map_subscription(None)
 
     def _process_monthly_orders(self, customer_no: str, orders: list[Order]) -> None:
         '''
@@ -95,7 +394,10 @@ class OrderImporter:
             customer_no (str): Die Kundennummer.
             orders (list[Order]): Die Liste der Bestellungen.
         '''
-        # Bestehende Subscription suchen
+        if not orders:
+            return
+
+        # Bestehende Subscription suchen (vorab für den ganzen Block gesucht, siehe _process_orders)
         subscription = self.subscription_factory.find_existing_monthly_subscription(customer_no)
 
         # Subscription erstellen, falls nicht vorhanden
@@ -105,45 +407,67 @@ class OrderImporter:
             # Bestehende Subscription aktualisieren
             self.subscription_factory.append_to_existing_subscription(subscription, orders)
 
-    def _create_missed_invoices(self, order: Order) -> None:
+    def _create_missed_invoices(self, order: Order) -> int:
         '''
         Erstellt verpasste Rechnungen für eine Bestellung.
         Erstellt anteilige und ganze Rechnungen für den Zeitraum zwischen Bestelldatum und Abo-Startdatum.
+        Zeiträume und Preise berechnet die BillingEngine; volle Preise werden dabei über alle Bestellungen gecacht.
 
         Args:
             order (Order): Die Bestellung.
 
-        Raises:
-            ValueError: Falls die Bestellung oder Subscription nicht gefunden wurde
+        Returns:
+            int: Die Anzahl der erstellten Rechnungen.
         '''
-        if not order or not order.subscription:
-            raise ValueError('Can\'t create missing invoices. Order or Subscription not found')
-
-        # Das Startdatum der Bestellung ist das Startdatum der ersten Rechnnung
-        start_date = order.start_date
+        [(_, periods)] = self.invoice_factory.billing_engine.get_missed_periods([order])
+        for period in periods:
+            self.invoice_factory.create_invoice(order, period.from_date, period.to_date, period.unit_price)
+        return len(periods)
 
-        # Die Rechnungserzeugung soll bis zum Abo-Startdatum erfolgen
-        end_date = order.subscription.current_invoice_start
+    def _get_missed_periods(self, orders: list[Order]) -> list[tuple[Order, list[BillingPeriod]]]:
+        '''
+        Berechnet die verpassten Zeiträume und Preise je Bestellung in einem eigenen Savepoint.
+        Bestellungen, deren Berechnung fehlschlägt (z.B. ohne Subscription), werden geloggt und ausgelassen.
 
-        current_start = start_date
-        while current_start < end_date:
+        Args:
+            orders (list[Order]): Die Bestellungen mit zugeordneter Subscription.
 
-            # End-Datum der aktuellen Rechnung anhand Abrechnungs-Intervall bestimmen
-            if order.price_type == PriceType.MONTHLY:
-                current_end = current_start + relativedelta(months=1)
-            elif order.price_type == PriceType.YEARLY:
-                current_end = current_start + relativedelta(years=1)
-            else:
-                break
+        Returns:
+            list[tuple[Order, list[BillingPeriod]]]: Die Zeiträume je erfolgreich berechneter Bestellung.
+        '''
+        missed_periods = []
+        for order in orders:
+            with self.transactions.savepoint(order.order_no) as savepoint:
+                periods = self.invoice_factory.billing_engine.get_missed_periods([order])
+            if savepoint.ok:
+                missed_periods += periods
+        return missed_periods
 
-            # End-Datum beschneiden falls es das Abo-Startdatum überschreitet
-            current_end = min(current_end, end_date)
+    def _create_consolidated_invoices(self, customer_no: str, missed_periods: list[tuple[Order, list[BillingPeriod]]]) -> int:
+        '''
+        Erstellt die verpassten Rechnungen eines Kunden zusammengefasst: eine Rechnung pro Subscription
+        und Abrechnungsmonat mit einer Position pro Bestellung (siehe 'consolidate_invoices').
+        Da monatliche Bestellungen eines Kunden in einer Subscription liegen, entsteht so eine Rechnung
+        pro Kunde, Abrechnungsintervall und Monat. Jährliche Bestellungen haben je eine eigene Subscription.
 
-            # Es soll nur der Leistungs-Zeitraum betrachtet werden: 1 Tag abziehen
-            current_end -= relativedelta(days=1)
+        Args:
+            customer_no (str): Die Kundennummer.
+            missed_periods (list[tuple[Order, list[BillingPeriod]]]): Die Zeiträume je Bestellung (siehe BillingEngine).
 
-            # Rechnung erstellen
-            self.invoice_factory.create_invoice(order, current_start, current_end)
+        Returns:
+            int: Die Anzahl der erstellten Rechnungspositionen.
+        '''
+        # Nach dem Dokument gruppieren: Im Probelauf haben neue Subscriptions noch keinen Namen
+        grouped_periods: dict[tuple[int, int, int], list[BillingPeriod]] = {}
+        for order, periods in missed_periods:
+            for period in periods:
+                key = (id(order.subscription), period.from_date.year, period.from_date.month)
+                grouped_periods.setdefault(key, []).append(period)
 
-            # Nächsten Rechnungsstart bestimmen
-            current_start = current_end + relativedelta(days=1)
\ No newline at end of file
+        created_items = 0
+        for (_, year, month), periods in sorted(grouped_periods.items(), key=lambda group: (group[0][1], group[0][2])):
+            with self.transactions.savepoint(f'{customer_no} {month:02d}.{year}') as savepoint:
+                self.invoice_factory.create_consolidated_invoice(periods)
+            if savepoint.ok:
+                created_items += len(periods)
+        return created_items
@@ -0,0 +1,80 @@
+import frappe
+from datetime import date
+
+class PriceIndex:
+    '''
+    Hält alle Artikelpreise einer Preisliste im Speicher.
+
+    Der Index wird einmal pro Import geladen und ersetzt die einzelnen Abfragen auf 'Item Price'.
+    Die Preise sind nach Artikel sowie nach Artikel und Kunde abgelegt, jeweils mit ihrem Gültigkeitszeitraum.
+    Innerhalb eines Schlüssels sind die Preise wie bei frappe.get_value nach 'modified desc' sortiert
+    (Standardsortierung von Item Price), damit bei mehreren passenden Preisen derselbe Preis
+    gewählt wird wie bei einer Einzelabfrage: der zuletzt geänderte.
+    '''
+    def __init__(self, price_list: str):
+        '''
+        Lädt die Preise der Preisliste.
+
+        Args:
+            price_list (str): Der Name der Preisliste.
+        '''
+        self.price_list = price_list
+        self._by_item: dict[str, list] = {}
+        self._by_item_customer: dict[tuple[str, str], list] = {}
+
+        prices = frappe.get_all(
+            'Item Price',
+            filters={'price_list': price_list},
+            fields=['item_code', 'customer', 'valid_from', 'valid_upto', 'price_list_rate'],
+            order_by='modified desc'
+        )
+        for price in prices:
+            item_key = PriceIndex._key(price.item_code)
+            self._by_item.setdefault(item_key, []).append(price)
+            if price.customer:
+                self._by_item_customer.setdefault((item_key, PriceIndex._key(price.customer)), []).append(price)
+
+    def get_price(self, item_code: str, customer: str, valuation_date: date) -> float | None:
+        '''
+        Ermittelt den Preis eines Artikels zum Bewertungsdatum.
+        Die Suche erfolgt in derselben Reihenfolge wie zuvor über die Datenbank:
+        1. Kundenspezifischer Preis, gültig zum Bewertungsdatum
+        2. Beliebiger Preis, gültig zum Bewertungsdatum
+        3. Beliebiger Preis, dessen Gültigkeit nicht vor dem Bewertungsdatum endet
+        4. Beliebiger Preis
+
+        Args:
+            item_code (str): Die Artikelnummer.
+            customer (str): Die Kundennummer.
+            valuation_date (date): Das Bewertungsdatum.
+
+        Returns:
+            float: Der Preis des Artikels. None, falls kein Preis gefunden wurde.
+        '''
+        item_key = PriceIndex._key(item_code)
+        item_prices = self._by_item.get(item_key, [])
+        customer_prices = self._by_item_customer.get((item_key, PriceIndex._key(customer)), [])
+
+        def is_valid(price) -> bool:
+            return price.valid_from is not None and price.valid_from <= valuation_date \
+                and price.valid_upto is not None and price.valid_upto >= valuation_date
+
+        def is_not_expired(price) -> bool:
+            return price.valid_upto is not None and price.valid_upto >= valuation_date
+
+        steps = (
+            (customer_prices, is_valid),
+            (item_prices, is_valid),
+            (item_prices, is_not_expired),
+            (item_prices, lambda price: True)
+        )
+        for prices, matches in steps:
+            # Wie bei frappe.get_value zählt nur der erste passende Preis
+            price = next((price.price_list_rate for price in prices if matches(price)), None)
+            if price:
+                return price
+
+    @staticmethod
+    def _key(value: str | None) -> str:
+        '''Schlüssel für Vergleiche ohne Beachtung der Groß-/Kleinschreibung (wie in der Datenbank).'''
+        return (value or '').casefold()
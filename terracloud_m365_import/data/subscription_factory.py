@@ -2,14 +2,29 @@ import frappe
 from frappe.model.document import Document
 from .factory_base import FactoryBase
 from .order import Order, PriceType
+from .bulk_writer import BulkWriter
+from .import_metrics import ImportMetrics
+from terracloud_m365_import.logger import Logger
+from itertools import islice
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 
 class SubscriptionFactory(FactoryBase):
     '''
     Stellt Methoden zur Generierung von Subscription-Objekten zur Verfügung.
+
+    Die monatlichen Subscriptions der Kunden werden gesammelt gesucht und für den ganzen Import
+    gemerkt (siehe prefetch_monthly_subscriptions). Geladen werden nur die Subscriptions,
+    denen tatsächlich Bestellungen hinzugefügt werden.
     '''
-    
+
+    # Maximale Anzahl an Werten in einer IN-Liste
+    IN_LIST_SIZE = 500
+
+    def __init__(self, settings: Document, logger: Logger, writer: BulkWriter = None, metrics: ImportMetrics = None):
+        super().__init__(settings, logger, writer, metrics)
+        self._monthly_subscriptions: dict[str, str | Document | None] = {}
+
     def create_subscription(self, customer_no: str, price_type: PriceType, orders: list[Order]) -> None:
         '''
         Erstellt eine Subscription für einen Kunden.
@@ -35,6 +50,9 @@ class SubscriptionFactory(FactoryBase):
             if price_type == PriceType.MONTHLY \
             else SubscriptionFactory.get_next_year_day()
         subscription.generate_invoice_at = 'Beginning of the current subscription period'
+
+        # Wird von ERPNext beim Einfügen identisch gesetzt, im Probelauf aber bereits für die Rechnungen benötigt
+        subscription.current_invoice_start = subscription.start_date
         subscription.follow_calendar_months = self.settings.follow_calendar_months
         subscription.generate_new_invoices_past_due_date = self.settings.generate_new_invoices_past_due_date
         subscription.submit_generated_invoices = self.settings.submit_generated_invoices
@@ -49,43 +67,85 @@ class SubscriptionFactory(FactoryBase):
             })
 
         # Subscription speichern
-        subscription.insert()
-        frappe.db.commit()
+        self.writer.insert(subscription)
 
-    def append_to_existing_subscription(self, subscription: Document, orders: list[Order]) -> None:
+        # Weitere monatliche Bestellungen des Kunden (z.B. aus späteren Blöcken) werden angehängt.
+        # Im Probelauf hat die Subscription keinen Namen, daher wird das Dokument selbst gemerkt.
+        if price_type == PriceType.MONTHLY:
+            self._monthly_subscriptions[customer_no.casefold()] = subscription if self.writer.dry_run else subscription.name
+
+    def append_to_existing_subscription(self, subscription: str | Document, orders: list[Order]) -> None:
         '''
         Fügt Bestellungen einer existierenden Subscription hinzu.
         
         Args:
-            subscription (frappe.Document): Die Subscription.
+            subscription (str | frappe.Document): Die Subscription oder ihr Name.
             orders (list[Order]): Die Liste der Bestellungen.
         '''
+        if not orders:
+            return
+
+        # Suchergebnisse enthalten nur den Namen der Subscription, geladen wird erst hier
+        if not isinstance(subscription, Document):
+            subscription = frappe.get_doc('Subscription', subscription)
+
         for order in orders:
             order.map_subscription(subscription)
             subscription.append('plans', {
-                'plan': order.subscription_plan,
+                'plan': order.subscription_plan.name,
                 'qty': order.quantity
             })
-        subscription.save()
-        frappe.db.commit()
+        self.writer.save(subscription)
 
-    def find_existing_monthly_subscription(self, customer_no) -> Document | None:
+    def find_existing_monthly_subscription(self, customer_no) -> str | Document | None:
         '''
         Sucht nach einer existierenden monatlichen Subscription für einen Kunden.
+        Vorab gesuchte Kunden (siehe prefetch_monthly_subscriptions) lösen keine weitere Abfrage aus.
         
         Args:
             customer_no (str): Die Kundennummer.
         
         Returns:
-            frappe.Document | None: Die Subscription, falls vorhanden, sonst None
+            str | frappe.Document | None: Der Name der Subscription (im Probelauf ggf. das Dokument), falls vorhanden, sonst None
         '''
-        subscription = frappe.get_all('Subscription', filters={
-            'party_type': 'Customer',
-            'party': customer_no,
-            'terracloud_billing_interval': 'Month'
-        }, limit=1)
+        key = customer_no.casefold()
+        if key not in self._monthly_subscriptions:
+            self.prefetch_monthly_subscriptions([customer_no])
+        return self._monthly_subscriptions[key]
 
-        return subscription[0] if subscription else None
+    def prefetch_monthly_subscriptions(self, customer_nos: list[str]) -> None:
+        '''
+        Sucht die monatlichen Subscriptions mehrerer Kunden mit einer Abfrage pro IN_LIST_SIZE Kunden.
+        Bereits gesuchte Kunden werden übersprungen.
+
+        Args:
+            customer_nos (list[str]): Die Kundennummern.
+        '''
+        # Der Vergleich in der Datenbank ignoriert Groß-/Kleinschreibung
+        iterator = iter({customer_no.casefold() for customer_no in customer_nos} - self._monthly_subscriptions.keys())
+        while chunk := list(islice(iterator, SubscriptionFactory.IN_LIST_SIZE)):
+            for key in chunk:
+                self._monthly_subscriptions[key] = None
+
+            for subscription in frappe.get_all('Subscription', filters={
+                'party_type': 'Customer',
+                'party': ('in', chunk),
+                'terracloud_billing_interval': 'Month'
+            }, fields=['name', 'party']):
+                # Wie bisher zählt je Kunde der erste Treffer
+                key = subscription.party.casefold()
+                if not self._monthly_subscriptions.get(key):
+                    self._monthly_subscriptions[key] = subscription.name
+
+    def forget_monthly_subscription(self, customer_no: str) -> None:
+        '''
+        Verwirft die gemerkte monatliche Subscription eines Kunden,
+        z.B. nachdem ihre Erstellung zurückgerollt wurde.
+
+        Args:
+            customer_no (str): Die Kundennummer.
+        '''
+        self._monthly_subscriptions.pop(customer_no.casefold(), None)
 
     @staticmethod
     def get_next_month_first_day() -> date:
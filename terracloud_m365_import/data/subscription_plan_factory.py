@@ -1,6 +1,7 @@
 from .factory_base import FactoryBase
 import frappe
 from .order import Order, PriceType
+from terracloud_m365_import.logger import Status
 
 class SubscriptionPlanFactory(FactoryBase):
 
@@ -15,12 +16,16 @@ class SubscriptionPlanFactory(FactoryBase):
         Returns:
             list[Order]: Die Liste der Bestellungen mit zugeordneten Subscription-Plänen.
         """
-        mapped_orders = []
+        docs = {}
 
         for order in orders:
 
-            # Neuen Subscription Plan erstellen
-            doc = frappe.get_doc({
+            # Übernommene Pläne eines fortgesetzten Imports existieren bereits (siehe OrderFactory.filter_new_orders)
+            if order.subscription_plan:
+                continue
+
+            # Neuen Subscription Plan erstellen (wird gesammelt geschrieben)
+            docs[order.order_no] = self.writer.insert(frappe.get_doc({
                 'doctype': 'Subscription Plan',
                 'plan_name': f'M365 {order.customer_no} {order.order_no}',
                 'seller_orderno': order.order_no,
@@ -29,14 +34,33 @@ class SubscriptionPlanFactory(FactoryBase):
                 'price_list': self.settings.price_list,
                 'item': order.article_no,
                 'terracloud_start_date': order.start_date,
+                'terracloud_fingerprint': order.fingerprint,
                 'billing_interval': 'Year' if order.price_type == PriceType.YEARLY \
                     else 'Month'
-            }).insert()
+            }))
+
+        # Subscription Plans validieren und per Bulk-Insert schreiben
+        failed = {doc.seller_orderno for doc, _ in self._flush_writer()}
 
-            # Mapping zwischen Bestellung und Subscription-Plan herstellen
-            order.map_subscription_plan(doc)
+        # Mapping zwischen Bestellung und Subscription-Plan herstellen
+        mapped_orders = []
+        for order in orders:
+            if order.order_no in failed:
+                continue
+            if order.order_no in docs:
+                order.map_subscription_plan(docs[order.order_no])
             mapped_orders.append(order)
- 
-        frappe.db.commit()
 
-        return mapped_orders
\ No newline at end of file
+        return mapped_orders
+
+    def _flush_writer(self) -> list:
+        """
+        Schreibt die gesammelten Subscription Plans und loggt die fehlgeschlagenen.
+
+        Returns:
+            list: Die fehlgeschlagenen Dokumente mit Fehler.
+        """
+        failed = self.writer.flush()
+        for doc, error in failed:
+            self.logger.log_status(Status.ERROR, doc.seller_orderno, str(error))
+        return failed
\ No newline at end of file
@@ -0,0 +1,92 @@
+import frappe
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable
+from terracloud_m365_import.logger import Logger, Status
+
+@dataclass
+class SavepointResult:
+    """Ergebnis eines Savepoint-Blocks."""
+    ok: bool = True
+
+class TransactionManager:
+    '''
+    Steuert die Transaktionen eines Imports.
+
+    Statt nach jedem Dokument zu committen, wird erst nach einer konfigurierbaren Anzahl
+    abgeschlossener Einheiten (z.B. Kunden) committet. Einzelne Arbeitsschritte laufen in
+    Savepoints, sodass ein Fehler nur die Änderungen des betroffenen Schritts zurückrollt.
+    '''
+    def __init__(self, logger: Logger, batch_size: int, dry_run: bool = False, before_commit: Callable[[], None] = None,
+                 after_commit: Callable[[], None] = None):
+        '''
+        Initialisiert den Transaktionsmanager.
+
+        Args:
+            logger (Logger): Der Logger des Imports.
+            batch_size (int): Anzahl abgeschlossener Einheiten pro Commit.
+            dry_run (bool): Probelauf: Es wird nie committet.
+            before_commit (Callable[[], None]): Optional: Wird vor jedem Commit innerhalb der
+                Transaktion aufgerufen (z.B. um den Checkpoint zu schreiben).
+            after_commit (Callable[[], None]): Optional: Wird nach jedem Commit aufgerufen
+                (z.B. um Sperren freizugeben).
+        '''
+        self.logger = logger
+        self.dry_run = dry_run
+        self.before_commit = before_commit
+        self.after_commit = after_commit
+        self.batch_size = max(batch_size or 1, 1)
+        self._completed_units = 0
+        self._savepoint_counter = 0
+
+    @contextmanager
+    def savepoint(self, entry: str, log_errors: bool = True):
+        '''
+        Führt einen Arbeitsschritt innerhalb eines Savepoints aus.
+        Tritt ein Fehler auf, wird auf den Savepoint zurückgerollt, der Fehler geloggt
+        und der Import fortgesetzt.
+
+        Args:
+            entry (str): Der betroffene Eintrag für das Log (z.B. die Bestellnummer).
+            log_errors (bool): Ob ein Fehler geloggt wird, z.B. nicht, wenn der Schritt einzeln wiederholt wird.
+
+        Yields:
+            SavepointResult: Ergebnis des Blocks; ok ist False, falls zurückgerollt wurde.
+        '''
+        self._savepoint_counter += 1
+        name = f'terracloud_import_{self._savepoint_counter}'
+        result = SavepointResult()
+
+        frappe.db.savepoint(name)
+        try:
+            # Log-Einträge dürfen nicht innerhalb des Savepoints geschrieben werden, da sie sonst mit zurückgerollt würden
+            with self.logger.hold():
+                yield result
+        except Exception as e:
+            frappe.db.rollback(save_point=name)
+            result.ok = False
+            if log_errors:
+                self.logger.log_status(Status.ERROR, entry, str(e))
+        else:
+            frappe.db.release_savepoint(name)
+
+    def complete_unit(self) -> None:
+        '''
+        Markiert eine Einheit als abgeschlossen und committet, sobald die Batch-Größe erreicht ist.
+        '''
+        self._completed_units += 1
+        if self._completed_units >= self.batch_size:
+            self.commit()
+
+    def commit(self) -> None:
+        '''
+        Schreibt das Log und committet die laufende Transaktion.
+        '''
+        self.logger.flush()
+        if not self.dry_run:
+            if self.before_commit:
+                self.before_commit()
+            frappe.db.commit()
+            if self.after_commit:
+                self.after_commit()
+        self._completed_units = 0
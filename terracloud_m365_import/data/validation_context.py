@@ -0,0 +1,73 @@
+import frappe
+from typing import Iterable
+from .order import Order
+
+class ValidationContext:
+    '''
+    Hält die Stammdaten bereit, gegen die die Bestellungen eines Imports validiert werden.
+
+    Statt für jede Bestellung einzeln in der Datenbank nachzusehen, werden die Kunden- und
+    Artikelnummern eines Blocks gesammelt und mit jeweils einer Abfrage aufgelöst.
+    Bereits aufgelöste Nummern werden für den Rest des Imports wiederverwendet.
+    '''
+    def __init__(self):
+        self._customers: dict[str, bool] = {}
+        self._items: dict[str, bool] = {}
+
+    def prefetch(self, orders: Iterable[Order]) -> None:
+        '''
+        Löst alle noch unbekannten Kunden- und Artikelnummern der Bestellungen auf.
+
+        Args:
+            orders (Iterable[Order]): Die Bestellungen eines Blocks.
+        '''
+        orders = list(orders)
+        ValidationContext._resolve('Customer', self._customers, {order.customer_no for order in orders if order.customer_no})
+        ValidationContext._resolve('Item', self._items, {order.article_no for order in orders if order.article_no})
+
+    def customer_exists(self, customer_no: str) -> bool:
+        '''
+        Prüft, ob ein Kunde existiert.
+
+        Args:
+            customer_no (str): Die Kundennummer.
+
+        Returns:
+            bool: True, wenn der Kunde existiert.
+        '''
+        if customer_no not in self._customers:
+            ValidationContext._resolve('Customer', self._customers, {customer_no})
+        return self._customers[customer_no]
+
+    def item_exists(self, article_no: str) -> bool:
+        '''
+        Prüft, ob ein Artikel existiert.
+
+        Args:
+            article_no (str): Die Artikelnummer.
+
+        Returns:
+            bool: True, wenn der Artikel existiert.
+        '''
+        if article_no not in self._items:
+            ValidationContext._resolve('Item', self._items, {article_no})
+        return self._items[article_no]
+
+    @staticmethod
+    def _resolve(doctype: str, index: dict[str, bool], names: set[str]) -> None:
+        '''
+        Ermittelt mit einer Abfrage, welche der Namen in der Datenbank existieren.
+        Der Vergleich erfolgt wie in der Datenbank ohne Beachtung der Groß-/Kleinschreibung.
+
+        Args:
+            doctype (str): Der DocType.
+            index (dict[str, bool]): Der Index, der ergänzt wird.
+            names (set[str]): Die aufzulösenden Namen.
+        '''
+        missing = [name for name in names if name not in index]
+        if not missing:
+            return
+
+        found = {name.casefold() for name in frappe.get_all(doctype, filters={'name': ('in', missing)}, pluck='name')}
+        for name in missing:
+            index[name] = name.casefold() in found
@@ -19,6 +19,24 @@ fixtures = [
 doc_events = {
     "Subscription": {
         "validate": "terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription.update_party_name"
+    },
+    "Customer": {
+        "on_update": "terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription.clear_party_name",
+        "on_trash": "terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription.clear_party_name",
+        "after_rename": "terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription.clear_renamed_party_name"
+    },
+    "Supplier": {
+        "on_update": "terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription.clear_party_name",
+        "on_trash": "terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription.clear_party_name",
+        "after_rename": "terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription.clear_renamed_party_name"
+    }
+}
+
+scheduler_events = {
+    "cron": {
+        "* * * * *": [
+            "terracloud_m365_import.data.invoice_materializer.materialize_invoices"
+        ]
     }
 }
 
@@ -86,7 +104,12 @@ doc_events = {
 # ------------
 
 # before_install = "terracloud_m365_import.install.before_install"
-# after_install = "terracloud_m365_import.install.after_install"
+after_install = "terracloud_m365_import.install.after_install"
+
+# Migration
+# ------------
+
+after_migrate = "terracloud_m365_import.install.after_migrate"
 
 # Uninstallation
 # ------------
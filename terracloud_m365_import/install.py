@@ -0,0 +1,35 @@
+import frappe
+
+# Zusammengesetzte Indizes für die Abfragen des Imports: (DocType, Name des Index, Spalten).
+# Einzelne Spalten werden über 'search_index' im DocType bzw. in den Custom Field Fixtures indiziert.
+INDEXES = [
+    # Bestehende monatliche Subscription eines Kunden (SubscriptionFactory.prefetch_monthly_subscriptions)
+    ('Subscription', 'terracloud_party_interval', ['party', 'terracloud_billing_interval']),
+
+    # Subscriptions zu Subscription Plans (OrderFactory.get_unattached_plans, ImportRowStaging.update_states)
+    ('Subscription Plan Detail', 'terracloud_plan_parenttype', ['plan', 'parenttype']),
+
+    # Preise eines Artikels nach Preisliste, Kunde und Gültigkeit (PriceIndex)
+    ('Item Price', 'terracloud_price_lookup', ['price_list', 'item_code', 'customer', 'valid_from']),
+
+    # Offene Zeilen eines Imports in Reihenfolge der Datei (ImportRowStaging.iter_orders)
+    ('Terracloud Import Row', 'terracloud_import_row_state', ['terracloud_import', 'row_no', 'state'])
+]
+
+def after_install() -> None:
+    '''Legt die Indizes nach der Installation der App an.'''
+    ensure_indexes()
+
+def after_migrate() -> None:
+    '''Legt fehlende Indizes nach jeder Migration an, z.B. nachdem ein DocType neu erstellt wurde.'''
+    ensure_indexes()
+
+def ensure_indexes() -> None:
+    '''
+    Legt die Indizes aus INDEXES an, sofern sie noch nicht existieren.
+    Tabellen oder Spalten, die (noch) nicht existieren, werden übersprungen.
+    '''
+    for doctype, index_name, columns in INDEXES:
+        if not frappe.db.table_exists(doctype) or not all(frappe.db.has_column(doctype, column) for column in columns):
+            continue
+        frappe.db.add_index(doctype, columns, index_name)
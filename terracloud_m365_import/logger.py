@@ -1,24 +1,97 @@
 import frappe
+import time
+from contextlib import contextmanager
+from functools import partial
 from frappe.model.document import Document
 from enum import Enum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from terracloud_m365_import.data.import_preview import ImportPreview
 
 class Status(Enum):
     """Die verschiedenen Status, die ein Terracloud-Import-Log haben kann."""
     NEUTRAL = 'Neutral'
     ERROR = 'Fehler'
     SUCCESS = 'Erfolgreich'
+    CHANGED = 'Geändert'
 
 class Logger:
-    """Stellt einen Logger für einen Terracloud-Import zur Verfügung."""
-    def __init__(self, terracloud_import: Document):
+    """
+    Stellt einen Logger für einen Terracloud-Import zur Verfügung.
+
+    Die Einträge werden gepuffert und gesammelt per Bulk-Insert geschrieben, sobald der Puffer
+    BUFFER_SIZE Einträge enthält oder FLUSH_INTERVAL Sekunden seit dem letzten Schreiben vergangen sind.
+    Am Ende des Imports muss flush() aufgerufen werden.
+    Geschriebene Einträge, die durch ein Rollback verworfen werden, wandern zurück in den Puffer.
+    Innerhalb von hold() wird nicht automatisch geschrieben, z.B. solange ein Savepoint offen ist.
+    Im Probelauf (mit ImportPreview) landen die Einträge nur im Bericht.
+    Jeder Eintrag erhält die Datei, die beim Loggen gerade verarbeitet wird (siehe source_file).
+    """
+    # Anzahl an Einträgen, ab der der Puffer geschrieben wird
+    BUFFER_SIZE = 200
+
+    # Maximale Zeit in Sekunden, die Einträge im Puffer verbleiben
+    FLUSH_INTERVAL = 30
+
+    # Felder der Log-Einträge in der Reihenfolge des Bulk-Inserts
+    FIELDS = ['name', 'creation', 'modified', 'owner', 'modified_by', 'docstatus',
+              'terracloud_import', 'timestamp', 'status', 'entry', 'error_reason', 'source_file']
+
+    def __init__(self, terracloud_import: Document, preview: 'ImportPreview' = None):
         self.terracloud_import = terracloud_import
+        self.preview = preview
+        self._buffer: list[tuple] = []
+        self._last_flush = time.monotonic()
+        self._holds = 0
+
+        # Die Datei, die gerade verarbeitet wird (bei Importen mit mehreren Dateien)
+        self.source_file: str = None
 
     def log_status(self, status: Status, entry: str, error_reason: str):
-        frappe.get_doc({
-            'doctype': 'Terracloud Import Log',
-            'terracloud_import': self.terracloud_import.name,
-            'timestamp': frappe.utils.now(),
-            'status': status.value,
-            'entry': entry,
-            'error_reason': error_reason
-        }).insert(ignore_permissions=True)
\ No newline at end of file
+        # 'entry' ist ein Data-Feld und darf maximal 140 Zeichen lang sein
+        entry = entry[:140] if isinstance(entry, str) else entry
+        self._buffer.append((frappe.utils.now(), status.value, entry, error_reason, self.source_file))
+
+        if self._holds:
+            return
+
+        if len(self._buffer) >= Logger.BUFFER_SIZE or time.monotonic() - self._last_flush >= Logger.FLUSH_INTERVAL:
+            self.flush()
+
+    @contextmanager
+    def hold(self):
+        """Unterdrückt das automatische Schreiben des Puffers innerhalb des Blocks."""
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+
+    def flush(self) -> None:
+        """Schreibt alle gepufferten Einträge mit einem Bulk-Insert in die Datenbank."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+
+        entries, self._buffer = self._buffer, []
+
+        # Probelauf: Einträge nur im Bericht erfassen
+        if self.preview is not None:
+            for entry in entries:
+                self.preview.add_log_entry(*entry)
+            return
+
+        now = frappe.utils.now()
+        user = frappe.session.user
+        frappe.db.bulk_insert('Terracloud Import Log', Logger.FIELDS, [
+            (frappe.generate_hash(length=10), now, now, user, user, 0, self.terracloud_import.name, *entry)
+            for entry in entries
+        ])
+
+        # Bei einem Rollback der Transaktion gehen die Einträge nicht verloren
+        frappe.db.after_rollback.add(partial(self._requeue, entries))
+
+    def _requeue(self, entries: list[tuple]) -> None:
+        """Stellt verworfene Einträge wieder an den Anfang des Puffers."""
+        self._buffer[:0] = entries
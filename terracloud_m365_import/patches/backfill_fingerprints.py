@@ -0,0 +1,36 @@
+import frappe
+from frappe.utils import flt, getdate
+from frappe.utils.fixtures import sync_fixtures
+from terracloud_m365_import.data.order import Order, PriceType
+
+def execute() -> None:
+    '''
+    Ergänzt den Fingerprint (siehe Order.fingerprint) der Subscription Plans, die vor seiner Einführung
+    importiert wurden. Ohne Fingerprint durchlaufen ihre Bestellungen bei jedem Import alle Schritte.
+
+    Der Fingerprint wird aus den gespeicherten Werten berechnet: Artikel, Abrechnungsintervall und Startdatum
+    des Plans sowie die Menge aus der Subscription. Pläne ohne Subscription oder Startdatum bleiben ohne Fingerprint.
+    '''
+    # Das Custom Field wird sonst erst nach den Patches angelegt
+    if not frappe.db.has_column('Subscription Plan', 'terracloud_fingerprint'):
+        sync_fixtures('terracloud_m365_import')
+
+    plans = frappe.db.sql('''
+        SELECT p.name, p.seller_orderno, p.customer, p.item, p.billing_interval, p.terracloud_start_date, d.qty
+        FROM `tabSubscription Plan` p
+        JOIN `tabSubscription Plan Detail` d ON d.plan = p.name AND d.parenttype = 'Subscription'
+        WHERE IFNULL(p.seller_orderno, '') != ''
+            AND IFNULL(p.terracloud_fingerprint, '') = ''
+            AND p.terracloud_start_date IS NOT NULL
+    ''', as_dict=True)
+
+    for plan in plans:
+        order = Order(
+            customer_no=plan.customer,
+            order_no=plan.seller_orderno,
+            article_no=plan.item,
+            quantity=flt(plan.qty),
+            start_date=getdate(plan.terracloud_start_date),
+            price_type=PriceType.YEARLY if plan.billing_interval == 'Year' else PriceType.MONTHLY
+        )
+        frappe.db.set_value('Subscription Plan', plan.name, 'terracloud_fingerprint', order.fingerprint, update_modified=False)
@@ -1,5 +1,19 @@
 import frappe
 from frappe.model.document import Document
+from functools import partial
+from itertools import islice
+
+# Feld mit dem Namen des Vertragspartners je Typ
+PARTY_NAME_FIELDS = {'Customer': 'customer_name', 'Supplier': 'supplier_name'}
+
+# Redis-Hash mit den Namen der Vertragspartner (siehe get_party_name)
+PARTY_NAME_CACHE = 'terracloud_party_names'
+
+# Lebensdauer des Hashs (Sekunden), begrenzt veraltete Namen nach Änderungen ohne Hooks (z.B. frappe.db.set_value)
+PARTY_NAME_CACHE_TTL = 3600
+
+# Maximale Anzahl an Werten in einer IN-Liste
+IN_LIST_SIZE = 500
 
 @frappe.whitelist()
 def get_party_name(party_type: str, party: str) -> str:
@@ -7,6 +21,10 @@ def get_party_name(party_type: str, party: str) -> str:
     Gibt den Namen eines Vertragspartners einer Subscription zurück.
     Kann der Kunden- oder Lieferantenname sein.
 
+    Die Namen werden im Cache gehalten und bei Änderung, Umbenennung oder Löschung
+    des Kunden bzw. Lieferanten verworfen (siehe clear_party_name). Der Cache läuft spätestens
+    nach PARTY_NAME_CACHE_TTL Sekunden ab.
+
     Args:
         party_type (str): Typ des Vertragspartners (Customer oder Supplier)
         party (str): Name des Vertragspartners
@@ -14,12 +32,52 @@ def get_party_name(party_type: str, party: str) -> str:
     Returns:
         str: Name des Vertragspartners
     '''
-    party_name = None
-    if party_type == 'Customer':
-        party_name = frappe.db.get_value('Customer', party, 'customer_name')
-    elif party_type == 'Supplier':
-        party_name = frappe.db.get_value('Supplier', party, 'supplier_name')
-    return party_name
+    return get_party_names(party_type, [party]).get(party)
+
+def get_party_names(party_type: str, parties: list[str]) -> dict[str, str]:
+    '''
+    Gibt die Namen mehrerer Vertragspartner zurück, z.B. für alle Kunden eines Import-Blocks.
+    Nicht im Cache vorhandene Namen werden mit einer Abfrage je IN_LIST_SIZE Vertragspartner geladen.
+
+    Args:
+        party_type (str): Typ des Vertragspartners (Customer oder Supplier)
+        parties (list[str]): Namen der Vertragspartner
+
+    Returns:
+        dict[str, str]: Name je gefundenem Vertragspartner (Schlüssel wie übergeben)
+    '''
+    name_field = PARTY_NAME_FIELDS.get(party_type)
+    if not name_field:
+        return {}
+
+    cache = frappe.cache()
+    party_names = {}
+    missing = {}
+    for party in parties:
+        if not party:
+            continue
+        party_name = cache.hget(PARTY_NAME_CACHE, get_cache_key(party_type, party))
+        if party_name is not None:
+            party_names[party] = party_name
+        else:
+            missing.setdefault(party.casefold(), []).append(party)
+
+    # Der Vergleich in der Datenbank ignoriert Groß-/Kleinschreibung
+    iterator = iter(missing)
+    while chunk := list(islice(iterator, IN_LIST_SIZE)):
+        for row in frappe.get_all(party_type, filters={'name': ('in', chunk)}, fields=['name', name_field]):
+            party_name = row.get(name_field)
+            cache.hset(PARTY_NAME_CACHE, get_cache_key(party_type, row.name), party_name)
+            for party in missing.get(row.name.casefold(), []):
+                party_names[party] = party_name
+
+    # Ablaufzeit nur setzen, wenn der Hash neu angelegt wurde, sonst würde sie ständig verlängert
+    if missing:
+        cache_key = cache.make_key(PARTY_NAME_CACHE)
+        if cache.ttl(cache_key) == -1:
+            cache.expire(cache_key, PARTY_NAME_CACHE_TTL)
+
+    return party_names
 
 def update_party_name(doc: Document, method: str) -> None:
     '''
@@ -31,4 +89,56 @@ def update_party_name(doc: Document, method: str) -> None:
         method (str): Methodenname
     '''
     party_name = get_party_name(doc.party_type, doc.party)
-    doc.party_name = party_name
\ No newline at end of file
+    doc.party_name = party_name
+
+def clear_party_name(doc: Document, method: str) -> None:
+    '''
+    Verwirft den gecachten Namen eines Kunden oder Lieferanten (on_update, on_trash).
+
+    Args:
+        doc (Document): Customer oder Supplier Dokument
+        method (str): Methodenname
+    '''
+    clear_cached_party_names(doc.doctype, [doc.name])
+
+def clear_renamed_party_name(doc: Document, method: str, old: str, new: str, merge: bool = False) -> None:
+    '''
+    Verwirft die gecachten Namen eines umbenannten Kunden oder Lieferanten (after_rename).
+    Beim Zusammenführen gilt für den neuen Namen der Name des Ziels.
+
+    Args:
+        doc (Document): Customer oder Supplier Dokument
+        method (str): Methodenname
+        old (str): Der bisherige Name
+        new (str): Der neue Name
+        merge (bool): Ob mit einem bestehenden Dokument zusammengeführt wurde
+    '''
+    clear_cached_party_names(doc.doctype, [old, new])
+
+def clear_cached_party_names(party_type: str, parties: list[str]) -> None:
+    '''
+    Verwirft die gecachten Namen sofort und erneut nach dem Commit. Sonst könnte ein gleichzeitiger
+    Aufruf von get_party_name zwischen dem Verwerfen und dem Commit den alten Namen wieder cachen.
+
+    Args:
+        party_type (str): Typ des Vertragspartners (Customer oder Supplier)
+        parties (list[str]): Namen der Vertragspartner
+    '''
+    for party in parties:
+        key = get_cache_key(party_type, party)
+        frappe.cache().hdel(PARTY_NAME_CACHE, key)
+        frappe.db.after_commit.add(partial(frappe.cache().hdel, PARTY_NAME_CACHE, key))
+
+def get_cache_key(party_type: str, party: str) -> str:
+    '''
+    Gibt den Schlüssel eines Vertragspartners im Cache zurück.
+    Groß-/Kleinschreibung wird wie in der Datenbank ignoriert.
+
+    Args:
+        party_type (str): Typ des Vertragspartners (Customer oder Supplier)
+        party (str): Name des Vertragspartners
+
+    Returns:
+        str: Der Schlüssel
+    '''
+    return f'{party_type}::{party.casefold()}'
@@ -0,0 +1,61 @@
+# Copyright (c) 2024, PC-Giga and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from unittest.mock import patch
+from terracloud_m365_import.benchmarks.csv_generator import get_customer_nos
+from terracloud_m365_import.benchmarks.import_benchmark import setup_master_data
+from terracloud_m365_import.terracloud_m365_import.doctype.subscription import subscription
+from terracloud_m365_import.terracloud_m365_import.doctype.subscription.subscription import (
+	get_party_name, get_party_names, PARTY_NAME_CACHE
+)
+
+
+class TestSubscription(FrappeTestCase):
+	def setUp(self):
+		setup_master_data(3)
+		self.customer_nos = get_customer_nos(3)
+		frappe.cache().delete_value(PARTY_NAME_CACHE)
+		self.addCleanup(frappe.cache().delete_value, PARTY_NAME_CACHE)
+		self.addCleanup(frappe.db.rollback)
+
+	def test_party_name_is_served_from_cache(self):
+		customer_no = self.customer_nos[0]
+		party_name = get_party_name('Customer', customer_no)
+
+		# Direkte Schreibzugriffe lösen keine Hooks aus, der Name kommt weiter aus dem Cache
+		frappe.db.set_value('Customer', customer_no, 'customer_name', 'Geändert ohne Hooks')
+		self.assertEqual(get_party_name('Customer', customer_no), party_name)
+		self.assertEqual(get_party_name('Customer', customer_no.lower()), party_name)
+		self.assertGreater(frappe.cache().ttl(frappe.cache().make_key(PARTY_NAME_CACHE)), 0)
+
+	def test_update_clears_party_name(self):
+		customer_no = self.customer_nos[0]
+		get_party_name('Customer', customer_no)
+
+		customer = frappe.get_doc('Customer', customer_no)
+		customer.customer_name = 'Neuer Name'
+		customer.save()
+		self.assertEqual(get_party_name('Customer', customer_no), 'Neuer Name')
+
+	def test_rename_clears_party_names(self):
+		customer_no = self.customer_nos[0]
+		party_name = get_party_name('Customer', customer_no)
+		self.assertIsNone(get_party_name('Customer', 'TC-UMBENANNT'))
+
+		frappe.rename_doc('Customer', customer_no, 'TC-UMBENANNT')
+		self.assertIsNone(get_party_name('Customer', customer_no))
+		self.assertEqual(get_party_name('Customer', 'TC-UMBENANNT'), party_name)
+
+	def test_party_names_are_loaded_in_batches(self):
+		with patch.object(subscription, 'IN_LIST_SIZE', 2), \
+				patch.object(subscription.frappe, 'get_all', wraps=frappe.get_all) as get_all:
+			party_names = get_party_names('Customer', self.customer_nos + ['TC-UNBEKANNT'])
+			self.assertEqual(get_all.call_count, 2)
+			self.assertEqual(set(party_names), set(self.customer_nos))
+
+			# Alle gefundenen Namen stehen jetzt im Cache
+			get_all.reset_mock()
+			self.assertEqual(get_party_names('Customer', self.customer_nos), party_names)
+			get_all.assert_not_called()
@@ -1,4 +1,29 @@
 frappe.ui.form.on('Terracloud Import', {
+    setup: function(frm) {
+        // Ergebnis des Probelaufs anzeigen, sobald der Hintergrund-Job fertig ist
+        frappe.realtime.off('terracloud_import_preview');
+        frappe.realtime.on('terracloud_import_preview', function(data) {
+            if (data.terracloud_import !== frm.doc.name) {
+                return;
+            }
+            if (data.error) {
+                frappe.msgprint({title: __('Vorschau fehlgeschlagen'), indicator: 'red', message: frappe.utils.escape_html(data.error)});
+                return;
+            }
+            frappe.call({
+                method: 'terracloud_m365_import.terracloud_m365_import.doctype.terracloud_import.terracloud_import.get_import_preview',
+                args: {
+                    'terracloud_import_id': frm.doc.name
+                },
+                callback: function(r) {
+                    if (r.message) {
+                        show_import_preview(r.message);
+                    }
+                }
+            });
+        });
+    },
+
     refresh: function(frm) {
         if (!frm.is_new() && frm.doc.import_status !== 'Abgeschlossen') {
 
@@ -16,6 +41,35 @@ frappe.ui.form.on('Terracloud Import', {
                 });
             });
 
+            // Button: Import fortsetzen (nur nicht abgeschlossene Teile, jeweils ab dem Checkpoint)
+            if (frm.doc.import_status !== 'Ausstehend' && (frm.doc.shards || []).some(shard => shard.status !== 'Abgeschlossen')) {
+                frm.add_custom_button(__('Fortsetzen'), function() {
+                    frappe.call({
+                        method: 'terracloud_m365_import.terracloud_m365_import.doctype.terracloud_import.terracloud_import.resume_import',
+                        args: {
+                            'terracloud_import_id': frm.doc.name
+                        },
+                        callback: function() {
+                            frappe.msgprint(__('Import wird fortgesetzt.'));
+                            frm.reload_doc();
+                        }
+                    });
+                });
+            }
+
+            // Button: Vorschau (Probelauf ohne Schreibzugriffe, läuft im Hintergrund)
+            frm.add_custom_button(__('Vorschau'), function() {
+                frappe.call({
+                    method: 'terracloud_m365_import.terracloud_m365_import.doctype.terracloud_import.terracloud_import.preview_import',
+                    args: {
+                        'terracloud_import_id': frm.doc.name
+                    },
+                    callback: function() {
+                        frappe.show_alert(__('Vorschau wird im Hintergrund berechnet...'));
+                    }
+                });
+            });
+
             // Button: Daten löschen (nur in DEV)
             if (frappe.boot.developer_mode) {
                 frm.add_custom_button(__('Daten löschen'), function() {
@@ -30,4 +84,25 @@ frappe.ui.form.on('Terracloud Import', {
             }
         }
     }
-});
\ No newline at end of file
+});
+
+function show_import_preview(preview) {
+    const columns = ['plans', 'new_subscriptions', 'updated_subscriptions', 'invoices', 'invoice_total'];
+    const labels = [__('Kunde'), __('Pläne'), __('Neue Subscriptions'), __('Geänderte Subscriptions'), __('Rechnungen'), __('Summe')];
+    const row = (label, values) => `<tr><td>${frappe.utils.escape_html(label)}</td>${
+        columns.map(column => `<td class="text-right">${column === 'invoice_total' ? format_currency(values[column]) : values[column]}</td>`).join('')
+    }</tr>`;
+    const errors = preview.log.filter(entry => entry.status === 'Fehler').length;
+
+    frappe.msgprint({
+        title: __('Vorschau des Imports'),
+        wide: true,
+        message: `
+            <table class="table table-bordered table-condensed">
+                <thead><tr>${labels.map(label => `<th>${label}</th>`).join('')}</tr></thead>
+                <tbody>${preview.customers.map(customer => row(customer.customer, customer)).join('')}</tbody>
+                <tfoot>${row(__('Gesamt'), preview.totals)}</tfoot>
+            </table>
+            <p>${__('Fehlerhafte Einträge: {0}', [errors])}</p>`
+    });
+}
\ No newline at end of file
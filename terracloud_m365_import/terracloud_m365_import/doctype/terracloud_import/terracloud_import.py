@@ -1,5 +1,6 @@
 import frappe
 from frappe.model.document import Document
+from frappe.utils.background_jobs import is_job_enqueued
 import csv
 import io
 from collections import defaultdict
@@ -9,38 +10,294 @@ from terracloud_m365_import.data.order_factory import OrderFactory
 from terracloud_m365_import.data.subscription_plan_factory import SubscriptionPlanFactory
 from terracloud_m365_import.logger import Logger
 from terracloud_m365_import.data.order_importer import OrderImporter
+from terracloud_m365_import.data.import_scheduler import ImportScheduler, ImportEstimate, ImportPlan
+from terracloud_m365_import.data.import_file import ImportFile
+
+# Wie lange der Bericht eines Probelaufs abrufbar bleibt (Sekunden)
+PREVIEW_CACHE_TTL = 3600
 
 class TerracloudImport(Document):
-    def process_import_job(self) -> None:
+    def validate(self) -> None:
+        '''
+        Ein Import benötigt mindestens eine Datei (CSV-Datei oder Zip-Archiv).
         '''
-        Verarbeitet einen Terracloud-Import.
-        Liest die hochgeladene .csv-Datei aus und erstellt entsprechende Subscriptions.
+        if not self.csv_file and not any(row.file for row in self.files):
+            frappe.throw('Bitte eine CSV-Datei oder ein Zip-Archiv anhängen.')
+
+    def process_import_job(self, shard_index: int = 0) -> None:
+        '''
+        Verarbeitet einen Teil (Shard) eines Terracloud-Imports.
+        Liest die hochgeladene .csv-Datei aus und erstellt entsprechende Subscriptions
+        für die Kunden dieses Teils.
 
         Monatliche Abrechnungen werden pro Kunde zusammengefasst.
         Jährliche Abrechnungen werden pro Bestellung erstellt.
+
+        Args:
+            shard_index (int): Der Index des zu verarbeitenden Teils.
         '''
-        #terracloud_import = frappe.get_doc('Terracloud Import', terracloud_import_id)
         settings = frappe.get_single('Terracloud Import Settings')
+        shard = self._get_shard(shard_index)
+        self._set_shard_status(shard, 'In Bearbeitung', started=frappe.utils.now())
+
+        order_importer = OrderImporter(self, settings, shard_index, len(self.shards))
+        try:
+            order_importer.start_import()
+        except Exception:
+            self._set_shard_status(shard, 'Fehlgeschlagen', finished=frappe.utils.now())
+            self._complete_if_finished()
+            raise
+
+        self._set_shard_status(shard, 'Abgeschlossen', finished=frappe.utils.now())
+        self._complete_if_finished()
+
+    def prepare_shards(self, shard_count: int, estimate: ImportEstimate = None) -> None:
+        '''
+        Legt die Teile (Shards) des Imports an und setzt den Import auf 'In Bearbeitung'.
+
+        Args:
+            shard_count (int): Die Anzahl der Teile.
+            estimate (ImportEstimate): Optional: Der geschätzte Aufwand (siehe ImportScheduler).
+        '''
+        if estimate:
+            self.estimated_rows = estimate.rows
+            self.estimated_duration = round(estimate.seconds)
+
+        self.shards = []
+        for shard_index in range(shard_count):
+            self.append('shards', {'shard_index': shard_index, 'status': 'Ausstehend'})
+        self.import_status = 'In Bearbeitung'
+        self.save(ignore_permissions=True)
+
+    def prepare_resume(self) -> list[int]:
+        '''
+        Setzt alle nicht abgeschlossenen Teile ohne laufenden Job zurück auf 'Ausstehend',
+        damit sie ab ihrem Checkpoint fortgesetzt werden können (siehe ImportCheckpoint).
+
+        Returns:
+            list[int]: Die Indizes der fortzusetzenden Teile.
+        '''
+        shard_indexes = []
+        for shard in self.shards:
+            # Teile, deren Job noch wartet oder läuft, nicht doppelt starten
+            if shard.status != 'Abgeschlossen' and not is_job_enqueued(get_shard_job_id(self.name, shard.shard_index)):
+                shard.status = 'Ausstehend'
+                shard_indexes.append(shard.shard_index)
+
+        if shard_indexes:
+            self.import_status = 'In Bearbeitung'
+            self.save(ignore_permissions=True)
+        return shard_indexes
+
+    def _get_shard(self, shard_index: int) -> Document:
+        '''
+        Gibt die Zeile eines Teils zurück.
+
+        Args:
+            shard_index (int): Der Index des Teils.
+
+        Returns:
+            Document: Die Zeile aus der Tabelle 'shards'.
+
+        Raises:
+            ValueError: Falls der Teil nicht existiert.
+        '''
+        for shard in self.shards:
+            if shard.shard_index == shard_index:
+                return shard
+        raise ValueError(f'Shard {shard_index} existiert nicht für Import {self.name}')
+
+    def _set_shard_status(self, shard: Document, status: str, **values) -> None:
+        '''
+        Aktualisiert den Status eines Teils und committet sofort, damit parallele Jobs ihn sehen.
+        Es wird nur die Zeile des Teils geschrieben, nicht der ganze Import.
+
+        Args:
+            shard (Document): Die Zeile des Teils.
+            status (str): Der neue Status.
+            **values: Weitere Felder, die gesetzt werden sollen.
+        '''
+        values['status'] = status
+        shard.update(values)
+        frappe.db.set_value('Terracloud Import Shard', shard.name, values, update_modified=False)
+        frappe.db.commit()
 
-        order_importer = OrderImporter(self, settings)
-        order_importer.start_import()
+    def _complete_if_finished(self) -> None:
+        '''
+        Fan-in: Sind alle Teile beendet, wird der Gesamtstatus des Imports gesetzt.
+        Der Status ist 'Fehlgeschlagen', sobald ein Teil fehlgeschlagen ist.
+        Da jeder Job seinen eigenen Status vor dieser Prüfung committet, sieht spätestens
+        der zuletzt fertige Job alle Teile als beendet.
+        '''
+        statuses = frappe.get_all(
+            'Terracloud Import Shard',
+            filters={'parenttype': 'Terracloud Import', 'parent': self.name},
+            pluck='status'
+        )
+        if any(status in ('Ausstehend', 'In Bearbeitung') for status in statuses):
+            return
+
+        import_status = 'Fehlgeschlagen' if 'Fehlgeschlagen' in statuses else 'Abgeschlossen'
+        frappe.db.set_value('Terracloud Import', self.name, 'import_status', import_status)
+        frappe.db.commit()
 
 @frappe.whitelist()
 def process_import(terracloud_import_id) -> None:
-    frappe.enqueue_doc(
-        "Terracloud Import",
-        terracloud_import_id,
-        "process_import_job",
-        queue="long",
-        timeout=5000
+    '''
+    Startet einen Terracloud-Import.
+    Der Aufwand der Datei wird geschätzt und die Kunden auf so viele parallele Jobs verteilt,
+    dass jeder Job etwa die angestrebte Laufzeit hat (siehe ImportScheduler).
+
+    Ein Import, der bereits läuft oder abgeschlossen ist, wird nicht erneut gestartet.
+    Ein abgebrochener Import wird über resume_import fortgesetzt.
+    '''
+    settings = frappe.get_single('Terracloud Import Settings')
+
+    # Zeile sperren, damit gleichzeitige Aufrufe nacheinander den Status prüfen
+    import_status = frappe.db.get_value('Terracloud Import', terracloud_import_id, 'import_status', for_update=True)
+    if import_status in ('In Bearbeitung', 'Abgeschlossen'):
+        return
+
+    terracloud_import = frappe.get_doc('Terracloud Import', terracloud_import_id)
+
+    scheduler = ImportScheduler(settings)
+    estimate = scheduler.estimate(ImportFile.get_import_files(terracloud_import))
+    plan = scheduler.plan(estimate)
+
+    terracloud_import.prepare_shards(plan.shard_count, estimate)
+
+    # Die Jobs müssen die angelegten Teile sehen
+    frappe.db.commit()
+
+    enqueue_shards(terracloud_import_id, range(plan.shard_count), plan)
+
+@frappe.whitelist()
+def resume_import(terracloud_import_id) -> None:
+    '''
+    Setzt einen abgebrochenen Terracloud-Import fort.
+    Nur die nicht abgeschlossenen Teile werden erneut gestartet; jeder Teil beginnt an seinem Checkpoint.
+    '''
+    settings = frappe.get_single('Terracloud Import Settings')
+    terracloud_import = frappe.get_doc('Terracloud Import', terracloud_import_id)
+    shard_indexes = terracloud_import.prepare_resume()
+    if not shard_indexes:
+        frappe.throw(f'Import {terracloud_import_id} enthält keine fortsetzbaren Teile')
+
+    # Die Jobs müssen die zurückgesetzten Teile sehen
+    frappe.db.commit()
+
+    # Die Aufteilung der Kunden steht bereits fest, nur Timeout und Queue werden neu bestimmt
+    scheduler = ImportScheduler(settings)
+    estimate = scheduler.estimate(ImportFile.get_import_files(terracloud_import))
+    enqueue_shards(terracloud_import_id, shard_indexes, scheduler.plan(estimate, len(terracloud_import.shards)))
+
+def enqueue_shards(terracloud_import_id: str, shard_indexes: list[int], plan: ImportPlan) -> None:
+    '''
+    Startet für jeden Teil des Imports einen eigenen Hintergrund-Job.
+
+    Args:
+        terracloud_import_id (str): Der Name des Terracloud Imports.
+        shard_indexes (list[int]): Die Indizes der zu startenden Teile.
+        plan (ImportPlan): Queue und Timeout der Jobs.
+    '''
+    for shard_index in shard_indexes:
+        # Wartet oder läuft der Job eines Teils bereits, wird kein zweiter eingereiht
+        frappe.enqueue_doc(
+            "Terracloud Import",
+            terracloud_import_id,
+            "process_import_job",
+            queue=plan.queue,
+            timeout=plan.timeout,
+            job_id=get_shard_job_id(terracloud_import_id, shard_index),
+            deduplicate=True,
+            shard_index=shard_index
+        )
+
+def get_shard_job_id(terracloud_import_id: str, shard_index: int) -> str:
+    '''
+    Gibt die eindeutige Job-ID eines Import-Teils zurück.
+
+    Args:
+        terracloud_import_id (str): Der Name des Terracloud Imports.
+        shard_index (int): Der Index des Teils.
+
+    Returns:
+        str: Die Job-ID.
+    '''
+    return f'terracloud_import::{terracloud_import_id}::{shard_index}'
+
+@frappe.whitelist()
+def preview_import(terracloud_import_id) -> None:
+    '''
+    Startet einen Probelauf des Imports als Hintergrund-Job, da große Dateien länger als ein Web-Request
+    brauchen. Der Benutzer wird per Realtime-Ereignis 'terracloud_import_preview' benachrichtigt,
+    sobald das Ergebnis vorliegt (siehe get_import_preview).
+    '''
+    settings = frappe.get_single('Terracloud Import Settings')
+    terracloud_import = frappe.get_doc('Terracloud Import', terracloud_import_id)
+
+    # Der Probelauf verarbeitet die ganze Datei in einem Job
+    scheduler = ImportScheduler(settings)
+    plan = scheduler.plan(scheduler.estimate(ImportFile.get_import_files(terracloud_import)), 1)
+
+    frappe.enqueue(
+        'terracloud_m365_import.terracloud_m365_import.doctype.terracloud_import.terracloud_import.run_import_preview',
+        queue=plan.queue,
+        timeout=plan.timeout,
+        job_id=f'terracloud_import_preview::{terracloud_import_id}',
+        deduplicate=True,
+        terracloud_import_id=terracloud_import_id,
+        user=frappe.session.user
     )
 
+def run_import_preview(terracloud_import_id: str, user: str) -> None:
+    '''
+    Führt den Probelauf aus, ohne Daten zu schreiben, und legt den Bericht für PREVIEW_CACHE_TTL Sekunden
+    im Cache ab.
+
+    Args:
+        terracloud_import_id (str): Der Name des Terracloud Imports.
+        user (str): Der Benutzer, der benachrichtigt wird.
+    '''
+    terracloud_import = frappe.get_doc('Terracloud Import', terracloud_import_id)
+    settings = frappe.get_single('Terracloud Import Settings')
+
+    try:
+        preview = OrderImporter(terracloud_import, settings, dry_run=True).start_import()
+    except Exception as e:
+        frappe.publish_realtime('terracloud_import_preview', {'terracloud_import': terracloud_import_id, 'error': str(e)}, user=user)
+        raise
+    finally:
+        # Sicherstellen, dass auch versehentliche Schreibzugriffe verworfen werden
+        frappe.db.rollback()
+
+    frappe.cache().set_value(get_preview_cache_key(terracloud_import_id), preview, expires_in_sec=PREVIEW_CACHE_TTL)
+    frappe.publish_realtime('terracloud_import_preview', {'terracloud_import': terracloud_import_id}, user=user)
+
+@frappe.whitelist()
+def get_import_preview(terracloud_import_id) -> dict | None:
+    '''
+    Gibt den Bericht des letzten Probelaufs zurück.
+
+    Returns:
+        dict | None: Anzahlen und Beträge der Pläne, Subscriptions und Rechnungen pro Kunde (siehe ImportPreview),
+            None, falls kein (aktueller) Probelauf vorliegt.
+    '''
+    return frappe.cache().get_value(get_preview_cache_key(terracloud_import_id))
+
+def get_preview_cache_key(terracloud_import_id: str) -> str:
+    '''Gibt den Cache-Schlüssel des Probelaufs eines Imports zurück.'''
+    return f'terracloud_import_preview::{terracloud_import_id}'
+
 @frappe.whitelist()
 def delete_data() -> None:
     '''
-    Löscht alle Rechnungen, Subscriptions und Subscription Plans.
+    Löscht alle Rechnungen (inkl. vorgemerkter), Subscriptions, Subscription Plans und gestagten Zeilen.
     ACHTUNG: Nur auf Dev-Seiten verwenden!
     '''
     frappe.db.delete('Sales Invoice')
+    frappe.db.delete('Terracloud Invoice Intent')
+    frappe.db.delete('Terracloud Invoice Intent Item')
     frappe.db.delete('Subscription')
-    frappe.db.delete('Subscription Plan')
\ No newline at end of file
+    frappe.db.delete('Subscription Plan')
+    frappe.db.delete('Terracloud Import Row')
\ No newline at end of file
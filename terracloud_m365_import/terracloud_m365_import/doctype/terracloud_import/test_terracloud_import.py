@@ -1,9 +1,327 @@
 # Copyright (c) 2024, PC-Giga and Contributors
 # See license.txt
 
-# import frappe
+import calendar
+import csv
+import frappe
+import os
+import random
+import tempfile
+import unittest
+import zipfile
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import getdate
+from unittest.mock import Mock, patch
+from terracloud_m365_import.benchmarks.csv_generator import (
+	generate_terracloud_csv, get_customer_nos, get_article_nos, COLUMNS, ORDER_PREFIX
+)
+from terracloud_m365_import.benchmarks.import_benchmark import setup_master_data, cleanup
+from terracloud_m365_import.data.billing_engine import BillingEngine
+from terracloud_m365_import.data.columnar_converter import ColumnarConverter
+from terracloud_m365_import.data.order import Order, PriceType
+from terracloud_m365_import.data.order_factory import OrderFactory
+from terracloud_m365_import.data.order_importer import OrderImporter
+from terracloud_m365_import.data.import_file import ImportFile
+from terracloud_m365_import.data.price_index import PriceIndex
+
+
+def write_csv(file_path, rows):
+	with open(file_path, mode='w', encoding='latin-1', newline='') as csvfile:
+		writer = csv.writer(csvfile, delimiter=';')
+		writer.writerow(COLUMNS)
+		writer.writerows(rows)
+
+def create_import(files):
+	"""Legt einen Import mit den CSV-Dateien an (erste Datei als csv_file, weitere in der Tabelle files)."""
+	file_urls = []
+	with tempfile.TemporaryDirectory() as directory:
+		for file_name, rows in files.items():
+			file_path = os.path.join(directory, file_name)
+			write_csv(file_path, rows)
+			with open(file_path, mode='rb') as file:
+				file_urls.append(frappe.get_doc({
+					'doctype': 'File',
+					'file_name': file_name,
+					'is_private': 1,
+					'content': file.read()
+				}).insert(ignore_permissions=True).file_url)
+
+	terracloud_import = frappe.get_doc({
+		'doctype': 'Terracloud Import',
+		'csv_file': file_urls[0],
+		'files': [{'file': file_url} for file_url in file_urls[1:]]
+	}).insert()
+	terracloud_import.prepare_shards(1)
+	frappe.db.commit()
+	return terracloud_import
+
+def get_price_by_query(price_list, item_code, customer, valuation_date):
+	"""Preissuche wie vor dem PriceIndex: eine Abfrage mit frappe.get_value je Stufe."""
+	filters = {
+		'item_code': item_code,
+		'customer': customer,
+		'price_list': price_list,
+		'valid_from': ('<=', valuation_date),
+		'valid_upto': ('>=', valuation_date)
+	}
+	for field in (None, 'customer', 'valid_from', 'valid_upto'):
+		if field:
+			filters.pop(field)
+		price = frappe.get_value('Item Price', filters, 'price_list_rate')
+		if price:
+			return price
+
+
+def get_missed_invoices_by_loop(order, get_full_price):
+	"""Verpasste Zeiträume und Preise wie vor der BillingEngine: Schleife je Rechnung, Kalender je Zeitraum."""
+	def get_unit_price(from_date, to_date):
+		if order.price_type == PriceType.MONTHLY and to_date == from_date + relativedelta(months=1, days=-1):
+			return get_full_price(order, from_date)
+		if order.price_type == PriceType.YEARLY and to_date == from_date + relativedelta(years=1, days=-1):
+			return get_full_price(order, from_date)
+
+		full_price = get_full_price(order, from_date)
+		if not full_price:
+			return None
+		billing_days = (to_date - from_date).days + 1
+		if order.price_type == PriceType.MONTHLY:
+			all_days = calendar.monthrange(from_date.year, from_date.month)[1]
+		else:
+			all_days = 366 if calendar.isleap(from_date.year) else 365
+		return round(full_price / all_days * billing_days, 2)
+
+	invoices = []
+	end_date = order.subscription.current_invoice_start
+	current_start = order.start_date
+	while current_start < end_date:
+		if order.price_type == PriceType.MONTHLY:
+			current_end = current_start + relativedelta(months=1)
+		elif order.price_type == PriceType.YEARLY:
+			current_end = current_start + relativedelta(years=1)
+		else:
+			break
+		current_end = min(current_end, end_date) - relativedelta(days=1)
+		invoices.append((current_start, current_end, get_unit_price(current_start, current_end)))
+		current_start = current_end + relativedelta(days=1)
+	return invoices
+
+def get_test_price(order, valuation_date):
+	"""Voller Preis abhängig vom Bewertungsdatum; Artikel 'TC-OHNE-PREIS' hat keinen Preis."""
+	if order.article_no == 'TC-OHNE-PREIS':
+		return None
+	return round(9.99 + valuation_date.month * 1.37 + valuation_date.day * 0.11, 2)
 
 
 class TestTerracloudImport(FrappeTestCase):
-	pass
+	def test_generated_csv_matches_terracloud_format(self):
+		with tempfile.TemporaryDirectory() as directory:
+			file_path = os.path.join(directory, 'terracloud.csv')
+			generate_terracloud_csv(file_path, 50, customers=5, yearly_share=0.5)
+			rows = list(OrderFactory._parse_csv(file_path))
+
+		self.assertEqual(len(rows), 50)
+		self.assertEqual(list(rows[0].keys()), COLUMNS)
+		self.assertEqual(len({row['Bestellnummer'] for row in rows}), 50)
+		self.assertTrue({row['Preistyp'] for row in rows} <= {'1', '5'})
+
+	def test_zip_members_are_parsed_like_csv_files(self):
+		with tempfile.TemporaryDirectory() as directory:
+			file_path = os.path.join(directory, 'terracloud.csv')
+			generate_terracloud_csv(file_path, 20, customers=2)
+			archive_path = os.path.join(directory, 'terracloud.zip')
+			with zipfile.ZipFile(archive_path, 'w') as archive:
+				archive.write(file_path, 'reseller_a.csv')
+
+			import_file = ImportFile('terracloud.zip/reseller_a.csv', archive_path, 'reseller_a.csv')
+			self.assertEqual(import_file.size, os.path.getsize(file_path))
+			self.assertEqual(list(OrderFactory._parse_csv(import_file)), list(OrderFactory._parse_csv(file_path)))
+
+	@unittest.skipUnless(ColumnarConverter.is_available(), 'pyarrow ist nicht installiert')
+	def test_columnar_conversion_matches_row_conversion(self):
+		valid = {
+			'CustomID': 'TC-KUNDE', 'Bestellnummer': 'TC-BESTELLUNG', 'Artikelnummer': 'TC-ARTIKEL',
+			'Menge': '5', 'MicrosoftSubscriptionStartDate': '29.02.2024 13:45:00', 'Preistyp': '1'
+		}
+		variants = [
+			{},
+			{'Menge': '2.5', 'Preistyp': '5'},
+			{'MicrosoftSubscriptionStartDate': '31.02.2024 00:00:00'},
+			{'MicrosoftSubscriptionStartDate': '29.02.2023 00:00:00'},
+			{'MicrosoftSubscriptionStartDate': '01.01.2024 24:00:00'},
+			{'MicrosoftSubscriptionStartDate': '1.1.2024 00:00:00'},
+			{'MicrosoftSubscriptionStartDate': ''},
+			{'Menge': '5.'},
+			{'Menge': '1e3'},
+			{'Menge': ' 5'},
+			{'Menge': '-0'},
+			{'Menge': ''},
+			{'Menge': 'fünf'},
+			{'Preistyp': '3'},
+			{'Preistyp': ''},
+			{'Menge': None},
+		]
+		rows = [{**valid, **variant} for variant in variants]
+		row_nos = list(range(1, len(rows) + 1))
+
+		fallback = Mock(wraps=OrderFactory.order_from_row)
+		results = ColumnarConverter.convert(rows, row_nos, fallback)
+
+		# Eindeutige Werte werden spaltenweise umgewandelt, die übrigen Zeilen einzeln
+		self.assertNotIn(1, [call.args[1] for call in fallback.call_args_list])
+
+		for row, row_no, result in zip(rows, row_nos, results):
+			with self.subTest(row=row):
+				try:
+					expected = OrderFactory.order_from_row(row, row_no)
+				except Exception as e:
+					expected = e
+
+				self.assertIs(type(result), type(expected))
+				if isinstance(expected, Exception):
+					self.assertEqual(str(result), str(expected))
+				else:
+					self.assertEqual(result, expected)
+					self.assertIs(type(result.quantity), float)
+					self.assertIs(type(result.start_date), date)
+
+	def test_billing_engine_matches_invoice_loop(self):
+		def create_order(start_date, end_date, price_type, article_no='TC-ARTIKEL'):
+			order = Order('TC-KUNDE', 'TC-BESTELLUNG', article_no, 1, start_date, price_type)
+			order._subscription = frappe._dict(current_invoice_start=end_date)
+			return order
+
+		# Schaltjahre, Monatsenden und fehlende Preise
+		orders = [
+			create_order(date(2024, 2, 29), date(2025, 3, 15), PriceType.MONTHLY),
+			create_order(date(2024, 2, 29), date(2028, 3, 1), PriceType.YEARLY),
+			create_order(date(2023, 1, 31), date(2023, 6, 30), PriceType.MONTHLY),
+			create_order(date(2023, 12, 31), date(2024, 3, 31), PriceType.MONTHLY),
+			create_order(date(2023, 3, 31), date(2024, 2, 29), PriceType.YEARLY),
+			create_order(date(2024, 1, 31), date(2024, 2, 1), PriceType.MONTHLY),
+			create_order(date(2024, 5, 1), date(2024, 5, 1), PriceType.MONTHLY),
+			create_order(date(2024, 1, 15), date(2024, 4, 10), PriceType.MONTHLY, 'TC-OHNE-PREIS')
+		]
+
+		# Zufällige Bestellungen über mehrere Jahre
+		rng = random.Random(42)
+		for _ in range(500):
+			start_date = date(2019, 1, 1) + timedelta(days=rng.randrange(6 * 365))
+			orders.append(create_order(start_date, start_date + timedelta(days=rng.randrange(1000)), rng.choice(list(PriceType))))
+
+		missed_periods = BillingEngine(get_test_price).get_missed_periods(orders)
+
+		self.assertEqual([order for order, _ in missed_periods], orders)
+		for order, periods in missed_periods:
+			with self.subTest(start_date=order.start_date, end_date=order.subscription.current_invoice_start, price_type=order.price_type):
+				self.assertEqual(
+					[(period.from_date, period.to_date, period.unit_price) for period in periods],
+					get_missed_invoices_by_loop(order, get_test_price)
+				)
+
+	def test_multi_file_import_checkpoints_and_stages_each_block(self):
+		setup_master_data(2)
+		customer_nos = get_customer_nos(2)
+		article_no = get_article_nos(1)[0]
+		start_date = date.today().replace(day=1).strftime('%d.%m.%Y 00:00:00')
+
+		def rows(first, count):
+			return [
+				[customer_nos[index % 2], f'{ORDER_PREFIX}T{index:07d}', article_no, 1, start_date, '1']
+				for index in range(first, first + count)
+			]
+
+		# Die erste Datei ist kürzer als ein Block, der Block endet also am Dateiwechsel
+		terracloud_import = create_import({
+			'terracloud_benchmark_a.csv': rows(1, 3),
+			'terracloud_benchmark_b.csv': rows(4, 2)
+		})
+		self.addCleanup(cleanup)
+
+		importer = OrderImporter(terracloud_import, frappe.get_single('Terracloud Import Settings'))
+		with patch.object(importer.checkpoint, 'complete_chunk', wraps=importer.checkpoint.complete_chunk) as complete_chunk:
+			importer.start_import()
+
+		self.assertEqual([call.args[0] for call in complete_chunk.call_args_list], [3, 5])
+		self.assertEqual(frappe.db.get_value('Terracloud Import Shard', {'parent': terracloud_import.name}, 'checkpoint_row'), 5)
+
+		states = dict(frappe.get_all(
+			'Terracloud Import Row',
+			filters={'terracloud_import': terracloud_import.name},
+			fields=['row_no', 'state'],
+			as_list=True
+		))
+		self.assertEqual(states, {row_no: 'Verarbeitet' for row_no in range(1, 6)})
+
+	def test_reimport_without_new_orders_completes_all_rows(self):
+		setup_master_data(2)
+		customer_nos = get_customer_nos(2)
+		article_no = get_article_nos(1)[0]
+		start_date = date.today().replace(day=1).strftime('%d.%m.%Y 00:00:00')
+		existing = [
+			[customer_nos[index % 2], f'{ORDER_PREFIX}T{index:07d}', article_no, 1, start_date, '1']
+			for index in range(1, 4)
+		]
+		self.addCleanup(cleanup)
+
+		first_import = create_import({'terracloud_benchmark_a.csv': existing})
+		OrderImporter(first_import, frappe.get_single('Terracloud Import Settings')).start_import()
+
+		# Nur bereits importierte, nicht validierbare und nicht umwandelbare Zeilen: der Block bleibt leer
+		rows = existing + [
+			['TC-UNBEKANNT', f'{ORDER_PREFIX}T0000004', article_no, 1, start_date, '1'],
+			[customer_nos[0], f'{ORDER_PREFIX}T0000005', article_no, 'eins', start_date, '1']
+		]
+		terracloud_import = create_import({'terracloud_benchmark_b.csv': rows})
+		OrderImporter(terracloud_import, frappe.get_single('Terracloud Import Settings')).start_import()
+
+		states = dict(frappe.get_all(
+			'Terracloud Import Row',
+			filters={'terracloud_import': terracloud_import.name},
+			fields=['row_no', 'state'],
+			as_list=True
+		))
+		self.assertEqual(states, {1: 'Übersprungen', 2: 'Übersprungen', 3: 'Übersprungen', 4: 'Fehlerhaft', 5: 'Ungültig'})
+		self.assertEqual(frappe.db.get_value('Terracloud Import Shard', {'parent': terracloud_import.name}, 'checkpoint_row'), 4)
+
+	def test_price_index_matches_item_price_lookup(self):
+		setup_master_data(1)
+		self.addCleanup(frappe.db.rollback)
+		customer_no = get_customer_nos(1)[0]
+		article_no = get_article_nos(1)[0]
+		price_list = frappe.get_doc({
+			'doctype': 'Price List',
+			'price_list_name': 'Terracloud Test',
+			'currency': frappe.db.get_value('Price List', {'selling': 1}, 'currency'),
+			'selling': 1
+		}).insert().name
+
+		# Mehrere passende Preise je Stufe; die Reihenfolge der Änderung weicht von der der Namen ab
+		prices = [
+			(None, '2000-01-01', '2099-12-31', 10),
+			(customer_no, '2021-01-01', '2099-12-31', 50),
+			(None, '2000-01-01', '2010-12-31', 30),
+			(customer_no, '2000-01-01', '2099-12-31', 40),
+			(None, '2020-01-01', '2099-12-31', 20)
+		]
+		for index, (customer, valid_from, valid_upto, rate) in enumerate(prices, start=1):
+			name = frappe.get_doc({
+				'doctype': 'Item Price',
+				'item_code': article_no,
+				'price_list': price_list,
+				'customer': customer,
+				'valid_from': valid_from,
+				'valid_upto': valid_upto,
+				'price_list_rate': rate
+			}).insert().name
+			frappe.db.set_value('Item Price', name, 'modified', f'2024-01-{index:02d} 00:00:00', update_modified=False)
+
+		price_index = PriceIndex(price_list)
+		for valuation_date in ('2005-06-01', '2020-06-01', '2022-06-01', '2100-01-01'):
+			for customer in (customer_no, 'TC-UNBEKANNT'):
+				with self.subTest(valuation_date=valuation_date, customer=customer):
+					self.assertEqual(
+						price_index.get_price(article_no, customer, getdate(valuation_date)),
+						get_price_by_query(price_list, article_no, customer, getdate(valuation_date))
+					)
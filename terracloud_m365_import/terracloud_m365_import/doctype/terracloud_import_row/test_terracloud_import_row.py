@@ -0,0 +1,124 @@
+# Copyright (c) 2024, PC-Giga and Contributors
+# See license.txt
+
+import frappe
+import os
+import tempfile
+from datetime import date
+from frappe.tests.utils import FrappeTestCase
+from unittest.mock import Mock
+from terracloud_m365_import.data.import_file import ImportFile
+from terracloud_m365_import.data.import_row_staging import ImportRowStaging
+from terracloud_m365_import.logger import Status
+from terracloud_m365_import.terracloud_m365_import.doctype.terracloud_import.test_terracloud_import import write_csv
+
+TERRACLOUD_IMPORT = 'TC-TEST-STAGING'
+START_DATE = '01.03.2024 00:00:00'
+
+
+def get_customers(shard_count, per_shard):
+	"""Gibt je Teil 'per_shard' Kundennummern zurück, die über den Shard-Schlüssel diesem Teil zugeordnet sind."""
+	candidates = [f'TC-KUNDE-{index}' for index in range(100)]
+	return [
+		[customer_no for customer_no in candidates if ImportRowStaging.get_shard_key(customer_no) % shard_count == shard_index][:per_shard]
+		for shard_index in range(shard_count)
+	]
+
+
+class TestTerracloudImportRow(FrappeTestCase):
+	def setUp(self):
+		self.logger = Mock()
+		self.addCleanup(frappe.db.rollback)
+
+	def stage(self, files, shard_index=0, shard_count=1):
+		"""Speichert die Zeilen der CSV-Dateien ('Dateiname': Zeilen) und gibt das Staging des Teils zurück."""
+		with tempfile.TemporaryDirectory() as directory:
+			import_files = []
+			for file_name, rows in files.items():
+				file_path = os.path.join(directory, file_name)
+				write_csv(file_path, rows)
+				import_files.append(ImportFile(file_name, file_path))
+
+			ImportRowStaging(TERRACLOUD_IMPORT, self.logger).stage(import_files)
+		return ImportRowStaging(TERRACLOUD_IMPORT, self.logger, shard_index, shard_count)
+
+	def get_rows(self, fields):
+		return frappe.get_all(
+			'Terracloud Import Row',
+			filters={'terracloud_import': TERRACLOUD_IMPORT},
+			fields=fields,
+			order_by='row_no asc'
+		)
+
+	def test_stage_numbers_rows_across_files_and_keeps_invalid_rows(self):
+		self.stage({
+			'reseller_a.csv': [
+				['TC-KUNDE-1', 'TC-B1', 'TC-A1', '2', START_DATE, '1'],
+				['TC-KUNDE-1', 'TC-B2', 'TC-A1', 'zwei', START_DATE, '1']
+			],
+			'reseller_b.csv': [
+				['TC-KUNDE-2', 'TC-B3', 'TC-A1', '1.5', START_DATE, '5']
+			]
+		})
+
+		rows = self.get_rows(['row_no', 'source_file', 'state', 'order_no', 'quantity', 'start_date', 'price_type', 'error'])
+		self.assertEqual([row.row_no for row in rows], [1, 2, 3])
+		self.assertEqual([row.source_file for row in rows], ['reseller_a.csv', 'reseller_a.csv', 'reseller_b.csv'])
+		self.assertEqual([row.state for row in rows], ['Ausstehend', 'Ungültig', 'Ausstehend'])
+
+		self.assertEqual((rows[0].quantity, rows[0].start_date, rows[0].price_type), (2, date(2024, 3, 1), '1'))
+		self.assertEqual((rows[2].quantity, rows[2].price_type), (1.5, '5'))
+
+		# Die ungültige Zeile wird mit ihrer Fehlermeldung gespeichert und geloggt
+		self.assertEqual(rows[1].order_no, 'TC-B2')
+		self.assertTrue(rows[1].error)
+		self.logger.log_status.assert_called_once_with(Status.ERROR, 'TC-B2', rows[1].error)
+
+	def test_iter_orders_reads_open_rows_of_own_shard(self):
+		customers = get_customers(2, 2)
+		rows = [
+			[customer_no, f'TC-B{index}', 'TC-A1', '1', START_DATE, '1']
+			for index, customer_no in enumerate(customers[0] + customers[1] + customers[0] + customers[1], start=1)
+		]
+		rows[0][3] = 'eins'
+		self.stage({'reseller_a.csv': rows})
+
+		for shard_index in range(2):
+			staging = ImportRowStaging(TERRACLOUD_IMPORT, self.logger, shard_index, 2)
+
+			# Seiten kleiner als die Anzahl der Zeilen, ungültige Zeilen werden nicht gelesen
+			orders = list(staging.iter_orders(page_size=1))
+			expected = [row_no for row_no, row in enumerate(rows, start=1) if row[0] in customers[shard_index] and row_no != 1]
+			self.assertEqual([order.row_no for order in orders], expected)
+			self.assertEqual({order.source_file for order in orders}, {'reseller_a.csv'})
+
+			# Nach einem Checkpoint nur die folgenden Zeilen
+			self.assertEqual([order.row_no for order in staging.iter_orders(start_row=4)], [row_no for row_no in expected if row_no > 4])
+
+	def test_update_states_marks_and_links_rows_of_block(self):
+		staging = self.stage({'reseller_a.csv': [
+			['TC-KUNDE-1', f'TC-B{index}', 'TC-A1', '1', START_DATE, '1']
+			for index in range(1, 5)
+		]})
+
+		# Bestehender Plan von TC-B2, der einer Subscription zugeordnet ist
+		now = frappe.utils.now()
+		frappe.db.bulk_insert('Subscription Plan', ['name', 'creation', 'modified', 'seller_orderno'], [('TC-PLAN-B2', now, now, 'TC-B2')])
+		frappe.db.bulk_insert('Subscription Plan Detail', ['name', 'creation', 'modified', 'parent', 'parenttype', 'parentfield', 'plan'], [
+			('TC-PLAN-DETAIL-B2', now, now, 'TC-SUB-B2', 'Subscription', 'plans', 'TC-PLAN-B2')
+		])
+
+		orders = list(staging.iter_orders())
+		orders[0]._subscription = 'TC-SUB-B1'
+
+		# Block aus den ersten drei Zeilen
+		staging.update_states(0, 3, orders[:3])
+
+		rows = self.get_rows(['row_no', 'state', 'subscription_plan', 'subscription'])
+		self.assertEqual([row.state for row in rows], ['Verarbeitet', 'Übersprungen', 'Fehlerhaft', 'Ausstehend'])
+		self.assertEqual((rows[1].subscription_plan, rows[1].subscription), ('TC-PLAN-B2', 'TC-SUB-B2'))
+
+		# Abgeschlossene Zeilen werden bei erneuten Läufen nicht mehr gelesen oder geändert
+		self.assertEqual([order.row_no for order in staging.iter_orders()], [3, 4])
+		staging.update_states(0, 4, [])
+		self.assertEqual([row.state for row in self.get_rows(['state'])], ['Verarbeitet', 'Übersprungen', 'Fehlerhaft', 'Fehlerhaft'])